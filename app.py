@@ -1,285 +1,58 @@
 import streamlit as st
 import pandas as pd
 from rapidfuzz import fuzz
-from rapidfuzz import process 
-import re
-import os 
 import datetime
+import hashlib
 import io 
 import traceback
 
+from excel_export import APP_STATUS_COLORS, write_results_excel
+from matching_script import DEFAULT_PARTIAL_LIMIT, Matcher
+from name_cache import DEFAULT_NAME_CACHE, NameCache
+from results_view import DEFAULT_PAGE_SIZE, PAGE_SIZES, ResultsView
+
 # ====================================================================
-# 1. КОНСТАНТЫ И ЗАГРУЗКА РЕЕСТРА ЛС (МНН, Дозировка)
+# 1. ЗАГРУЗКА РЕЕСТРА ЛС (МНН, Дозировка)
 # ====================================================================
 
-REGISTER_COLUMNS = ['mnn', 'trade_name', 'dosage', 'form', 'manufacturer', 'purchase_price_USD', 'known_threshold_price_USD', 'client_price_USD']
+# Настройки сопоставления веб-интерфейса (пороги задаются ползунками)
+APP_MNN_SCORER = fuzz.token_sort_ratio
+APP_MATCH_NAME_COLUMN = 'mnn' # Выводим МНН из реестра
 
-# --------------------------------------------------------------------
-# 2.1 Вспомогательная функция для извлечения дозировки
-# --------------------------------------------------------------------
-def extract_dosage(name):
-    """
-    Извлекает все дозировки, включая концентрации, и стандартизирует их.
-    Использует более простую логику для надежности.
-    """
-    # 1. Шаблон для концентраций: 0,5 мг/мл, 50 мг/мл и т.п.
-    concentration_pattern = r'(\d+[,\.]?\d*)\s*(мг|ед|г|мкг|МО|МЕ|%|mg|g|mcg|IU)\s*\/\s*(мл|доза|ml|l|mcl)' 
-    
-    # 2. Шаблон для составных: 120 мг + 60 мг, или 500 мг в 100 мл
-    compound_pattern = r'(\d+[,\.]?\d*)\s*(мг|ед|мл|г|мкг|МО|МЕ|%|mg|ml|g|mcg|IU)\s*[\+\/—]\s*(\d+[,\.]?\d*)\s*(мг|ед|мл|г|мкг|МО|МЕ|%|mg|ml|g|mcg|IU)'
-    
-    # 3. Шаблон для простых: 100 мг, 10 мл
-    simple_pattern = r'(\d+[,\.]?\d*)\s*(мкг/доза|мг|ед|мл|г|мкг|МО|МЕ|%|mg|ml|g|mcg|IU)'
-    
-    all_matches = []
-    
-    # A. Поиск концентраций (приоритет)
-    for match in re.findall(concentration_pattern, name, re.IGNORECASE):
-        val1, unit1, unit2 = match
-        all_matches.append(f"{val1.replace('.', ',')} {unit1.lower()}/{unit2.lower()}")
-
-    # B. Поиск составных дозировок (приоритет)
-    for match in re.findall(compound_pattern, name, re.IGNORECASE):
-        # Составные шаблоны могут возвращать до 4 групп (2 значения и 2 единицы)
-        parts = [part for part in match if part] 
-        compound_string = ""
-        for i in range(0, len(parts), 2):
-            if i + 1 < len(parts): # Проверка, чтобы не выйти за границы
-                if compound_string:
-                    compound_string += " + "
-                compound_string += f"{parts[i].replace('.', ',')} {parts[i+1].lower()}"
-        all_matches.append(compound_string)
-
-    # C. Поиск простых дозировок (если не было найдено сложной)
-    if not all_matches:
-        for val, unit in re.findall(simple_pattern, name, re.IGNORECASE):
-            all_matches.append(f"{val.replace('.', ',')} {unit.lower()}")
-
-    # Удаление дубликатов и сортировка
-    unique_matches = sorted(list(set(all_matches)))
-            
-    return ", ".join(unique_matches) if unique_matches else 'н/д'
+# Сколько разных реестров одновременно держать в памяти сервера
+SHARED_REGISTERS_MAX = 4
 
 # --------------------------------------------------------------------
-# 2.2 Основная загрузка и очистка реестра (КЭШИРУЕМАЯ ФУНКЦИЯ)
+# 2. Основная загрузка и очистка реестра (ОБЩИЙ РЕСУРС СЕРВЕРА)
 # --------------------------------------------------------------------
-@st.cache_data(show_spinner="Загрузка и стандартизация реестра...")
-def load_and_prepare_register(uploaded_file):
-    """
-    Загружает, очищает и стандартизирует реестр ЛС. Кэшируется Streamlit.
+@st.cache_resource(show_spinner="Загрузка и стандартизация реестра...", max_entries=SHARED_REGISTERS_MAX)
+def load_and_prepare_register(register_digest, _uploaded_file):
     """
-    try:
-        # Чтение загруженного файла (Streamlit)
-        register_df = pd.read_csv(uploaded_file, sep=';', encoding='utf-8') 
-        
-        # Добавление недостающих колонок
-        for col in REGISTER_COLUMNS:
-            if col not in register_df.columns:
-                if 'price_USD' in col: 
-                    register_df[col] = 0.0
-                else:
-                    register_df[col] = 'Н/Д' 
-        
-        # АГРЕССИВНАЯ ОЧИСТКА МНН
-        register_df['mnn'] = register_df['mnn'].astype(str)
-        register_df['mnn'] = register_df['mnn'].str.replace(r'[\r\n\t\ufeff\xa0]', ' ', regex=True).str.lower()
-        register_df['mnn'] = register_df['mnn'].str.replace(r'[^\w\s]', ' ', regex=True) 
-        register_df['mnn'] = register_df['mnn'].str.replace(r'\s+', ' ', regex=True).str.strip()
-
-
-        # Стандартизация дозировки
-        register_df['dosage_standardized'] = register_df['dosage'].astype(str).apply(extract_dosage).str.strip()
-
-        mnn_list = register_df['mnn'].unique().tolist()
-        
-        return register_df, mnn_list
-        
-    except Exception as e:
-        st.error(f"❌ Критическая ошибка при загрузке или обработке реестра: {e}")
-        st.code(traceback.format_exc())
-        return pd.DataFrame({col: [] for col in REGISTER_COLUMNS + ['dosage_standardized']}), []
-
-# ---
-# ====================================================================
-# 3. ФУНКЦИИ ПАРСИНГА И СОПОСТАВЛЕНИЯ ЗАЯВКИ
-# ====================================================================
+    Загружает, очищает и стандартизирует реестр ЛС и строит индекс МНН.
 
-def find_best_mnn(name_clean, mnn_list, mnn_threshold):
+    Результат (Matcher с реестром и индексами) хранится один раз на процесс сервера
+    и разделяется всеми сессиями без копирования: ключ - хэш содержимого файла
+    (register_digest), сам файл в ключ не входит. Matcher используется только для чтения,
+    настройки сессии применяются через with_settings (копия без копирования реестра).
+    Ошибки не кэшируются: исключение передается вызывающему коду.
     """
-    Находит лучшее совпадение МНН с использованием RapidFuzz.
-    Принимает настраиваемый порог чувствительности.
-    
-    Используется fuzz.token_sort_ratio для более строгого сопоставления
-    по лексемам (словам) без учета порядка, что лучше для МНН.
-    """
-    if not name_clean or not mnn_list:
-        return 'неизвестно', 0.0
-
-    best_match = process.extractOne(
-        query=name_clean, 
-        choices=mnn_list, 
-        scorer=fuzz.token_sort_ratio, 
-        score_cutoff=mnn_threshold 
-    )
+    # Чтение загруженного файла (Streamlit)
+    register_df = pd.read_csv(io.BytesIO(_uploaded_file.getvalue()), sep=';', encoding='utf-8') 
     
-    if best_match:
-        return best_match[0], best_match[1]
-    return 'неизвестно', 0.0
+    # Подготовка реестра и индекс МНН / (МНН, Дозировка) - один раз на процесс сервера;
+    # разбор наименований закупки сохраняется в кэш между запусками и сессиями
+    return Matcher(register_df, mnn_scorer=APP_MNN_SCORER, match_name_column=APP_MATCH_NAME_COLUMN,
+                   name_cache=NameCache(DEFAULT_NAME_CACHE)).load()
 
 
-def prepare_purchase_data(purchase_df, mnn_list, mnn_threshold, noise_words):
-    """
-    Очистка и стандартизация входных данных закупки, а также парсинг МНН.
-    Принимает настраиваемый порог чувствительности МНН и список шумящих слов.
-    """
-    
-    # 1. Очистка торгового наименования
-    purchase_df['trade_name_clean'] = purchase_df['item_name_raw'].astype(str).str.replace(r'[\r\n\t\ufeff\xa0]', ' ', regex=True).str.lower()
-    
-    # А. УДАЛЕНИЕ ШУМЯЩИХ СЛОВ (custom removal)
-    for word in noise_words:
-        # Удаляем слово/фразу и заменяем на пробел, чтобы не склеить соседние слова
-        purchase_df['trade_name_clean'] = purchase_df['trade_name_clean'].str.replace(word, ' ', regex=False)
-    
-    # Б. Стандартная очистка символов и пробелов
-    purchase_df['trade_name_clean'] = purchase_df['trade_name_clean'].str.replace(r'[^\w\s]', ' ', regex=True)
-    purchase_df['trade_name_clean'] = purchase_df['trade_name_clean'].str.replace(r'\s+', ' ', regex=True).str.strip().replace('', 'н/д')
-    
-    
-    # 2. Парсинг Дозировки
-    purchase_df['dosage_standardized'] = purchase_df['trade_name_clean'].apply(extract_dosage).str.strip() 
-    
-    # 3. Создание mnn_search_clean (удаление дозировки из названия для парсинга МНН)
-    dosage_pattern = r'(\d+[,\.]?\d*)\s*(мкг/доза|мг|ед|мл|г|мкг|МО|МЕ|%|mg|ml|g|mcg|IU)\s*[\+\/—]?\s*(\d+[,\.]?\d*)*\s*(мг|ед|мл|г|мкг|МО|МЕ|%|mg|ml|g|mcg|IU)*'
-    mnn_search_clean = purchase_df['trade_name_clean'].str.replace(dosage_pattern, ' ', flags=re.IGNORECASE, regex=True).str.replace(r'\s+', ' ', regex=True).str.strip()
-    
-    
-    # 4. Парсинг МНН (используем mnn_list из загруженного реестра)
-    # ПЕРЕДАЧА ПОРОГА МНН
-    mnn_results = mnn_search_clean.apply(lambda x: find_best_mnn(x, mnn_list, mnn_threshold)).apply(pd.Series)
-
-    purchase_df['mnn_standardized'] = mnn_results[0].astype(str).str.strip().replace('', 'н/д')
-    purchase_df['mnn_match_score'] = mnn_results[1] 
-    
-    purchase_df['dosage_standardized'].replace('', 'н/д', inplace=True) 
-    # Колонка 'trade_name_clean' больше не нужна
-    purchase_df.drop(columns=['trade_name_clean'], errors='ignore', inplace=True) 
-    
-    return purchase_df
-
-def check_purchase_item_not_found(purchase_row):
-    """Создает стандартную строку 'Не найдено'."""
-    default_manufacturer = "Н/Д"
-    default_price = 0.0
-    return [{
-        "Status": "Не найдено", 
-        "Reg_Match_Name": "Нет соответствий", 
-        "Reg_Dosage_Original": "Н/Д", 
-        "Manufacturer": default_manufacturer, 
-        "Purchase_Price_USD": default_price, 
-        "Known_Threshold_Price_USD": default_price, 
-        "Client_Price_USD": default_price, 
-        "Match_Score": 0.0
-    }]
-
-
-def check_purchase_item(purchase_row, register_df, dosage_threshold):
-    """
-    Проверяет одну позицию закупки и возвращает СПИСОК ВСЕХ НАЙДЕННЫХ СОВПАДЕНИЙ.
-    Принимает настраиваемый порог чувствительности дозировки.
-    """
-
-    mnn_std = purchase_row['mnn_standardized']
-    dosage_std = purchase_row['dosage_standardized'] 
-    
-    # 1. Уровень 1: Точное Совпадение (МНН + СТАНДАРТИЗИРОВАННАЯ Дозировка)
-    exact_match_results = register_df[
-        (register_df['mnn'] == mnn_std) & 
-        (register_df['dosage_standardized'] == dosage_std) 
-    ]
-    
-    if not exact_match_results.empty:
-        # Для точного совпадения берем только первую запись
-        first_match = exact_match_results.iloc[0]
-        return [{
-            "Status": "Полное соответствие", 
-            "Reg_Match_Name": first_match['mnn'], # <-- ИСПРАВЛЕНО: Выводим МНН из реестра
-            "Reg_Dosage_Original": first_match['dosage'], 
-            "Manufacturer": first_match['manufacturer'], 
-            "Purchase_Price_USD": first_match['purchase_price_USD'], 
-            "Known_Threshold_Price_USD": first_match['known_threshold_price_USD'], 
-            "Client_Price_USD": first_match['client_price_USD'], 
-            "Match_Score": 100.0
-        }]
-
-    # *** ИСПРАВЛЕНИЕ ЛОГИКИ: Если МНН не найден, сразу "Не найдено" ***
-    if mnn_std == 'неизвестно':
-        return check_purchase_item_not_found(purchase_row)
-        
-    filtered_df = register_df[register_df['mnn'] == mnn_std].copy() # Используем .copy() для безопасности
-
-    # 2. Уровень 2: Нечеткий Поиск (Fuzzy Match) - ТОЛЬКО ПО ДОЗИРОВКЕ
-    
-    best_match_score = 0
-    best_match_dosage = None
-    
-    # Ищем лучшую дозировку среди всех записей с найденным МНН
-    if dosage_std != 'н/д':
-        for index, row in filtered_df.iterrows():
-            reg_dosage_std = row['dosage_standardized'] 
-            if reg_dosage_std == 'н/д': continue
-            
-            # Используем token_set_ratio для гибкого сравнения дозировок
-            score = fuzz.token_set_ratio(dosage_std, reg_dosage_std) 
-            if score > best_match_score:
-                best_match_score = score
-                best_match_dosage = reg_dosage_std 
-            
-    # ИСПОЛЬЗОВАНИЕ ПЕРЕДАННОГО ПОРОГА ЧУВСТВИТЕЛЬНОСТИ ДОЗИРОВКИ
-    if best_match_score >= dosage_threshold and best_match_dosage is not None:
-        # Находим ВСЕ совпадения дозировки с лучшим результатом
-        all_dosage_matches = filtered_df[filtered_df['dosage_standardized'] == best_match_dosage]
-        
-        results = []
-        for index, row in all_dosage_matches.iterrows():
-            results.append({
-                "Status": "Потенциальное соответствие", 
-                "Reg_Match_Name": row['mnn'], # <-- Выводим МНН из реестра
-                "Reg_Dosage_Original": row['dosage'], 
-                "Manufacturer": row['manufacturer'], 
-                "Purchase_Price_USD": row['purchase_price_USD'], 
-                "Known_Threshold_Price_USD": row['known_threshold_price_USD'], 
-                "Client_Price_USD": row['client_price_USD'], 
-                "Match_Score": best_match_score # Fuzzy Score Дозировки
-            })
-        return results
-    
-    
-    # 3. Уровень 3: Частичное соответствие по МНН (дозировка не совпала или отсутствует)
-    if mnn_std != 'неизвестно':
-        # Возвращаем ВСЕ записи с найденным МНН
-        results = []
-        for index, row in filtered_df.iterrows():
-            results.append({
-                "Status": "Частичное соответствие МНН", 
-                "Reg_Match_Name": row['mnn'], # <-- Выводим МНН из реестра
-                "Reg_Dosage_Original": row['dosage'], 
-                "Manufacturer": row['manufacturer'], 
-                "Purchase_Price_USD": row['purchase_price_USD'], 
-                "Known_Threshold_Price_USD": row['known_threshold_price_USD'], 
-                "Client_Price_USD": row['client_price_USD'], 
-                "Match_Score": purchase_row['mnn_match_score'] # Fuzzy Score МНН
-            })
-        return results
-            
-    
-    # 4. Уровень 4: Не найдено 
-    return check_purchase_item_not_found(purchase_row)
+def file_digest(uploaded_file):
+    """SHA-256 содержимого загруженного файла (ключ сохраненного анализа)."""
+    return hashlib.sha256(uploaded_file.getvalue()).hexdigest()
 
 
 # ---
 # ====================================================================
-# 4. ФУНКЦИЯ ДЛЯ СТИЛИЗАЦИИ РЕЗУЛЬТАТОВ (Для экспорта в Excel)
+# 4. СТИЛИЗАЦИЯ РЕЗУЛЬТАТОВ (просмотр) И ЭКСПОРТ В EXCEL
 # ====================================================================
 
 def highlight_matches_row(row):
@@ -306,20 +79,12 @@ def highlight_matches_row(row):
 
 @st.cache_data(show_spinner="Формирование Excel-файла со стилями...")
 def convert_df_to_excel(df_to_style):
-    """Создает Excel-файл в памяти с примененной стилизацией."""
+    """Создает Excel-файл в памяти с цветом строк по статусу (зеленый/синий)."""
     output = io.BytesIO()
     
-    # Создаем ExcelWriter для применения стилей
-    writer = pd.ExcelWriter(output, engine='openpyxl')
-    
-    # Применяем стилизацию через pandas Styler
-    styled_df = df_to_style.style.apply(highlight_matches_row, axis=1) 
+    # Потоковая запись (openpyxl write-only), цвет строк - условным форматированием по статусу
+    write_results_excel(df_to_style, output, APP_STATUS_COLORS, sheet_name='Matching_Results')
     
-    # Сохраняем стилизованный DataFrame
-    styled_df.to_excel(writer, index=False, sheet_name='Matching_Results')
-    
-    # Закрываем writer и получаем байты
-    writer.close()
     processed_data = output.getvalue()
     return processed_data
 
@@ -359,9 +124,24 @@ def main():
         min_value=50,
         max_value=100,
         value=75, # Значение по умолчанию
-        step=5
+        step=5,
+        help="Уровень 2 (Потенциальное соответствие): дозировка реестра с той же единицей "
+             "сравнивается численно - 100 × меньшая / большая (0,5 г = 500 мг -> 100; 250 мг к 500 мг -> 50). "
+             "Token Set Ratio по тексту - только для составных и нераспознанных дозировок "
+             "и если у МНН в реестре нет дозировок той же единицы."
+    )
+    st.sidebar.caption(f"Текущий порог для Дозировки: {dosage_threshold} "
+                       f"(числовое сравнение в единой единице, для составных - Token Set Ratio)")
+
+    # Ограничение строк "Частичное соответствие МНН" на позицию закупки
+    partial_limit = st.sidebar.number_input(
+        'Строк частичного соответствия МНН на позицию (0 - все):',
+        min_value=0,
+        value=DEFAULT_PARTIAL_LIMIT,
+        step=1,
+        help="Остаются ближайшие по дозировке, затем более дешевые строки реестра; "
+             "число остальных - в колонке 'Omitted_Candidates'."
     )
-    st.sidebar.caption(f"Текущий порог для Дозировки: {dosage_threshold} (используется Token Set Ratio)")
     st.sidebar.markdown("---")
     
     # --- НАСТРОЙКА ОЧИСТКИ ТЕКСТА ---
@@ -391,16 +171,21 @@ def main():
         )
 
     # --- ИНИЦИАЛИЗАЦИЯ ДАННЫХ ---
-    register_df = pd.DataFrame()
-    mnn_list = []
+    matcher = None
+    register_digest = None
     
     if uploaded_register_file is not None:
-        # Загрузка и подготовка реестра (кэшируется)
-        register_df, mnn_list = load_and_prepare_register(uploaded_register_file)
+        register_digest = file_digest(uploaded_register_file)
+        # Загрузка и подготовка реестра (общий ресурс, по хэшу содержимого файла)
+        try:
+            matcher = load_and_prepare_register(register_digest, uploaded_register_file)
+        except Exception as e:
+            st.error(f"❌ Критическая ошибка при загрузке или обработке реестра: {e}")
+            st.code(traceback.format_exc())
         
-        if not register_df.empty:
-            st.sidebar.success(f"Реестр загружен. Уникальных МНН: {len(mnn_list)}")
-            st.sidebar.dataframe(register_df.head(3), use_container_width=True)
+        if matcher is not None and not matcher.register_df.empty:
+            st.sidebar.success(f"Реестр загружен. Уникальных МНН: {len(matcher.mnn_list)}")
+            st.sidebar.dataframe(matcher.register_df.head(3), use_container_width=True)
             
         else:
             st.warning("Загруженный реестр пуст или содержит ошибку.")
@@ -416,7 +201,7 @@ def main():
         )
         
     # Кнопка запуска анализа размещена ниже колонок загрузки
-    analysis_ready = uploaded_purchase_file is not None and not register_df.empty
+    analysis_ready = uploaded_purchase_file is not None and matcher is not None
     
     # Флаг для запуска анализа
     run_analysis = False
@@ -430,10 +215,11 @@ def main():
         st.info("Пожалуйста, загрузите оба файла (register_ls.csv и purchase_input.csv), чтобы активировать кнопку запуска.")
         return # Выход, если файлы не готовы
         
-
-    if run_analysis: # Анализ запускается только по флагу run_analysis, который устанавливается кнопкой
-        st.header("3. Результаты Анализа")
-        
+    # Score без порогов зависит только от файлов и шумящих слов; пороги применяются при каждом
+    # перезапуске страницы, поэтому после анализа ползунки пересчитывают результат сразу
+    analysis_key = (register_digest, file_digest(uploaded_purchase_file), tuple(noise_words))
+    
+    if run_analysis and st.session_state.get('scored_key') != analysis_key:
         try:
             # Чтение файла закупки
             purchase_df = pd.read_csv(uploaded_purchase_file, sep=';', encoding='utf-8')
@@ -447,35 +233,97 @@ def main():
                 st.error("Ошибка: Файл закупки должен содержать колонку 'item_name_raw'.")
                 return
 
-            with st.spinner('⚙️ Выполняется предобработка, парсинг и многоуровневое сопоставление...'):
-                # 1. Подготовка данных закупки (включая парсинг МНН, передачу порога МНН и список шумящих слов)
-                purchase_df = prepare_purchase_data(purchase_df, mnn_list, mnn_threshold, noise_words)
-                
-                # 2. Запуск сопоставления (передача порога дозировки)
-                purchase_df['Matches'] = purchase_df.apply(
-                    lambda row: check_purchase_item(row, register_df, dosage_threshold), 
-                    axis=1
-                )
-
-                # 3. Денормализация (размножение строк для всех совпадений)
-                all_results_df = purchase_df.explode('Matches').reset_index(drop=True)
-                match_details = all_results_df['Matches'].apply(pd.Series)
-                final_df = pd.concat([all_results_df.drop(columns=['Matches']), match_details], axis=1)
+            with st.spinner('⚙️ Выполняется предобработка и парсинг МНН и дозировки...'):
+                # Очистка (со списком шумящих слов), дозировка и лучший МНН без порога
+                scored = matcher.with_settings(noise_words=noise_words).score_purchase(purchase_df)
+            
+            st.session_state['scored_key'] = analysis_key
+            st.session_state['scored_purchase'] = scored
                 
-                # Удаляем промежуточные колонки
-                final_df = final_df.drop(columns=['mnn_standardized', 'dosage_standardized', 'mnn_match_score'], errors='ignore')
-
-            st.success("✅ Сопоставление завершено! Найдено совпадений: " + str(len(final_df)))
+        except Exception as e:
+            st.error(f"Произошла ошибка при обработке файла закупки. Убедитесь, что разделитель — ';': {e}")
+            st.code(traceback.format_exc())
+            return
 
-            # --- ВЫВОД РЕЗУЛЬТАТА ---
-            display_cols = ['item_name_raw', 'quantity', 'Status', 'Reg_Match_Name', 'Reg_Dosage_Original', 'Manufacturer', 
-                            'Purchase_Price_USD', 'Known_Threshold_Price_USD', 'Client_Price_USD', 'Match_Score']
-            
-            st.subheader("Предварительный просмотр результата:")
-            # Здесь Streamlit отобразит таблицу со стилями, примененными через .style
-            st.dataframe(final_df[display_cols].style.apply(highlight_matches_row, axis=1), use_container_width=True)
+    if st.session_state.get('scored_key') != analysis_key:
+        if 'scored_key' in st.session_state:
+            st.info("Файлы или список слов для удаления изменились. Нажмите кнопку запуска, чтобы обновить результаты.")
+        return
 
-            # --- КНОПКА ЭКСПОРТА ---
+    # --- 3. РЕЗУЛЬТАТ: из сохраненных score (пересчитываются только пороги и уровни соответствия) ---
+    st.header("3. Результаты Анализа")
+    
+    try:
+        # Результат сохраняется в сессии: листание страниц и фильтры не повторяют сопоставление
+        result_key = (analysis_key, mnn_threshold, dosage_threshold, int(partial_limit))
+        if st.session_state.get('result_key') != result_key:
+            with st.spinner('⚙️ Выполняется многоуровневое сопоставление...'):
+                # Пороги из бокового меню (реестр, индекс и score переиспользуются)
+                run_matcher = matcher.with_settings(
+                    mnn_threshold=mnn_threshold, dosage_threshold=dosage_threshold, noise_words=noise_words,
+                    partial_limit=int(partial_limit)
+                )
+                
+                # Порог МНН, сопоставление (один раз на уникальную позицию) и денормализация
+                # (размножение строк для всех совпадений)
+                final_df = run_matcher.match_scored(st.session_state['scored_purchase'])
+            st.session_state['result_key'] = result_key
+            st.session_state['results_view'] = ResultsView(final_df)
+        view = st.session_state['results_view']
+        final_df = view.final_df
+
+        st.success("✅ Сопоставление завершено! Найдено совпадений: " + str(len(final_df)))
+        stats = final_df.attrs['dedup_stats']
+        st.caption(f"♻️ Дедупликация: {stats['total_rows']} строк -> {stats['unique_rows']} уникальных наименований "
+                   f"(повторы: {stats['dedup_ratio']:.0%})")
+        stages = final_df.attrs['mnn_stage_stats']
+        st.caption(f"🎯 Поиск МНН: точное вхождение {stages['exact']} строк, нечеткий поиск {stages['fuzzy']}, "
+                   f"не найдено {stages['not_found']}")
+        if 'name_cache_stats' in final_df.attrs:
+            cache = final_df.attrs['name_cache_stats']
+            st.caption(f"🗃️ Кэш наименований: найдено {cache['hits']} из {cache['lookups']} "
+                       f"(попадания: {cache['hit_rate']:.0%})")
+
+        # --- ФИЛЬТРЫ И СВОДКА ---
+        filter_col1, filter_col2 = st.columns(2)
+        with filter_col1:
+            statuses = st.multiselect('Статус:', options=list(view.statuses), key='results_statuses')
+        with filter_col2:
+            names = st.multiselect('МНН реестра:', options=list(view.names), key='results_names')
+        positions = view.positions(statuses, names)
+
+        summary_col1, summary_col2 = st.columns([1, 2])
+        with summary_col1:
+            st.dataframe(view.status_summary(positions), use_container_width=True)
+        with summary_col2:
+            with st.expander(f"Сводка по МНН ({len(positions)} строк результата)"):
+                st.dataframe(view.name_summary(positions), use_container_width=True)
+
+        # --- ВЫВОД РЕЗУЛЬТАТА ПО СТРАНИЦАМ ---
+        display_cols = ['item_name_raw', 'quantity', 'Status', 'Reg_Match_Name', 'Reg_Dosage_Original', 'Manufacturer', 
+                        'Purchase_Price_USD', 'Known_Threshold_Price_USD', 'Client_Price_USD', 'Match_Score',
+                        'Omitted_Candidates']
+        
+        st.subheader("Просмотр результата:")
+        page_col1, page_col2 = st.columns([1, 3])
+        with page_col1:
+            page_size = st.selectbox('Строк на странице:', PAGE_SIZES, index=PAGE_SIZES.index(DEFAULT_PAGE_SIZE),
+                                     key='results_page_size')
+        page_count = view.page_count(positions, page_size)
+        # Смена фильтров или размера страницы может сократить число страниц
+        if st.session_state.get('results_page', 1) > page_count:
+            st.session_state['results_page'] = 1
+        with page_col2:
+            page = st.number_input(f'Страница (из {page_count}):', min_value=1, max_value=page_count,
+                                   step=1, key='results_page')
+
+        # Стили применяются только к строкам текущей страницы
+        page_df = view.page(positions, int(page), page_size, display_cols)
+        st.dataframe(page_df.style.apply(highlight_matches_row, axis=1), use_container_width=True)
+
+        # --- КНОПКА ЭКСПОРТА ---
+        # Excel формируется по запросу: без него смена порогов не ждет записи файла
+        if st.toggle("📄 Подготовить файл Excel для скачивания"):
             excel_data = convert_df_to_excel(final_df)
             
             st.download_button(
@@ -485,9 +333,9 @@ def main():
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
             )
 
-        except Exception as e:
-            st.error(f"Произошла ошибка при обработке файла закупки. Убедитесь, что разделитель — ';': {e}")
-            st.code(traceback.format_exc())
+    except Exception as e:
+        st.error(f"Произошла ошибка при обработке файла закупки. Убедитесь, что разделитель — ';': {e}")
+        st.code(traceback.format_exc())
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,208 @@
+import datetime
+import glob
+import hashlib
+import json
+import os
+from concurrent.futures import as_completed
+
+from excel_export import CLI_STATUS_COLORS, write_results_excel
+from parallel_matching import matcher_pool, worker_matcher
+from purchase_ingest import RAW_EXTENSIONS, read_raw_purchase
+from register_cache import REGISTER_PIPELINE_VERSION, file_hash
+from stream_matching import result_writer
+
+# ====================================================================
+# ПАКЕТНЫЙ РЕЖИМ: ВСЕ ЗАЯВКИ ПАПКИ ПРОТИВ ОДНОГО ЗАГРУЖЕННОГО РЕЕСТРА
+# ====================================================================
+
+DEFAULT_BATCH_SOURCE = 'new_purchases'
+BATCH_OUTPUT_FORMATS = ('.xlsx', '.csv', '.parquet')
+
+# Журнал обработанных заявок в папке результатов: хэш содержимого -> результат
+MANIFEST_FILENAME = 'batch_manifest.json'
+
+# Статус файла в сводке пакета
+FILE_MATCHED = 'matched'
+FILE_SKIPPED = 'skipped'   # результат для этого содержимого и настроек уже есть
+FILE_FAILED = 'failed'
+
+def find_purchase_files(source):
+    """
+    Файлы заявок: все файлы RAW_EXTENSIONS в папке source (без вложенных) или по шаблону glob.
+    Временные файлы Excel ('~$...') пропускаются.
+    """
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source)]
+    else:
+        paths = glob.glob(source)
+    return sorted(
+        path for path in paths
+        if os.path.isfile(path) and os.path.splitext(path)[1].lower() in RAW_EXTENSIONS
+        and not os.path.basename(path).startswith('~$')
+    )
+
+
+def batch_context(matcher, register_hash, output_format='.xlsx'):
+    """
+    Ключ настроек пакета: результат заявки зависит от содержимого реестра, версии конвейера
+    подготовки, настроек сопоставления и формата результата. При их изменении все заявки
+    обрабатываются заново.
+    """
+    scorer = matcher.mnn_scorer
+    parts = [
+        f'register={register_hash}',
+        f'pipeline={REGISTER_PIPELINE_VERSION}',
+        f"scorer={getattr(scorer, '__module__', '')}.{getattr(scorer, '__name__', repr(scorer))}",
+        f'mnn_threshold={matcher.mnn_threshold}',
+        f'dosage_threshold={matcher.dosage_threshold}',
+        f'noise_words={sorted(matcher.noise_words)}',
+        f'match_name_column={matcher.match_name_column}',
+        f'exact_mnn={matcher.exact_mnn}',
+        f'mnn_blocking={matcher.mnn_blocking}',
+        f'partial_limit={matcher.partial_limit or None}',
+        f'format={output_format}',
+    ]
+    return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+def result_path(input_path, content_hash, output_dir, output_format='.xlsx'):
+    """Файл результата заявки: matching_results_<имя заявки>_<начало хэша содержимого><формат>."""
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(output_dir, f'matching_results_{stem}_{content_hash[:8]}{output_format}')
+
+
+class BatchManifest:
+    """
+    Журнал пакетного режима (JSON в папке результатов): для каждого хэша содержимого
+    заявки - ключ настроек (batch_context), файл результата и время обработки.
+    Сохраняется после каждой заявки через временный файл и os.replace.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def up_to_date(self, content_hash, context):
+        """Запись журнала, если для содержимого есть результат с теми же настройками и файл на месте."""
+        entry = self.entries.get(content_hash)
+        if entry and entry['context'] == context and os.path.exists(entry['output']):
+            return entry
+        return None
+
+    def record(self, content_hash, context, input_path, output_path, summary):
+        self.entries[content_hash] = {
+            'context': context,
+            'input': input_path,
+            'output': output_path,
+            'finished_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            **summary,
+        }
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+def _write_result(final_df, output_path):
+    """Пишет результат через временный файл: незавершенный результат не выглядит готовым."""
+    root, extension = os.path.splitext(output_path)
+    tmp_path = f'{root}.part{extension}'
+    if extension == '.xlsx':
+        write_results_excel(final_df, tmp_path, CLI_STATUS_COLORS)
+    else:
+        writer = result_writer(tmp_path)
+        try:
+            writer.write(final_df)
+        finally:
+            writer.close()
+    os.replace(tmp_path, output_path)
+
+
+def _match_file(input_path, output_path, matcher=None):
+    """
+    Сопоставляет одну заявку и пишет результат. Возвращает сводку по файлу.
+    matcher=None - в процессе пула (parallel_matching.worker_matcher()).
+    """
+    purchase_df = read_raw_purchase(input_path)
+    final_df = (matcher or worker_matcher()).match(purchase_df)
+    _write_result(final_df, output_path)
+    return {
+        'purchase_rows': len(purchase_df),
+        'result_rows': len(final_df),
+        'statuses': {status: int(count) for status, count in final_df['Status'].value_counts().items()},
+    }
+
+
+def match_files(matcher, paths, output_dir, register_hash, workers=1, output_format='.xlsx', force=False,
+                on_file=None):
+    """
+    Сопоставляет заявки paths с реестром matcher: по файлу результата на заявку в output_dir.
+
+    Реестр загружается один раз; заявки обрабатываются параллельно пулом из workers
+    процессов (при fork реестр не сериализуется). Заявка пропускается, если в журнале
+    (MANIFEST_FILENAME) уже есть результат для ее содержимого с теми же реестром и настройками
+    (force=True - обработать все заново). Ошибка в одной заявке не останавливает остальные.
+
+    on_file(сводка по файлу) вызывается по мере готовности. Возвращает список сводок:
+    'input', 'status' (FILE_MATCHED / FILE_SKIPPED / FILE_FAILED), 'output' и счетчики или 'error'
+    ('duplicate_of' - для пропущенного повтора содержимого другой заявки пакета).
+    """
+    if output_format not in BATCH_OUTPUT_FORMATS:
+        raise ValueError(f"Неподдерживаемый формат результата: '{output_format}' "
+                         f"(доступны: {', '.join(BATCH_OUTPUT_FORMATS)})")
+    os.makedirs(output_dir, exist_ok=True)
+    matcher = matcher.load()
+    manifest = BatchManifest(os.path.join(output_dir, MANIFEST_FILENAME))
+    context = batch_context(matcher, register_hash, output_format)
+
+    summaries = []
+
+    def report(summary):
+        summaries.append(summary)
+        if on_file is not None:
+            on_file(summary)
+
+    # 1. Пропуск заявок с готовым результатом (и повторов одного содержимого в пакете)
+    pending = {}
+    for path in paths:
+        content_hash = file_hash(path)
+        entry = None if force else manifest.up_to_date(content_hash, context)
+        if entry is not None:
+            report({'input': path, 'status': FILE_SKIPPED, 'output': entry['output']})
+        elif content_hash in pending:
+            report({'input': path, 'status': FILE_SKIPPED, 'output': pending[content_hash][1],
+                    'duplicate_of': pending[content_hash][0]})
+        else:
+            pending[content_hash] = (path, result_path(path, content_hash, output_dir, output_format))
+
+    if not pending:
+        return summaries
+
+    def finish(content_hash, future_result):
+        path, output_path = pending[content_hash]
+        try:
+            summary = future_result()
+        except Exception as e:
+            report({'input': path, 'status': FILE_FAILED, 'error': f'{type(e).__name__}: {e}'})
+            return
+        manifest.record(content_hash, context, path, output_path, summary)
+        report({'input': path, 'status': FILE_MATCHED, 'output': output_path, **summary})
+
+    # 2. Сопоставление: одна заявка - в текущем процессе, несколько - пулом процессов
+    workers = max(1, min(workers, len(pending)))
+    if workers == 1:
+        for content_hash, (path, output_path) in pending.items():
+            finish(content_hash, lambda: _match_file(path, output_path, matcher))
+        return summaries
+
+    # По файлу на процесс: cdist внутри процесса однопоточный (parallel_matching.matcher_pool)
+    with matcher_pool(matcher, workers) as pool:
+        futures = {pool.submit(_match_file, path, output_path): content_hash
+                   for content_hash, (path, output_path) in pending.items()}
+        for future in as_completed(futures):
+            finish(futures[future], future.result)
+    return summaries
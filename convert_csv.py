@@ -1,20 +1,14 @@
 import pandas as pd
 import os
 
+# Синонимы заголовков колонок - общие с matching_script.py --input
+from purchase_ingest import RENAME_MAP
+
 # --- НАСТРОЙКИ ФАЙЛОВ ---
 # Теперь путь включает подпапку 'new_purchases'
 INPUT_FILENAME = 'new_purchases/new_purchase.xlsx'    
 OUTPUT_FILENAME = 'purchase_input.csv'     
 
-# --- НАСТРОЙКИ ПЕРЕИМЕНОВАНИЯ КОЛОНОК ---
-# Список синонимов для поиска в заголовках
-RENAME_MAP = {
-    # Первая колонка
-    'item_name_raw': ['Названия', 'Наименование', 'Название', 'Товар'],
-    # Колонка количества
-    'quantity': ['Количество', 'Кол-во', 'Колво', 'Объем']
-}
-
 # --- ГЛАВНАЯ ЛОГИКА КОНВЕРТАЦИИ ---
 
 try:
@@ -62,6 +56,7 @@ try:
     
     print(f"✅ Файл успешно сконвертирован и сохранен как: {output_path}")
     print("Теперь вы можете запускать основной скрипт 'matching_script.py'!")
+    print(f"(или сразу, без CSV: python matching_script.py --input {INPUT_FILENAME})")
 
 except FileNotFoundError:
     print(f"❌ Ошибка: Файл '{input_path}' не найден.")
@@ -0,0 +1,43 @@
+import pandas as pd
+
+# ====================================================================
+# ДЕДУПЛИКАЦИЯ ПОЗИЦИЙ ЗАКУПКИ
+# ====================================================================
+
+MATCH_KEYS = ['mnn_standardized', 'dosage_standardized', 'mnn_match_score']
+
+
+def dedup_stats(total_rows, unique_rows):
+    """Статистика дедупликации: сколько строк, сколько уникальных и доля повторов."""
+    return {
+        'total_rows': total_rows,
+        'unique_rows': unique_rows,
+        'dedup_ratio': 1 - unique_rows / total_rows if total_rows else 0.0,
+    }
+
+
+def unique_match_keys(purchase_df):
+    """
+    Уникальные комбинации (МНН, дозировка, score МНН) закупки.
+
+    Возвращает (key_codes, unique_rows): номер уникальной позиции для каждой строки
+    закупки и DataFrame уникальных позиций с колонками MATCH_KEYS.
+    """
+    key_codes, unique_keys = pd.factorize(
+        pd.Series(list(zip(*(purchase_df[col] for col in MATCH_KEYS))), dtype=object)
+    )
+    return key_codes, pd.DataFrame(list(unique_keys), columns=MATCH_KEYS)
+
+
+def match_unique_items(purchase_df, match_item):
+    """
+    Запускает сопоставление (match_item) один раз для каждой уникальной комбинации
+    (МНН, дозировка, score МНН).
+
+    Возвращает (key_codes, unique_matches): номер уникальной позиции для каждой строки
+    закупки и список результатов match_item по уникальным позициям.
+    """
+    key_codes, unique_rows = unique_match_keys(purchase_df)
+    unique_matches = [match_item(row) for row in unique_rows.to_dict('records')]
+
+    return key_codes, unique_matches
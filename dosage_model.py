@@ -0,0 +1,128 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# ====================================================================
+# ЧИСЛОВАЯ МОДЕЛЬ ДОЗИРОВКИ (значение, единица, "на единицу", компоненты)
+# ====================================================================
+
+NO_DOSAGE = 'н/д'
+
+# Числовые колонки дозировки, которые добавляются к реестру
+DOSAGE_COLUMNS = ['dosage_key', 'dosage_value', 'dosage_unit', 'dosage_per_unit', 'dosage_components']
+
+# Каноническая единица и множитель перевода в нее
+UNIT_CANONICAL = {
+    'мг': ('mg', 1.0), 'mg': ('mg', 1.0),
+    'г': ('mg', 1000.0), 'g': ('mg', 1000.0),
+    'мкг': ('mg', 0.001), 'mcg': ('mg', 0.001),
+    'ед': ('IU', 1.0), 'ме': ('IU', 1.0), 'мо': ('IU', 1.0), 'iu': ('IU', 1.0),
+    'мл': ('ml', 1.0), 'ml': ('ml', 1.0), 'l': ('ml', 1000.0), 'mcl': ('ml', 0.001),
+    '%': ('%', 1.0),
+}
+
+# Знаменатель концентрации ("мг/мл", "мкг/доза"): каноническая единица и множитель
+PER_UNIT_CANONICAL = {
+    'мл': ('ml', 1.0), 'ml': ('ml', 1.0), 'l': ('ml', 1000.0), 'mcl': ('ml', 0.001),
+    'доза': ('dose', 1.0),
+}
+
+# Один компонент стандартизированной дозировки: "0,5 мг/мл", "500 мг", "5 мкг/доза"
+_COMPONENT_PATTERN = re.compile(r'^(\d+[,\.]?\d*) ([^\s/]+)(?:/(\S+))?$')
+
+# Компонент: value в канонической единице unit на каноническую единицу per_unit ('' - без знаменателя)
+DosageComponent = namedtuple('DosageComponent', ['value', 'unit', 'per_unit'])
+
+# key - хэшируемый канонический ключ всей дозировки, single - единственный компонент (или None)
+ParsedDosage = namedtuple('ParsedDosage', ['key', 'components', 'single'])
+
+_NOT_PARSED = ParsedDosage(NO_DOSAGE, (), None)
+
+
+def _parse_component(text):
+    """Разбирает один компонент дозировки и переводит его в канонические единицы."""
+    match = _COMPONENT_PATTERN.match(text.strip())
+    if not match:
+        return None
+    value, unit, per_unit = match.groups()
+    unit = UNIT_CANONICAL.get(unit.lower())
+    per_unit = PER_UNIT_CANONICAL.get(per_unit.lower()) if per_unit else ('', 1.0)
+    if unit is None or per_unit is None:
+        return None
+    canonical_value = float(value.replace(',', '.')) * unit[1] / per_unit[1]
+    # Округление до 9 значащих цифр убирает шум умножения (250 мкг -> 0.25 мг)
+    return DosageComponent(float(f'{canonical_value:.9g}'), unit[0], per_unit[0])
+
+
+def _component_key(component):
+    per_unit = f'/{component.per_unit}' if component.per_unit else ''
+    return f'{component.value:g}{component.unit}{per_unit}'
+
+
+@lru_cache(maxsize=None)
+def parse_dosage(dosage_std):
+    """
+    Разбирает стандартизированную дозировку (результат extract_dosage) в числовую модель.
+
+    "0,5 г" и "500 mg" дают одинаковый ключ '500mg'; составные дозировки ("120 мг + 60 мг")
+    и перечисления через запятую дают ключ из отсортированных компонентов.
+    Нераспознанная строка сохраняется в ключе как есть, 'н/д' остается 'н/д'.
+    """
+    if not isinstance(dosage_std, str) or dosage_std == NO_DOSAGE:
+        return _NOT_PARSED
+
+    items = []
+    components = []
+    for item in dosage_std.split(', '):
+        parts = [_parse_component(part) for part in item.split(' + ')]
+        if any(part is None for part in parts):
+            # Нераспознанный фрагмент: сравнение только по исходной строке
+            return ParsedDosage(dosage_std, (), None)
+        items.append(' + '.join(sorted(_component_key(part) for part in parts)))
+        components.extend(parts)
+
+    key = '; '.join(sorted(set(items)))
+    single = components[0] if len(components) == 1 else None
+    return ParsedDosage(key, tuple(components), single)
+
+
+def dosage_ratio_score(value_a, value_b):
+    """Числовой score близости двух дозировок одной единицы: 100 * меньшая / большая."""
+    if value_a == value_b:
+        return 100.0
+    if value_a <= 0 or value_b <= 0:
+        return 0.0
+    return 100.0 * min(value_a, value_b) / max(value_a, value_b)
+
+
+def dosage_columns(dosage_std):
+    """
+    Строит числовые колонки дозировки для колонки dosage_standardized.
+    Каждая уникальная строка разбирается один раз.
+
+    dosage_key        - канонический ключ (точное сравнение с учетом единиц)
+    dosage_value      - значение единственного компонента в канонической единице (NaN, если компонентов не 1)
+    dosage_unit       - каноническая единица ('mg', 'IU', 'ml', '%')
+    dosage_per_unit   - знаменатель концентрации ('ml', 'dose' или '')
+    dosage_components - число компонентов
+    """
+    codes, uniques = pd.factorize(pd.Series(dosage_std, dtype=object), use_na_sentinel=False)
+    parsed = [parse_dosage(dosage) for dosage in uniques]
+
+    keys = np.array([p.key for p in parsed], dtype=object)
+    values = np.array([p.single.value if p.single else np.nan for p in parsed], dtype=np.float64)
+    units = np.array([p.single.unit if p.single else '' for p in parsed], dtype=object)
+    per_units = np.array([p.single.per_unit if p.single else '' for p in parsed], dtype=object)
+    counts = np.array([len(p.components) for p in parsed], dtype=np.int16)
+
+    index = dosage_std.index if isinstance(dosage_std, pd.Series) else None
+    return pd.DataFrame({
+        'dosage_key': keys[codes],
+        'dosage_value': values[codes],
+        'dosage_unit': units[codes],
+        'dosage_per_unit': per_units[codes],
+        'dosage_components': counts[codes],
+    }, index=index)
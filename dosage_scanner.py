@@ -0,0 +1,98 @@
+import re
+
+from dosage_model import NO_DOSAGE
+
+# ====================================================================
+# РАЗБОР ДОЗИРОВКИ ЗА ОДИН ПРОХОД (линейное время, без возвратов по цифрам)
+# ====================================================================
+
+# Единицы дозировки (порядок альтернатив важен: выбирается первая подходящая)
+_UNITS = r'мг|ед|мл|г|мкг|МО|МЕ|%|mg|ml|g|mcg|IU'
+_SIMPLE_UNITS = r'мкг/доза|' + _UNITS
+_CONCENTRATION_UNITS = r'мг|ед|г|мкг|МО|МЕ|%|mg|g|mcg|IU'
+_PER_UNITS = r'мл|доза|ml|l|mcl'
+
+# Начало числа: первая цифра серии цифр. Внутри серии дозировка начаться не может:
+# если она не нашлась с первой цифры, с последующих ее тоже нет
+_NUMBER_START = re.compile(r'(?<!\d)\d')
+
+# Число целиком: "500", "0,5", "2." Сопоставляется отдельно от единиц, поэтому на длинных
+# сериях цифр (номера лотов, GTIN) нет перебора вариантов разбиения числа
+_NUMBER = re.compile(r'\d+(?:[,\.]\d*)?')
+
+# Продолжения после числа (сопоставляются с позиции конца числа)
+_CONCENTRATION_TAIL = re.compile(rf'\s*({_CONCENTRATION_UNITS})\s*/\s*({_PER_UNITS})', re.IGNORECASE)
+_COMPOUND_HEAD = re.compile(rf'\s*({_UNITS})\s*[\+\/—]\s*', re.IGNORECASE)
+_UNIT_TAIL = re.compile(rf'\s*({_UNITS})', re.IGNORECASE)
+_SIMPLE_TAIL = re.compile(rf'\s*({_SIMPLE_UNITS})', re.IGNORECASE)
+# Вырезаемая из наименования дозировка: единица, необязательные разделитель, второе число и единицы
+_STRIP_TAIL = re.compile(rf'\s*(?:{_SIMPLE_UNITS})\s*[\+\/—]?\s*(?:\d+(?:[,\.]\d*)?)?\s*(?:{_UNITS})*',
+                         re.IGNORECASE)
+
+
+def _format_part(value, unit):
+    return f"{value.replace('.', ',')} {unit.lower()}"
+
+
+def scan_dosage(name):
+    """
+    Разбирает дозировку наименования за один проход по началам чисел.
+
+    Возвращает (стандартизированная дозировка или 'н/д', наименование без дозировки).
+    Дозировка - концентрации ("0,5 мг/мл") и составные ("120 мг + 60 мг"), а если их нет -
+    простые ("100 мг"), без повторов, отсортированные и через ", ".
+    Из наименования вырезаются дозировки вида "100 мг", "500 мг/100 мл", "5 мг 10 мл"
+    (заменяются пробелом, пробелы схлопываются).
+
+    Каждое число сопоставляется целиком один раз, поэтому время разбора линейно
+    по длине строки (в т.ч. на длинных сериях цифр).
+    """
+    found = []
+    simple = []
+    stripped = []
+
+    # Для каждого вида дозировки - позиция, с которой может начаться следующее совпадение
+    # (совпадения одного вида не пересекаются)
+    concentration_from = compound_from = simple_from = strip_from = 0
+    last = 0
+
+    for start_match in _NUMBER_START.finditer(name):
+        start = start_match.start()
+        number = _NUMBER.match(name, start)
+        value, end = number.group(), number.end()
+
+        # A. Концентрации: 0,5 мг/мл
+        if start >= concentration_from:
+            match = _CONCENTRATION_TAIL.match(name, end)
+            if match:
+                found.append(f"{_format_part(value, match.group(1))}/{match.group(2).lower()}")
+                concentration_from = match.end()
+
+        # B. Составные: 120 мг + 60 мг, 500 мг/100 мл
+        if start >= compound_from:
+            head = _COMPOUND_HEAD.match(name, end)
+            second = _NUMBER.match(name, head.end()) if head else None
+            tail = _UNIT_TAIL.match(name, second.end()) if second else None
+            if tail:
+                found.append(f"{_format_part(value, head.group(1))} + {_format_part(second.group(), tail.group(1))}")
+                compound_from = tail.end()
+
+        # C. Простые: 100 мг (используются, только если не найдено A и B)
+        if start >= simple_from:
+            match = _SIMPLE_TAIL.match(name, end)
+            if match:
+                simple.append(_format_part(value, match.group(1)))
+                simple_from = match.end()
+
+        # Наименование без дозировки
+        if start >= strip_from:
+            match = _STRIP_TAIL.match(name, end)
+            if match:
+                stripped += [name[last:start], ' ']
+                last = strip_from = match.end()
+
+    stripped.append(name[last:])
+    unique_matches = sorted(set(found or simple))
+    dosage = ", ".join(unique_matches) if unique_matches else NO_DOSAGE
+    return dosage, ' '.join(''.join(stripped).split())
+
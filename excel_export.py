@@ -0,0 +1,87 @@
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.formatting.rule import Rule
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+from openpyxl.styles.differential import DifferentialStyle
+from openpyxl.utils import get_column_letter
+
+from match_results import STATUS_EXACT, STATUS_PARTIAL, STATUS_POTENTIAL
+from register_layout import float32_as_decimal
+
+# ====================================================================
+# БЫСТРЫЙ ЭКСПОРТ РЕЗУЛЬТАТА В EXCEL (openpyxl write-only)
+# ====================================================================
+
+# Статус -> (цвет фона, цвет текста)
+GREEN = ('C6EFCE', '006100')
+YELLOW = ('FFEB9C', '9C6500')
+BLUE = ('BDD7EE', '000000')
+
+# CLI: зеленый / желтый / синий
+CLI_STATUS_COLORS = {STATUS_EXACT: GREEN, STATUS_POTENTIAL: YELLOW, STATUS_PARTIAL: BLUE}
+# Веб-интерфейс: Потенциальное и Частичное соответствие - одним синим цветом
+APP_STATUS_COLORS = {STATUS_EXACT: GREEN, STATUS_POTENTIAL: BLUE, STATUS_PARTIAL: BLUE}
+
+# Строк DataFrame, переводимых в значения Excel за один шаг
+EXPORT_CHUNK_ROWS = 50_000
+
+# Заголовок как у DataFrame.to_excel: жирный, тонкая рамка, по центру
+_THIN = Side(style='thin')
+_HEADER_FONT = Font(bold=True)
+_HEADER_BORDER = Border(left=_THIN, right=_THIN, top=_THIN, bottom=_THIN)
+_HEADER_ALIGNMENT = Alignment(horizontal='center', vertical='top')
+
+
+def _header_row(ws, columns):
+    cells = []
+    for name in columns:
+        cell = WriteOnlyCell(ws, value=str(name))
+        cell.font = _HEADER_FONT
+        cell.border = _HEADER_BORDER
+        cell.alignment = _HEADER_ALIGNMENT
+        cells.append(cell)
+    return cells
+
+
+def _status_rules(ws, columns, n_rows, status_colors):
+    """
+    Цвет строк по статусу задается условным форматированием на весь диапазон данных
+    (одно правило на статус), а не стилем каждой ячейки.
+    """
+    if 'Status' not in columns or n_rows == 0:
+        return
+    status_letter = get_column_letter(list(columns).index('Status') + 1)
+    data_range = f"A2:{get_column_letter(len(columns))}{n_rows + 1}"
+
+    for status, (background, text) in status_colors.items():
+        style = DifferentialStyle(
+            fill=PatternFill(fill_type='solid', start_color=background, end_color=background, bgColor=background),
+            font=Font(color=text),
+        )
+        escaped = status.replace('"', '""')
+        rule = Rule(type='expression', dxf=style, formula=[f'${status_letter}2="{escaped}"'])
+        ws.conditional_formatting.add(data_range, rule)
+
+
+def write_results_excel(final_df, output, status_colors=CLI_STATUS_COLORS, sheet_name='Sheet1'):
+    """
+    Записывает таблицу результата в Excel (путь или файловый объект) с цветом строк по статусу.
+
+    Лист пишется в режиме write-only: строки уходят во временный файл по мере записи,
+    без CSS-строки на каждую ячейку, как у pandas Styler. NaN записываются пустыми ячейками.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name)
+
+    columns = list(final_df.columns)
+    ws.append(_header_row(ws, columns))
+
+    for start in range(0, len(final_df), EXPORT_CHUNK_ROWS):
+        chunk = float32_as_decimal(final_df.iloc[start:start + EXPORT_CHUNK_ROWS])
+        values = chunk.astype(object).to_numpy()
+        values[chunk.isna().to_numpy()] = None
+        for row in values.tolist():
+            ws.append(row)
+
+    _status_rules(ws, columns, len(final_df), status_colors)
+    wb.save(output)
@@ -0,0 +1,185 @@
+from collections import namedtuple
+
+import numpy as np
+
+from register_layout import take_values
+
+# ====================================================================
+# КОЛОНОЧНАЯ СБОРКА РЕЗУЛЬТАТА СОПОСТАВЛЕНИЯ
+# ====================================================================
+
+STATUS_EXACT = "Полное соответствие"
+STATUS_POTENTIAL = "Потенциальное соответствие"
+STATUS_PARTIAL = "Частичное соответствие МНН"
+STATUS_NOT_FOUND = "Не найдено"
+
+# Код статуса (int8 в массивах результата) -> текст статуса
+STATUSES = np.array([STATUS_EXACT, STATUS_POTENTIAL, STATUS_PARTIAL, STATUS_NOT_FOUND], dtype=object)
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+
+# register_row_id для строки "Не найдено"
+NO_MATCH_ROW = -1
+
+# Промежуточные колонки подготовки закупки, которые не попадают в результат
+INTERMEDIATE_COLUMNS = ['mnn_standardized', 'dosage_standardized', 'mnn_match_score']
+
+# Колонка результата -> (колонка реестра или None, значение для "Не найдено")
+# Колонка реестра для 'Reg_Match_Name' задается настройкой (trade_name / mnn)
+RESULT_COLUMNS = {
+    "Status": (None, STATUS_NOT_FOUND),
+    "Reg_Match_Name": (None, "Нет соответствий"),
+    "Reg_Dosage_Original": ('dosage', "Н/Д"),
+    "Manufacturer": ('manufacturer', "Н/Д"),
+    "Purchase_Price_USD": ('purchase_price_USD', 0.0),
+    "Known_Threshold_Price_USD": ('known_threshold_price_USD', 0.0),
+    "Client_Price_USD": ('client_price_USD', 0.0),
+    "Match_Score": (None, 0.0),
+    "Omitted_Candidates": (None, 0),
+}
+
+# Результат одной уникальной позиции: позиции строк реестра (или [NO_MATCH_ROW]), статус, score
+# и число строк реестра МНН, не вошедших в результат (ограничение Уровня 3, Matcher.partial_limit)
+ItemMatch = namedtuple('ItemMatch', ['positions', 'status', 'score', 'omitted'], defaults=(0,))
+
+# Результат всей закупки: по одному элементу на строку итоговой таблицы
+MatchResults = namedtuple('MatchResults', ['purchase_row_id', 'register_row_id', 'status', 'score', 'omitted'])
+
+_NOT_FOUND_POSITIONS = np.array([NO_MATCH_ROW], dtype=np.intp)
+
+
+def not_found_match():
+    """Результат 'Не найдено' для одной позиции."""
+    return ItemMatch(_NOT_FOUND_POSITIONS, STATUS_NOT_FOUND, 0.0)
+
+
+def collect_item_matches(item_matches):
+    """
+    Переводит список ItemMatch (по одному на уникальную позицию) в MatchResults,
+    где purchase_row_id - номер уникальной позиции.
+    """
+    counts = np.array([len(match.positions) for match in item_matches], dtype=np.intp)
+    if len(item_matches):
+        register_row_id = np.concatenate([match.positions for match in item_matches]).astype(np.intp)
+    else:
+        register_row_id = np.empty(0, dtype=np.intp)
+    statuses = np.array([STATUS_CODES[match.status] for match in item_matches], dtype=np.int8)
+    scores = np.array([match.score for match in item_matches], dtype=np.float64)
+    omitted = np.array([match.omitted for match in item_matches], dtype=np.int32)
+
+    return MatchResults(
+        np.repeat(np.arange(len(item_matches), dtype=np.intp), counts),
+        register_row_id,
+        np.repeat(statuses, counts),
+        np.repeat(scores, counts),
+        np.repeat(omitted, counts),
+    )
+
+
+def empty_match_results():
+    """MatchResults без строк."""
+    return MatchResults(np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0, dtype=np.int8),
+                        np.empty(0, dtype=np.float64), np.empty(0, dtype=np.int32))
+
+
+def expand_unique_results(key_codes, unique_results):
+    """
+    Размножает результаты уникальных позиций на строки закупки.
+
+    key_codes[i] - номер уникальной позиции для i-й строки закупки; unique_results -
+    MatchResults по уникальным позициям, упорядоченный по номеру позиции (у каждой
+    позиции хотя бы одна строка, для "Не найдено" - NO_MATCH_ROW).
+    Возвращает MatchResults: массивы номер строки закупки, позиция строки реестра
+    (NO_MATCH_ROW для "Не найдено"), код статуса и score - без промежуточных объектов на совпадение.
+    """
+    key_codes = np.asarray(key_codes, dtype=np.intp)
+    unique_ids = unique_results.purchase_row_id
+
+    n_unique = int(key_codes.max()) + 1 if len(key_codes) else 0
+    counts = np.bincount(unique_ids, minlength=n_unique).astype(np.intp)
+    starts = np.zeros(len(counts), dtype=np.intp)
+    np.cumsum(counts[:-1], out=starts[1:])
+
+    row_counts = counts[key_codes]
+    total = int(row_counts.sum())
+    purchase_row_id = np.repeat(np.arange(len(key_codes), dtype=np.intp), row_counts)
+
+    # Номер строки unique_results для каждой строки результата: начало своей позиции + смещение
+    row_starts = np.repeat(np.cumsum(row_counts) - row_counts, row_counts)
+    source = np.repeat(starts[key_codes], row_counts) + np.arange(total, dtype=np.intp) - row_starts
+
+    return MatchResults(
+        purchase_row_id,
+        unique_results.register_row_id[source],
+        unique_results.status[source],
+        unique_results.score[source],
+        unique_results.omitted[source],
+    )
+
+
+def expand_item_matches(key_codes, item_matches):
+    """Размножает результаты уникальных позиций (список ItemMatch) на строки закупки."""
+    return expand_unique_results(key_codes, collect_item_matches(item_matches))
+
+
+def _take_register_column(values, register_row_id, found, default):
+    """
+    Значения колонки реестра (Series) по позициям; для "Не найдено" - значение по умолчанию.
+    Числовые колонки сохраняют тип реестра (цены float32 выводятся так же, как в CSV реестра).
+    """
+    numeric = isinstance(default, float) and values.dtype.kind in 'fiu'
+    column = np.full(len(register_row_id), default, dtype=values.dtype if numeric else object)
+    column[found] = take_values(values, register_row_id[found])
+    return column
+
+
+def build_result_table(purchase_df, register_df, results, match_name_column):
+    """
+    Строит итоговую таблицу: строки закупки (take по purchase_row_id) и колонки реестра
+    (take по register_row_id) одним проходом по каждой колонке.
+    """
+    final_df = purchase_df.drop(columns=INTERMEDIATE_COLUMNS, errors='ignore')
+    final_df = final_df.take(results.purchase_row_id).reset_index(drop=True)
+
+    register_row_id = results.register_row_id
+    found = register_row_id != NO_MATCH_ROW
+
+    columns = {}
+    for result_col, (register_col, default) in RESULT_COLUMNS.items():
+        if result_col == "Status":
+            columns[result_col] = STATUSES[results.status]
+        elif result_col == "Match_Score":
+            columns[result_col] = results.score
+        elif result_col == "Omitted_Candidates":
+            columns[result_col] = results.omitted
+        else:
+            register_col = register_col or match_name_column
+            columns[result_col] = _take_register_column(
+                register_df[register_col], register_row_id, found, default
+            )
+
+    for result_col, values in columns.items():
+        final_df[result_col] = values
+    final_df.attrs = purchase_df.attrs
+    return final_df
+
+
+def item_match_dicts(register_df, item_match, match_name_column):
+    """Результат одной позиции в виде списка словарей (по одному на совпадение)."""
+    if item_match.status == STATUS_NOT_FOUND:
+        return [{col: default for col, (_, default) in RESULT_COLUMNS.items()}]
+
+    matches = []
+    for position in item_match.positions:
+        row = register_df.iloc[position]
+        match = {}
+        for result_col, (register_col, _) in RESULT_COLUMNS.items():
+            if result_col == "Status":
+                match[result_col] = item_match.status
+            elif result_col == "Match_Score":
+                match[result_col] = item_match.score
+            elif result_col == "Omitted_Candidates":
+                match[result_col] = item_match.omitted
+            else:
+                match[result_col] = row[register_col or match_name_column]
+        matches.append(match)
+    return matches
@@ -0,0 +1,331 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import tornado.ioloop
+import tornado.web
+
+from match_results import RESULT_COLUMNS, build_result_table
+from register_layout import float32_as_decimal
+from matching_script import DEFAULT_PARTIAL_LIMIT, REGISTER_FILENAME, Matcher
+from name_cache import DEFAULT_NAME_CACHE, NameCache
+
+# ====================================================================
+# ЛОКАЛЬНЫЙ HTTP-СЕРВИС СОПОСТАВЛЕНИЯ (tornado, реестр загружен один раз)
+# ====================================================================
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Потоков сопоставления (одновременно обрабатываемых запросов)
+DEFAULT_WORKERS = 4
+
+# Максимум позиций в одном запросе (большие файлы - через matching_script.py --stream)
+MAX_BATCH_ITEMS = 10_000
+
+# Как часто проверять, изменился ли файл реестра (секунд)
+DEFAULT_RELOAD_INTERVAL = 2.0
+
+# Пакеты не больше этого размера проверяются по одной позиции (Matcher.check_item_name):
+# без DataFrame-конвейера задержка одиночного запроса - единицы миллисекунд
+SMALL_BATCH_ITEMS = 16
+
+# Колонки закупки, возвращаемые для каждой позиции (результат парсинга наименования)
+ITEM_COLUMNS = ['mnn_standardized', 'dosage_standardized', 'mnn_match_score']
+
+
+def file_signature(path):
+    """Признак изменения файла реестра без чтения содержимого: (время изменения, размер)."""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class RegisterHolder:
+    """
+    Загруженный реестр (Matcher) для сервиса и его перезагрузка при изменении файла.
+
+    Новый реестр загружается полностью (в фоне), и только потом подменяет текущий одним
+    присваиванием: запросы, начатые со старым реестром, заканчиваются с ним же, новые
+    получают новый. Изменение принимается, когда признак файла не менялся между двумя
+    проверками (файл дописан); при ошибке загрузки остается прежний реестр, а тот же
+    файл повторно не загружается до следующего изменения.
+    """
+
+    def __init__(self, register_path, **matcher_settings):
+        self.register_path = register_path
+        self.matcher_settings = matcher_settings
+        self.reloads = 0
+        self.last_error = None
+        self._pending_signature = None
+        self._failed_signature = None
+        self._reload_lock = threading.Lock()
+
+        self.signature = file_signature(register_path)
+        self.matcher = self._load()
+        self.loaded_at = datetime.datetime.now()
+
+    def _load(self):
+        # Запросы обрабатываются параллельно потоками: cdist каждого запроса однопоточный
+        return Matcher(self.register_path, cdist_workers=1, **self.matcher_settings).load()
+
+    def reload_if_changed(self):
+        """Проверяет файл реестра и перезагружает его, если он изменился. Возвращает True при подмене."""
+        if not self._reload_lock.acquire(blocking=False):
+            return False # перезагрузка уже идет
+        try:
+            try:
+                signature = file_signature(self.register_path)
+            except OSError as e:
+                self.last_error = f"Файл реестра недоступен: {e}"
+                return False
+
+            if signature in (self.signature, self._failed_signature):
+                self._pending_signature = None
+                return False
+            if signature != self._pending_signature:
+                # Файл мог быть еще не дописан: ждем следующей проверки
+                self._pending_signature = signature
+                return False
+
+            print(f"🔄 Реестр '{self.register_path}' изменился, перезагрузка...")
+            try:
+                matcher = self._load()
+            except Exception as e:
+                self.last_error = f"Ошибка загрузки реестра: {e}"
+                self._failed_signature, self._pending_signature = signature, None
+                print(f"❌ {self.last_error}. Используется прежний реестр.")
+                traceback.print_exc()
+                return False
+
+            self.matcher, self.signature = matcher, signature
+            self.loaded_at = datetime.datetime.now()
+            self.reloads += 1
+            self.last_error = None
+            self._pending_signature = self._failed_signature = None
+            print(f"✅ Реестр перезагружен. Уникальных МНН: {len(matcher.mnn_list)}")
+            return True
+        finally:
+            self._reload_lock.release()
+
+    def info(self):
+        matcher = self.matcher
+        return {
+            'path': self.register_path,
+            'rows': len(matcher.register_df),
+            'unique_mnn': len(matcher.mnn_list),
+            'loaded_at': self.loaded_at.isoformat(timespec='seconds'),
+            'from_cache': matcher.from_cache,
+            'reloads': self.reloads,
+            'last_error': self.last_error,
+        }
+
+
+def _json_value(value):
+    """Значение ячейки результата для JSON (NaN -> null, numpy -> Python)."""
+    if isinstance(value, np.float32):
+        # Цены реестра хранятся как float32: кратчайшая запись (48.97), а не 48.970001220703125
+        return None if np.isnan(value) else float(str(value))
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+
+def match_batch(matcher, items, mnn_threshold=None, dosage_threshold=None, partial_limit=None):
+    """
+    Сопоставляет пакет позиций с реестром (по тем же уровням, что и Matcher.check_purchase_item).
+
+    items - список наименований или словарей с 'item_name_raw' (остальные поля словаря
+    возвращаются как есть). Возвращает список результатов по позициям в исходном порядке:
+    поля позиции, результат парсинга (ITEM_COLUMNS) и 'matches' - совпадения реестра
+    (колонки RESULT_COLUMNS).
+    """
+    settings = {}
+    if mnn_threshold is not None:
+        settings['mnn_threshold'] = mnn_threshold
+    if dosage_threshold is not None:
+        settings['dosage_threshold'] = dosage_threshold
+    if partial_limit is not None:
+        settings['partial_limit'] = partial_limit
+    if settings:
+        matcher = matcher.with_settings(**settings)
+
+    rows = [item if isinstance(item, dict) else {'item_name_raw': item} for item in items]
+    if len(rows) <= SMALL_BATCH_ITEMS:
+        return [_item_response(row, *matcher.check_item_name(row['item_name_raw'])) for row in rows]
+
+    purchase_df = pd.DataFrame(rows, columns=list(dict.fromkeys(col for row in rows for col in row)))
+    purchase_df = matcher.prepare_purchase_data(purchase_df)
+    results = matcher.match_results(purchase_df)
+    result_df = build_result_table(purchase_df, matcher.register_df, results, matcher.match_name_column)
+
+    # Совпадения по позициям: purchase_row_id результата упорядочен по строкам закупки
+    match_records = float32_as_decimal(result_df[list(RESULT_COLUMNS)]).to_dict('records')
+    bounds = np.cumsum(np.bincount(results.purchase_row_id, minlength=len(purchase_df)))
+    parsed = purchase_df[ITEM_COLUMNS].to_dict('records')
+
+    return [_item_response(row, parsed[row_id], match_records[bounds[row_id - 1] if row_id else 0:bounds[row_id]])
+            for row_id, row in enumerate(rows)]
+
+
+def _item_response(row, parsed, matches):
+    """Результат одной позиции: поля запроса, парсинг наименования и совпадения реестра."""
+    item = dict(row)
+    item.update({col: _json_value(parsed[col]) for col in ITEM_COLUMNS})
+    item['matches'] = [{col: _json_value(match[col]) for col in RESULT_COLUMNS} for match in matches]
+    return item
+
+
+# --------------------------------------------------------------------
+# HTTP-обработчики
+# --------------------------------------------------------------------
+
+class _JsonHandler(tornado.web.RequestHandler):
+    def initialize(self, service):
+        self.service = service
+
+    def write_json(self, payload):
+        self.set_header('Content-Type', 'application/json; charset=UTF-8')
+        self.finish(json.dumps(payload, ensure_ascii=False))
+
+    def write_error(self, status_code, **kwargs):
+        self.write_json({'error': self._reason})
+
+
+class MatchHandler(_JsonHandler):
+    """
+    POST /match
+    {"items": ["Парацетамол табл. 500 мг", {"item_name_raw": "...", "quantity": 10}],
+     "mnn_threshold": 80, "dosage_threshold": 75, "partial_limit": 10}
+    partial_limit - не больше строк "Частичное соответствие МНН" на позицию (0 - все строки МНН).
+    """
+
+    async def post(self):
+        try:
+            request = json.loads(self.request.body)
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="Тело запроса должно быть JSON")
+        if not isinstance(request, dict):
+            raise tornado.web.HTTPError(400, reason="Ожидается JSON-объект с полем 'items'")
+
+        items = request.get('items')
+        if not isinstance(items, list):
+            raise tornado.web.HTTPError(400, reason="Поле 'items' должно быть списком")
+        if len(items) > MAX_BATCH_ITEMS:
+            raise tornado.web.HTTPError(413, reason=f"Не больше {MAX_BATCH_ITEMS} позиций в одном запросе")
+        for item in items:
+            name = item.get('item_name_raw') if isinstance(item, dict) else item
+            if not isinstance(name, str):
+                raise tornado.web.HTTPError(400, reason="Каждая позиция - строка или объект с 'item_name_raw' (строка)")
+
+        settings = {}
+        for name in ('mnn_threshold', 'dosage_threshold'):
+            value = request.get(name)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))
+                                      or not 0 <= value <= 100):
+                raise tornado.web.HTTPError(400, reason=f"'{name}' должен быть числом от 0 до 100")
+            settings[name] = value
+        partial_limit = request.get('partial_limit')
+        if partial_limit is not None and (isinstance(partial_limit, bool) or not isinstance(partial_limit, int)
+                                          or partial_limit < 0):
+            raise tornado.web.HTTPError(400, reason="'partial_limit' должен быть целым числом >= 0")
+        settings['partial_limit'] = partial_limit
+
+        # Текущий реестр фиксируется на весь запрос (перезагрузка не влияет на начатые запросы)
+        matcher = self.service.holder.matcher
+        results = await asyncio.get_running_loop().run_in_executor(
+            self.service.executor, lambda: match_batch(matcher, items, **settings)
+        )
+        self.write_json({'results': results})
+
+
+class HealthHandler(_JsonHandler):
+    """GET /health - состояние сервиса и загруженного реестра."""
+
+    def get(self):
+        self.write_json({'status': 'ok', 'register': self.service.holder.info()})
+
+
+class MatchService:
+    """Сервис: загруженный реестр (RegisterHolder) и пул потоков сопоставления."""
+
+    def __init__(self, holder, workers=DEFAULT_WORKERS):
+        self.holder = holder
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='match')
+        # Перезагрузка реестра - в отдельном потоке, чтобы не занимать потоки запросов
+        self.reload_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='reload')
+
+    def make_app(self):
+        return tornado.web.Application([
+            (r'/match', MatchHandler, {'service': self}),
+            (r'/health', HealthHandler, {'service': self}),
+        ])
+
+    def check_register(self):
+        """Периодическая проверка файла реестра (PeriodicCallback)."""
+        asyncio.get_running_loop().run_in_executor(self.reload_executor, self.holder.reload_if_changed)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+        self.reload_executor.shutdown(wait=False)
+
+
+# ---
+# ====================================================================
+# ЗАПУСК СЕРВИСА
+# ====================================================================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Локальный HTTP-сервис сопоставления закупок с реестром ЛС.")
+    parser.add_argument('--register', default=REGISTER_FILENAME, help="CSV реестра ЛС (по умолчанию: %(default)s)")
+    parser.add_argument('--host', default=DEFAULT_HOST, help="Адрес (по умолчанию: %(default)s - только локально)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="Порт (по умолчанию: %(default)s)")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help="Одновременно обрабатываемых запросов (по умолчанию: %(default)s)")
+    parser.add_argument('--reload-interval', type=float, default=DEFAULT_RELOAD_INTERVAL,
+                        help="Период проверки изменения файла реестра, сек (по умолчанию: %(default)s)")
+    parser.add_argument('--partial-limit', type=int, default=DEFAULT_PARTIAL_LIMIT,
+                        help="Не больше строк 'Частичное соответствие МНН' на позицию по умолчанию "
+                             "(по умолчанию: %(default)s; 0 - все строки МНН)")
+    parser.add_argument('--name-cache', default=DEFAULT_NAME_CACHE,
+                        help="SQLite-кэш разбора наименований (по умолчанию: %(default)s)")
+    parser.add_argument('--no-name-cache', action='store_true', help="Не использовать кэш наименований")
+    return parser.parse_args(argv)
+
+
+async def serve(args):
+    print(f"🔍 Загрузка реестра: {args.register}...")
+    name_cache = None if args.no_name_cache else NameCache(args.name_cache)
+    holder = RegisterHolder(args.register, name_cache=name_cache, partial_limit=args.partial_limit)
+    print(f"✅ Реестр загружен. Уникальных МНН: {len(holder.matcher.mnn_list)}")
+
+    service = MatchService(holder, args.workers)
+    service.make_app().listen(args.port, address=args.host)
+    tornado.ioloop.PeriodicCallback(service.check_register, args.reload_interval * 1000).start()
+    print(f"🚀 Сервис запущен: http://{args.host}:{args.port}/match (POST), /health (GET)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        service.shutdown()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        asyncio.run(serve(args))
+    except FileNotFoundError:
+        print(f"❌ Критическая ошибка: Файл реестра '{args.register}' не найден. Проверьте имя!")
+    except KeyboardInterrupt:
+        print("\n👋 Сервис остановлен.")
+
+
+if __name__ == "__main__":
+    main()
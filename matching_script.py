@@ -1,73 +1,70 @@
 import pandas as pd
+import numpy as np
 from rapidfuzz import fuzz
 from rapidfuzz import process 
 import re
 import os 
 import datetime
-import io 
 import traceback
+import argparse
+import time
+from collections import namedtuple
+from functools import lru_cache
+
+from batch_matching import (BATCH_OUTPUT_FORMATS, DEFAULT_BATCH_SOURCE, FILE_FAILED, FILE_MATCHED, FILE_SKIPPED,
+                            find_purchase_files, match_files)
+from dedup import dedup_stats, match_unique_items, unique_match_keys
+from dosage_model import dosage_columns, parse_dosage
+from dosage_scanner import scan_dosage
+from match_results import (STATUS_EXACT, STATUS_PARTIAL, STATUS_POTENTIAL, ItemMatch, build_result_table,
+                           collect_item_matches, expand_unique_results, item_match_dicts, not_found_match)
+from mnn_blocking import BLOCKING_MIN_MNN, MnnCandidateIndex
+from mnn_resolver import (MNN_STAGE_FUZZY, MNN_STAGE_NOT_FOUND, UNKNOWN_MNN, MnnTokenTrie, mnn_stage_stats,
+                          resolve_mnn_batch)
+from name_cache import DEFAULT_NAME_CACHE, NAME_COLUMNS, NameCache, cache_context, name_cache_stats
+from parallel_matching import ParallelMatcher
+from purchase_ingest import RAW_EXTENSIONS, read_raw_purchase, read_raw_purchase_chunks
+from register_cache import file_hash, load_compiled_register
+from register_index import RegisterIndex
+from register_layout import compact_register
+from stream_matching import DEFAULT_CHUNKSIZE, OUTPUT_FORMATS, match_stream, read_purchase_chunks
+from text_normalization import normalize_names, normalize_text
+from vectorized_engine import ENGINE_LEGACY, ENGINE_VECTORIZED, ENGINES, VectorizedEngine
 
 # ====================================================================
-# 1. КОНСТАНТЫ И ЗАГРУЗКА РЕЕСТРА ЛС (МНН, Дозировка)
+# 1. КОНСТАНТЫ
 # ====================================================================
 
 REGISTER_COLUMNS = ['mnn', 'trade_name', 'dosage', 'form', 'manufacturer', 'purchase_price_USD', 'known_threshold_price_USD', 'client_price_USD']
-mnn_list = []
 REGISTER_FILENAME = 'register_ls.csv' 
 PURCHASE_FILENAME = 'purchase_input.csv' 
 
+# Пороги по умолчанию (CLI)
+DEFAULT_MNN_THRESHOLD = 80
+DEFAULT_DOSAGE_THRESHOLD = 75.0
+
+# Не больше строк "Частичное соответствие МНН" на позицию закупки (None - все строки МНН)
+DEFAULT_PARTIAL_LIMIT = 10
+
 # --------------------------------------------------------------------
-# 2.1 Вспомогательная функция для извлечения дозировки (Снова ИСПРАВЛЕННАЯ)
+# 2.1 Вспомогательная функция для извлечения дозировки
 # --------------------------------------------------------------------
 def extract_dosage(name):
     """
     Извлекает все дозировки, включая концентрации, и стандартизирует их.
-    Использует более простую логику для надежности.
+    Разбор выполняется за один проход (dosage_scanner.scan_dosage).
     """
-    # 1. Шаблон для концентраций: 0,5 мг/мл, 50 мг/мл и т.п.
-    concentration_pattern = r'(\d+[,\.]?\d*)\s*(мг|ед|г|мкг|МО|МЕ|%|mg|g|mcg|IU)\s*\/\s*(мл|доза|ml|l|mcl)' 
-    
-    # 2. Шаблон для составных: 120 мг + 60 мг, или 500 мг в 100 мл
-    compound_pattern = r'(\d+[,\.]?\d*)\s*(мг|ед|мл|г|мкг|МО|МЕ|%|mg|ml|g|mcg|IU)\s*[\+\/—]\s*(\d+[,\.]?\d*)\s*(мг|ед|мл|г|мкг|МО|МЕ|%|mg|ml|g|mcg|IU)'
-    
-    # 3. Шаблон для простых: 100 мг, 10 мл
-    simple_pattern = r'(\d+[,\.]?\d*)\s*(мкг/доза|мг|ед|мл|г|мкг|МО|МЕ|%|mg|ml|g|mcg|IU)'
-    
-    all_matches = []
-    
-    # A. Поиск концентраций (приоритет)
-    for match in re.findall(concentration_pattern, name, re.IGNORECASE):
-        val1, unit1, unit2 = match
-        all_matches.append(f"{val1.replace('.', ',')} {unit1.lower()}/{unit2.lower()}")
-
-    # B. Поиск составных дозировок (приоритет)
-    for match in re.findall(compound_pattern, name, re.IGNORECASE):
-        parts = [part for part in match if part] 
-        compound_string = ""
-        for i in range(0, len(parts), 2):
-            if compound_string:
-                compound_string += " + "
-            compound_string += f"{parts[i].replace('.', ',')} {parts[i+1].lower()}"
-        all_matches.append(compound_string)
-
-    # C. Поиск простых дозировок (если не было найдено сложной)
-    if not all_matches:
-        for val, unit in re.findall(simple_pattern, name, re.IGNORECASE):
-            all_matches.append(f"{val.replace('.', ',')} {unit.lower()}")
-
-    # Удаление дубликатов и сортировка
-    unique_matches = sorted(list(set(all_matches)))
-            
-    return ", ".join(unique_matches) if unique_matches else 'н/д'
+    return scan_dosage(name)[0]
 
 # --------------------------------------------------------------------
-# 2.2 Основная загрузка и очистка реестра
+# 2.2 Подготовка реестра
 # --------------------------------------------------------------------
 
-try:
-    print(f"🔍 Попытка загрузки реестра: {REGISTER_FILENAME}...")
-    
-    register_df = pd.read_csv(REGISTER_FILENAME, sep=';', encoding='utf-8') 
+def prepare_register(register_df, compact=True):
+    """
+    Добавляет недостающие колонки, очищает МНН и стандартизирует дозировку реестра.
+    compact=True - компактное хранение в памяти (register_layout.compact_register).
+    """
     
     for col in REGISTER_COLUMNS:
         if col not in register_df.columns:
@@ -76,44 +73,80 @@ try:
             else:
                 register_df[col] = 'Н/Д' 
     
-    # АГРЕССИВНАЯ ОЧИСТКА МНН
-    register_df['mnn'] = register_df['mnn'].astype(str)
-    register_df['mnn'] = register_df['mnn'].str.replace(r'[\r\n\t\ufeff\xa0]', ' ', regex=True).str.lower()
-    register_df['mnn'] = register_df['mnn'].str.replace(r'[^\w\s]', ' ', regex=True) 
-    register_df['mnn'] = register_df['mnn'].str.replace(r'\s+', ' ', regex=True).str.strip()
+    # АГРЕССИВНАЯ ОЧИСТКА МНН (та же нормализация, что и для наименований закупки)
+    register_df['mnn'] = normalize_names(register_df['mnn'])
 
 
     # Стандартизация дозировки
     register_df['dosage_standardized'] = register_df['dosage'].astype(str).apply(extract_dosage).str.strip()
+    # Числовая модель дозировки (значение, единица, ключ) для точного и допускового сравнения
+    register_df = pd.concat([register_df, dosage_columns(register_df['dosage_standardized'])], axis=1)
 
-    mnn_list = register_df['mnn'].unique().tolist()
-    
-    print(f"✅ Реестр загружен. Уникальных МНН: {len(mnn_list)}\n")
-    
-except FileNotFoundError:
-    print(f"❌ Критическая ошибка: Файл реестра '{REGISTER_FILENAME}' не найден. Проверьте имя!")
-    register_df = pd.DataFrame({col: [] for col in REGISTER_COLUMNS + ['dosage_standardized']})
-except Exception as e:
-    print(f"❌ Критическая ошибка при загрузке или обработке реестра: {e}")
-    traceback.print_exc()
-    register_df = pd.DataFrame({col: [] for col in REGISTER_COLUMNS + ['dosage_standardized']})
+    if compact:
+        register_df = compact_register(register_df)
+    return register_df
+
+
+def build_register(register_filename):
+    """Читает CSV реестра и подготавливает его (используется при пересборке кэша)."""
+    return prepare_register(pd.read_csv(register_filename, sep=';', encoding='utf-8'))
+
+# --------------------------------------------------------------------
+# 2.3 Удаление шумящих слов (одно регулярное выражение на весь список)
+# --------------------------------------------------------------------
+
+def _trie_regex(words):
+    """
+    Регулярное выражение-дерево для списка слов: общие префиксы записаны один раз,
+    поэтому в каждой позиции проверяется одна ветка, а не каждое слово списка.
+    Более длинное слово пробуется раньше своего префикса.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {} # конец слова
+
+    def emit(node):
+        branches = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+
+    return emit(trie)
+
+
+@lru_cache(maxsize=32)
+def noise_words_pattern(noise_words):
+    """
+    Скомпилированное выражение для удаления шумящих слов/фраз (кортеж) за один проход.
+    Слово удаляется только целиком (не внутри другого слова); из пересекающихся фраз
+    удаляется самая длинная. Кэшируется по содержимому списка; для пустого списка - None.
+    """
+    words = sorted({word for word in noise_words if word})
+    if not words:
+        return None
+    return re.compile(r'(?<!\w)' + _trie_regex(words) + r'(?!\w)')
 
 # ---
 # ====================================================================
 # 3. ФУНКЦИИ ПАРСИНГА И СОПОСТАВЛЕНИЯ ЗАЯВКИ
 # ====================================================================
 
-def find_best_mnn(name_clean, mnn_list):
+def find_best_mnn(name_clean, mnn_list, mnn_threshold=DEFAULT_MNN_THRESHOLD, scorer=fuzz.WRatio):
     """
-    Находит лучшее совпадение МНН с использованием RapidFuzz."""
+    Находит лучшее совпадение МНН с использованием RapidFuzz (одно наименование).
+    Для таблицы закупки используется пакетный resolve_mnn_batch."""
     if not name_clean or not mnn_list:
         return 'неизвестно', 0.0
 
     best_match = process.extractOne(
         query=name_clean, 
         choices=mnn_list, 
-        scorer=fuzz.WRatio, 
-        score_cutoff=80 
+        scorer=scorer, 
+        score_cutoff=mnn_threshold 
     )
     
     if best_match:
@@ -121,225 +154,612 @@ def find_best_mnn(name_clean, mnn_list):
     return 'неизвестно', 0.0
 
 
-def prepare_purchase_data(purchase_df):
-    """Очистка и стандартизация входных данных закупки."""
-    
-    purchase_df['trade_name_clean'] = purchase_df['item_name_raw'].astype(str).str.replace(r'[\r\n\t\ufeff\xa0]', ' ', regex=True).str.lower()
-    purchase_df['trade_name_clean'] = purchase_df['trade_name_clean'].str.replace(r'[^\w\s]', ' ', regex=True).str.replace(r'\s+', ' ', regex=True).str.strip().replace('', 'н/д')
-    
-    # 2. Парсинг Дозировки
-    purchase_df['dosage_standardized'] = purchase_df['trade_name_clean'].apply(extract_dosage).str.strip() 
-    
-    # 3. Создание mnn_search_clean (для чистого парсинга МНН)
-    dosage_pattern = r'(\d+[,\.]?\d*)\s*(мкг/доза|мг|ед|мл|г|мкг|МО|МЕ|%|mg|ml|g|mcg|IU)\s*[\+\/—]?\s*(\d+[,\.]?\d*)*\s*(мг|ед|мл|г|мкг|МО|МЕ|%|mg|ml|g|mcg|IU)*'
-    mnn_search_clean = purchase_df['trade_name_clean'].str.replace(dosage_pattern, ' ', flags=re.IGNORECASE, regex=True).str.replace(r'\s+', ' ', regex=True).str.strip()
-    
-    
-    # 4. Парсинг МНН
-    mnn_results = mnn_search_clean.apply(lambda x: find_best_mnn(x, mnn_list)).apply(pd.Series)
+# Результат score_purchase: исходная закупка, номер уникального наименования для каждой строки,
+# уникальные наименования (дозировка, лучший МНН и score без порога) и кэш score дозировок
+ScoredPurchase = namedtuple('ScoredPurchase', ['purchase_df', 'name_codes', 'names_df', 'dosage_cache'])
 
-    purchase_df['mnn_standardized'] = mnn_results[0].astype(str).str.strip().replace('', 'н/д')
-    purchase_df['mnn_match_score'] = mnn_results[1] 
-    
-    purchase_df['dosage_standardized'].replace('', 'н/д', inplace=True) 
-    purchase_df.drop(columns=['trade_name_clean'], errors='ignore', inplace=True) 
-    
-    return purchase_df
-
-def check_purchase_item_not_found(purchase_row):
-    """Создает стандартную строку 'Не найдено'."""
-    default_manufacturer = "Н/Д"
-    default_price = 0.0
-    return [{
-        "Status": "Не найдено", 
-        "Reg_Match_Name": "Нет соответствий", 
-        "Reg_Dosage_Original": "Н/Д", 
-        "Manufacturer": default_manufacturer, 
-        "Purchase_Price_USD": default_price, 
-        "Threshold_Price_USD": default_price, 
-        "Client_Price_USD": default_price, 
-        "Match_Score": 0.0
-    }]
-
-
-def check_purchase_item(purchase_row, register_df):
+
+class Matcher:
     """
-    Проверяет одну позицию закупки и возвращает СПИСОК ВСЕХ НАЙДЕННЫХ СОВПАДЕНИЙ.
+    Движок сопоставления закупок с реестром ЛС.
+
+    Создается из реестра (путь к CSV или DataFrame в формате CSV); реестр и его индекс
+    загружаются лениво при первом обращении и переиспользуются для любого числа
+    файлов закупки. Для CSV используется скомпилированный кэш (register_cache).
+
+    Параметры:
+        mnn_scorer        - scorer RapidFuzz для поиска МНН (WRatio в CLI, token_sort_ratio в app)
+        mnn_threshold     - порог score МНН
+        dosage_threshold  - порог score дозировки (Уровень 2)
+        noise_words       - слова/фразы, удаляемые из наименования перед парсингом
+        match_name_column - колонка реестра для 'Reg_Match_Name' ('trade_name' в CLI, 'mnn' в app)
+        use_cache         - использовать скомпилированный кэш реестра рядом с CSV
+        cdist_workers     - потоков RapidFuzz cdist (-1 - все ядра; 1 - внутри процесса пула)
+        engine            - 'vectorized' (merge по множествам) или 'legacy' (построчный match_item);
+                            результат одинаковый, 'legacy' оставлен для сравнения
+        mnn_blocking      - отбор кандидатов МНН по n-граммам (mnn_blocking), если в реестре
+                            не меньше BLOCKING_MIN_MNN МНН; наименование, лучший кандидат которого
+                            ниже mnn_threshold, ищется полным перебором. False - всегда полный перебор
+        exact_mnn         - МНН, входящий в наименование целиком (по словам), принимается
+                            со score 100 без нечеткого поиска; False - только нечеткий поиск
+        name_cache        - name_cache.NameCache: разбор наименований сохраняется между запусками
+                            (None - без кэша)
+        partial_limit     - не больше строк Уровня 3 на позицию: ближайшие по дозировке, затем
+                            дешевле (RegisterIndex.partial_candidates); остальные учитываются
+                            в 'Omitted_Candidates'. None или 0 - все строки МНН в порядке реестра
     """
 
-    mnn_std = purchase_row['mnn_standardized']
-    dosage_std = purchase_row['dosage_standardized'] 
-    
-    # 1. Уровень 1: Точное Совпадение (МНН + СТАНДАРТИЗИРОВАННАЯ Дозировка)
-    exact_match_results = register_df[
-        (register_df['mnn'] == mnn_std) & 
-        (register_df['dosage_standardized'] == dosage_std) 
-    ]
-    
-    if not exact_match_results.empty:
-        first_match = exact_match_results.iloc[0]
-        return [{
-            "Status": "Полное соответствие", 
-            "Reg_Match_Name": first_match['trade_name'], 
-            "Reg_Dosage_Original": first_match['dosage'], 
-            "Manufacturer": first_match['manufacturer'], 
-            "Purchase_Price_USD": first_match['purchase_price_USD'], 
-            "Known_Threshold_Price_USD": first_match['known_threshold_price_USD'], 
-            "Client_Price_USD": first_match['client_price_USD'], 
-            "Match_Score": 100.0
-        }]
-
-    # 2. Уровень 2: Нечеткий Поиск (Fuzzy Match) - ТОЛЬКО ПО ДОЗИРОВКЕ
-    
-    FUZZY_THRESHOLD = 75.0 
-    best_match_score = 0
-    
-    # *** ИСПРАВЛЕНИЕ ЛОГИКИ: Если МНН не найден, пропускаем Уровень 2 и 3, сразу "Не найдено" ***
-    if mnn_std == 'неизвестно':
-        return check_purchase_item_not_found(purchase_row)
+    def __init__(self, register, mnn_scorer=fuzz.WRatio, mnn_threshold=DEFAULT_MNN_THRESHOLD,
+                 dosage_threshold=DEFAULT_DOSAGE_THRESHOLD, noise_words=(), match_name_column='trade_name',
+                 use_cache=True, engine=ENGINE_VECTORIZED, cdist_workers=-1, mnn_blocking=True,
+                 exact_mnn=True, name_cache=None, partial_limit=DEFAULT_PARTIAL_LIMIT):
+        if engine not in ENGINES:
+            raise ValueError(f"Неизвестный движок сопоставления: {engine} (доступны: {', '.join(ENGINES)})")
+        self.register = register
+        self.mnn_scorer = mnn_scorer
+        self.mnn_threshold = mnn_threshold
+        self.dosage_threshold = dosage_threshold
+        self.noise_words = tuple(noise_words)
+        self.match_name_column = match_name_column
+        self.use_cache = use_cache
+        self.engine = engine
+        self.cdist_workers = cdist_workers
+        self.mnn_blocking = mnn_blocking
+        self.exact_mnn = exact_mnn
+        self.name_cache = name_cache
+        self.partial_limit = partial_limit
+
+        self.from_cache = False
+        self._register_df = None
+        self._register_index = None
+        self._mnn_list = None
+        self._vectorized_engine = None
+        self._mnn_candidate_index = None
+        self._mnn_token_trie = None
+
+    # --- Ленивая загрузка реестра ---
+
+    def load(self):
+        """Загружает и подготавливает реестр и индекс (если еще не загружены)."""
+        if self._register_df is not None:
+            return self
+
+        if isinstance(self.register, pd.DataFrame):
+            # Поверхностная копия: prepare_register заменяет колонки, а не изменяет их данные
+            register_df = prepare_register(self.register.copy(deep=False))
+            register_index = RegisterIndex(register_df)
+            self.register = None # исходный DataFrame больше не нужен
+        elif self.use_cache:
+            register_df, register_index, self.from_cache = load_compiled_register(self.register, build_register)
+        else:
+            register_df = build_register(self.register)
+            register_index = RegisterIndex(register_df)
+
+        self._register_df = register_df
+        self._register_index = register_index
+        self._mnn_list = register_df['mnn'].unique().tolist()
+        self._mnn_token_trie = MnnTokenTrie(self._mnn_list)
+        if len(self._mnn_list) >= BLOCKING_MIN_MNN:
+            self._mnn_candidate_index = MnnCandidateIndex(self._mnn_list)
+        if self.engine == ENGINE_VECTORIZED:
+            self._vectorized_engine = VectorizedEngine(register_df, register_index)
+        return self
+
+    @property
+    def register_df(self):
+        return self.load()._register_df
+
+    @property
+    def register_index(self):
+        return self.load()._register_index
+
+    @property
+    def mnn_list(self):
+        return self.load()._mnn_list
+
+    @property
+    def mnn_candidate_index(self):
+        """Индекс кандидатов МНН (None для небольшого реестра или при mnn_blocking=False)."""
+        self.load()
+        return self._mnn_candidate_index if self.mnn_blocking else None
+
+    @property
+    def mnn_token_trie(self):
+        """Дерево МНН по словам для точного этапа поиска (None при exact_mnn=False)."""
+        self.load()
+        return self._mnn_token_trie if self.exact_mnn else None
+
+    @property
+    def vectorized_engine(self):
+        """Таблицы реестра для векторизованного движка (строятся один раз, при первом обращении)."""
+        if self._vectorized_engine is None:
+            self._vectorized_engine = VectorizedEngine(self.register_df, self.register_index)
+        return self._vectorized_engine
+
+    def with_settings(self, **settings):
+        """Копия движка с другими настройками (порогами, шумящими словами), разделяющая загруженный реестр."""
+        matcher = Matcher.__new__(Matcher)
+        matcher.__dict__.update(self.__dict__)
+        for name, value in settings.items():
+            if not hasattr(matcher, name) or name.startswith('_'):
+                raise TypeError(f"Неизвестная настройка Matcher: {name}")
+            if name == 'engine' and value not in ENGINES:
+                raise ValueError(f"Неизвестный движок сопоставления: {value} (доступны: {', '.join(ENGINES)})")
+            setattr(matcher, name, tuple(value) if name == 'noise_words' else value)
+        return matcher
+
+    # --- Подготовка закупки ---
+
+    def score_purchase(self, purchase_df):
+        """
+        Очистка и стандартизация входных данных закупки, а также парсинг МНН БЕЗ ПОРОГА.
+        Парсинг выполняется один раз для каждого уникального наименования.
+
+        Возвращает ScoredPurchase: лучший МНН и его score для каждого уникального наименования
+        (порог МНН применяется потом, в apply_mnn_threshold), поэтому смена порогов
+        не требует повторного нечеткого сравнения.
+        """
         
-    filtered_df = register_df[register_df['mnn'] == mnn_std] 
-
-    # Ищем лучшую дозировку среди всех записей с найденным МНН
-    for index, row in filtered_df.iterrows():
-        reg_dosage_std = row['dosage_standardized'] 
-        if dosage_std == 'н/д' or reg_dosage_std == 'н/д': continue
-        score = fuzz.token_set_ratio(dosage_std, reg_dosage_std) 
-        if score > best_match_score:
-            best_match_score = score
-            best_match_dosage = row['dosage_standardized'] # Сохраняем лучшую стандартизированную дозировку
-            
-    if best_match_score >= FUZZY_THRESHOLD:
-        # Находим ВСЕ совпадения дозировки
-        all_dosage_matches = filtered_df[filtered_df['dosage_standardized'] == best_match_dosage]
+        # 0. Дедупликация: одинаковые item_name_raw очищаются один раз
+        raw_codes, raw_names = pd.factorize(purchase_df['item_name_raw'].astype(str))
         
-        results = []
-        for index, row in all_dosage_matches.iterrows():
-             results.append({
-                "Status": "Потенциальное соответствие", 
-                "Reg_Match_Name": row['trade_name'], 
-                "Reg_Dosage_Original": row['dosage'], 
-                "Manufacturer": row['manufacturer'], 
-                "Purchase_Price_USD": row['purchase_price_USD'], 
-                "Known_Threshold_Price_USD": row['known_threshold_price_USD'], 
-                "Client_Price_USD": row['client_price_USD'], 
-                "Match_Score": best_match_score # Fuzzy Score Дозировки
-            })
-        return results
-    
-    
-    # 3. Уровень 3: Частичное соответствие по МНН (дозировка не совпала или отсутствует)
-    if mnn_std != 'неизвестно':
-        mnn_matches = register_df[register_df['mnn'] == mnn_std]
+        # 1. Очистка торгового наименования за один обход (text_normalization, как и МНН реестра):
+        # нижний регистр, УДАЛЕНИЕ ШУМЯЩИХ СЛОВ (custom removal: весь список - одним выражением,
+        # слово/фраза заменяется пробелом, чтобы не склеить соседние слова), знаки и пробелы
+        names_clean = normalize_names(raw_names, noise_words_pattern(self.noise_words)).replace('', 'н/д')
         
-        if not mnn_matches.empty:
-            results = []
-            for index, row in mnn_matches.iterrows():
-                results.append({
-                    "Status": "Частичное соответствие МНН", 
-                    "Reg_Match_Name": row['trade_name'], 
-                    "Reg_Dosage_Original": row['dosage'], 
-                    "Manufacturer": row['manufacturer'], 
-                    "Purchase_Price_USD": row['purchase_price_USD'], 
-                    "Known_Threshold_Price_USD": row['known_threshold_price_USD'], 
-                    "Client_Price_USD": row['client_price_USD'], 
-                    "Match_Score": purchase_row['mnn_match_score'] # Fuzzy Score МНН
-                })
-            return results
-            
-    
-    # 4. Уровень 4: Не найдено (Должно быть отловлено в начале Уровня 2)
-    return check_purchase_item_not_found(purchase_row)
-
-
-# ---
-# ====================================================================
-# 4. ФУНКЦИЯ ДЛЯ СТИЛИЗАЦИИ РЕЗУЛЬТАТОВ
-# ====================================================================
-
-def highlight_matches_row(row):
-    """Применяет стили (зеленый/желтый/синий) к строкам на основе статуса."""
-    
-    green_style = 'background-color: #C6EFCE; color: #006100;' 
-    yellow_style = 'background-color: #FFEB9C; color: #9C6500;' 
-    blue_style = 'background-color: #BDD7EE; color: #000000;' # Частичное соответствие МНН
-    no_style = ''
-
-    if row['Status'] == 'Полное соответствие':
-        style = green_style
-    elif row['Status'] == 'Потенциальное соответствие':
-        style = yellow_style
-    elif row['Status'] == 'Частичное соответствие МНН':
-        style = blue_style
-    else:
-        style = no_style
+        # А. Уникальные очищенные наименования (разные raw могут дать одинаковое чистое название)
+        clean_codes, unique_clean = pd.factorize(names_clean)
+        name_codes = clean_codes[raw_codes]
+        names_df = pd.DataFrame({'trade_name_clean': unique_clean})
+
+        # Б. Кэш наименований: разбираются только наименования, которых нет в кэше
+        if self.name_cache is None:
+            parsed = self._parse_names(names_df['trade_name_clean'])
+        else:
+            context = self.name_cache_context()
+            cached = self.name_cache.lookup(context, unique_clean)
+            missing = names_df['trade_name_clean'][~names_df['trade_name_clean'].isin(cached.index)]
+            parsed_missing = self._parse_names(missing).set_axis(missing.to_numpy())
+            self.name_cache.store(context, parsed_missing)
+            parts = [part for part in (cached, parsed_missing) if len(part)] or [parsed_missing]
+            parsed = pd.concat(parts).reindex(unique_clean).reset_index(drop=True)
+            names_df.attrs['name_cache_stats'] = name_cache_stats(len(names_df), len(cached))
+
+        for col in NAME_COLUMNS:
+            names_df[col] = parsed[col].to_numpy()
+        if self.mnn_candidate_index is not None:
+            # Score блокировки точен для порогов не выше этого (см. _recheck_blocked_mnn)
+            names_df.attrs['mnn_fallback_score'] = self.mnn_threshold
         
-    return [style] * len(row)
-
-# ---
-# ====================================================================
-# 5. ГЛАВНЫЙ ИСПОЛНЯЕМЫЙ БЛОК
-# ====================================================================
+        return ScoredPurchase(purchase_df, name_codes, names_df, {})
 
-if __name__ == '__main__':
-    try:
-        # --- ЗАГРУЗКА ФАЙЛА ЗАЯВКИ ---
-        try:
-            purchase_df = pd.read_csv(PURCHASE_FILENAME, sep=';', encoding='utf-8')
-        except FileNotFoundError:
-            print(f"❌ Ошибка: Файл '{PURCHASE_FILENAME}' не найден.")
-            exit()
-
-        if purchase_df.empty:
-            print(f"⚠️ Внимание: Файл '{PURCHASE_FILENAME}' пуст. Прекращение работы.")
-            exit()
-            
-        # --- ПРЕДОБРАБОТКА ДАННЫХ ---
-        purchase_df = prepare_purchase_data(purchase_df)
-
-        # --- ДИАГНОСТИКА: ПАРСИНГ МНН (ВРЕМЕННЫЙ ВЫВОД) ---
-        print("\n=== ДИАГНОСТИКА: ПАРСИНГ МНН и ДОЗИРОВКИ ===")
-        print(purchase_df[['item_name_raw', 'mnn_standardized', 'dosage_standardized', 'mnn_match_score']])
-        print("========================================\n")
+    def _parse_names(self, names_clean):
+        """Парсинг дозировки и МНН (без порога) для очищенных наименований; колонки name_cache.NAME_COLUMNS."""
+        names_df = pd.DataFrame({'trade_name_clean': names_clean.to_numpy()})
         
-        # --- ЗАПУСК СОПОСТАВЛЕНИЯ И ДЕНОРМАЛИЗАЦИЯ (РАЗМНОЖЕНИЕ СТРОК) ---
-        print("⚙️ Запуск сопоставления...")
+        # 2-3. Парсинг Дозировки и mnn_search_clean (наименование без дозировки для парсинга МНН)
+        # за один проход по каждому наименованию
+        scanned = [scan_dosage(name) for name in names_df['trade_name_clean']]
+        names_df['dosage_standardized'] = pd.Series([dosage for dosage, _ in scanned], dtype=object).str.strip().replace('', 'н/д')
+        mnn_search_clean = pd.Series([stripped for _, stripped in scanned], dtype=object)
         
-        purchase_df['Matches'] = purchase_df.apply(lambda row: check_purchase_item(row, register_df), axis=1)
-
-        all_results_df = purchase_df.explode('Matches').reset_index(drop=True)
         
-        match_details = all_results_df['Matches'].apply(pd.Series)
+        # 4. Парсинг МНН: сначала точное вхождение МНН по словам (score 100), остальные - пакетно
+        # одним вызовом cdist на всех ядрах (для большого реестра - по кандидатам из индекса n-грамм)
+        # Без порога: лучший МНН при пороге p - тот же лучший МНН, если его score >= p
+        # Блокировка перепроверяет полным перебором наименования, лучший кандидат которых ниже порога МНН
+        mnn_results = resolve_mnn_batch(mnn_search_clean, self.mnn_list, scorer=self.mnn_scorer, score_cutoff=0,
+                                        workers=self.cdist_workers, candidate_index=self.mnn_candidate_index,
+                                        token_trie=self.mnn_token_trie, fallback_score=self.mnn_threshold)
+
+        names_df['best_mnn'] = mnn_results['mnn_standardized'].astype(str).str.strip().replace('', 'н/д')
+        names_df['best_mnn_score'] = mnn_results['mnn_match_score']
+        names_df['mnn_stage'] = mnn_results['mnn_stage']
+        return names_df[NAME_COLUMNS]
+
+    def name_cache_context(self):
+        """Ключ записей кэша наименований для текущего реестра и настроек поиска МНН."""
+        # С блокировкой score наименования зависит от порога МНН, при котором выполнен полный перебор
+        mnn_blocking = self.mnn_threshold if self.mnn_candidate_index is not None else False
+        return cache_context(self.mnn_list, self.mnn_scorer, exact_mnn=self.exact_mnn, mnn_blocking=mnn_blocking)
+
+    def _recheck_blocked_mnn(self, scored):
+        """
+        score_purchase с блокировкой точен для порогов МНН не выше mnn_fallback_score: наименования
+        с лучшим кандидатом ниже него уже найдены полным перебором. Если текущий порог выше,
+        наименования нечеткого этапа со score в [mnn_fallback_score, mnn_threshold) ищутся
+        полным перебором заново (иначе МНН, найденный полным перебором выше порога, был бы потерян).
+        Возвращает ScoredPurchase (тот же, если перепроверка не нужна).
+        """
+        names_df = scored.names_df
+        fallback_score = names_df.attrs.get('mnn_fallback_score')
+        if fallback_score is None or self.mnn_threshold <= fallback_score:
+            return scored
+
+        recheck = ((names_df['mnn_stage'] == MNN_STAGE_FUZZY)
+                   & (names_df['best_mnn_score'] >= fallback_score)
+                   & (names_df['best_mnn_score'] < self.mnn_threshold)).to_numpy()
+        names_df = names_df.copy()
+        if recheck.any():
+            parsed = self.with_settings(mnn_blocking=False)._parse_names(names_df.loc[recheck, 'trade_name_clean'])
+            for col in NAME_COLUMNS:
+                names_df.loc[recheck, col] = parsed[col].to_numpy()
+        names_df.attrs['mnn_fallback_score'] = self.mnn_threshold
+        return scored._replace(names_df=names_df)
+
+    def apply_mnn_threshold(self, scored):
+        """
+        Применяет порог МНН к результату score_purchase и размножает результаты
+        на исходные строки закупки (колонки mnn_standardized, dosage_standardized, mnn_match_score).
+        """
+        scored = self._recheck_blocked_mnn(scored)
+        names_df = scored.names_df
+        found = (names_df['best_mnn_score'] >= self.mnn_threshold).to_numpy()
+        mnn_standardized = np.where(found, names_df['best_mnn'].to_numpy(), UNKNOWN_MNN)
+        mnn_match_score = np.where(found, names_df['best_mnn_score'].to_numpy(), 0.0)
+
+        # 5. Размножение результатов на исходные строки закупки
+        purchase_df = scored.purchase_df.copy()
+        purchase_df['dosage_standardized'] = names_df['dosage_standardized'].to_numpy()[scored.name_codes]
+        purchase_df['mnn_standardized'] = mnn_standardized[scored.name_codes]
+        purchase_df['mnn_match_score'] = mnn_match_score[scored.name_codes]
         
-        final_df = pd.concat([all_results_df.drop(columns=['Matches']), match_details], axis=1)
-
-        final_df = final_df.drop(columns=['mnn_standardized', 'dosage_standardized', 'mnn_match_score'], errors='ignore')
+        purchase_df.attrs['dedup_stats'] = dedup_stats(len(purchase_df), len(names_df))
+        purchase_df.attrs['mnn_stage_stats'] = mnn_stage_stats(self.mnn_stages(scored))
+        if 'name_cache_stats' in names_df.attrs:
+            purchase_df.attrs['name_cache_stats'] = names_df.attrs['name_cache_stats']
+        
+        return purchase_df
+
+    def mnn_stages(self, scored):
+        """Этап поиска МНН (mnn_resolver.MNN_STAGES) для каждой строки закупки с учетом порога МНН."""
+        names_df = self._recheck_blocked_mnn(scored).names_df
+        found = (names_df['best_mnn_score'] >= self.mnn_threshold).to_numpy()
+        stages = np.where(found, names_df['mnn_stage'].to_numpy(), MNN_STAGE_NOT_FOUND)
+        return stages[scored.name_codes]
+
+    def prepare_purchase_data(self, purchase_df):
+        """
+        Очистка и стандартизация входных данных закупки, а также парсинг МНН с порогом mnn_threshold.
+        Парсинг выполняется один раз для каждого уникального наименования,
+        результат размножается обратно на все строки закупки.
+        """
+        return self.apply_mnn_threshold(self.score_purchase(purchase_df))
+
+    # --- Сопоставление ---
+
+    def match_item(self, purchase_row):
+        """
+        Проверяет одну позицию закупки и возвращает ItemMatch: позиции ВСЕХ НАЙДЕННЫХ строк
+        реестра, статус и score. Кандидаты берутся из индекса реестра (register_index),
+        а не фильтрацией всего реестра.
+        """
+        register_index = self.register_index
+
+        mnn_std = purchase_row['mnn_standardized']
+        dosage_std = purchase_row['dosage_standardized'] 
+        
+        # 1. Уровень 1: Точное Совпадение (МНН + СТАНДАРТИЗИРОВАННАЯ Дозировка)
+        # (сравнение по каноническому ключу: "0,5 г" == "500 мг" == "500 mg")
+        exact_positions = register_index.positions_for_key(mnn_std, parse_dosage(dosage_std).key)
         
-        # --- ВЫВОД РЕЗУЛЬТАТА НА ЭКРАН ---
-        print("\n=== РЕЗУЛЬТАТ АНАЛИЗА СПИСКА ЗАКУПОК (Построчный вывод) ===")
-        print(final_df[['item_name_raw', 'quantity', 'Status', 'Reg_Match_Name', 'Reg_Dosage_Original', 'Manufacturer', 
-                        'Purchase_Price_USD', 'Threshold_Price_USD', 'Client_Price_USD', 'Match_Score']])
-        print("========================================\n")
+        if len(exact_positions) > 0:
+            # Для точного совпадения берем только первую запись
+            return ItemMatch(exact_positions[:1], STATUS_EXACT, 100.0)
+
+        # *** ИСПРАВЛЕНИЕ ЛОГИКИ: Если МНН не найден, пропускаем Уровень 2 и 3, сразу "Не найдено" ***
+        if mnn_std == 'неизвестно':
+            return not_found_match()
+
+        # 2. Уровень 2: Поиск ближайшей дозировки - ТОЛЬКО ПО ДОЗИРОВКЕ
+        # Однокомпонентные дозировки сравниваются численно по отсортированному массиву индекса,
+        # составные/нераспознанные - нечетко (token_set_ratio) по уникальным дозировкам МНН
+        best_match_key, best_match_score = register_index.best_dosage(mnn_std, dosage_std)
+                
+        if best_match_key is not None and best_match_score >= self.dosage_threshold:
+            # ВСЕ совпадения дозировки с лучшим результатом, Score Дозировки (числовой или fuzzy)
+            return ItemMatch(register_index.positions_for_key(mnn_std, best_match_key), STATUS_POTENTIAL, best_match_score)
+        
+        
+        # 3. Уровень 3: Частичное соответствие по МНН (дозировка не совпала или отсутствует)
+        # Не больше partial_limit строк МНН: ближайшие по дозировке, затем дешевле
+        mnn_positions, omitted = register_index.partial_candidates(mnn_std, dosage_std, self.partial_limit or None)
+        
+        if len(mnn_positions) > 0:
+            # Fuzzy Score МНН
+            return ItemMatch(mnn_positions, STATUS_PARTIAL, purchase_row['mnn_match_score'], omitted)
+                
+        
+        # 4. Уровень 4: Не найдено
+        return not_found_match()
+
+    def check_purchase_item(self, purchase_row):
+        """Проверяет одну позицию закупки и возвращает СПИСОК ВСЕХ НАЙДЕННЫХ СОВПАДЕНИЙ (словари)."""
+        return item_match_dicts(self.register_df, self.match_item(purchase_row), self.match_name_column)
+
+    def check_item_name(self, item_name_raw):
+        """
+        Проверяет одно наименование закупки без DataFrame закупки (быстрый путь для одиночных
+        позиций, например запросов match_service): та же очистка, парсинг и порог МНН, что и
+        в prepare_purchase_data, затем check_purchase_item. Кэш наименований не используется.
+
+        Возвращает (позиция закупки: mnn_standardized, dosage_standardized, mnn_match_score;
+        список совпадений check_purchase_item).
+        """
+        name_clean = normalize_text(str(item_name_raw), noise_words_pattern(self.noise_words)) or 'н/д'
+        parsed = self._parse_names(pd.Series([name_clean], dtype=object)).iloc[0]
+
+        found = parsed['best_mnn_score'] >= self.mnn_threshold
+        purchase_row = {
+            'mnn_standardized': parsed['best_mnn'] if found else UNKNOWN_MNN,
+            'dosage_standardized': parsed['dosage_standardized'],
+            'mnn_match_score': float(parsed['best_mnn_score']) if found else 0.0,
+        }
+        return purchase_row, self.check_purchase_item(purchase_row)
+
+    def match_results(self, purchase_df, dosage_cache=None):
+        """
+        Сопоставляет подготовленную закупку (после prepare_purchase_data) и возвращает
+        MatchResults: массивы (строка закупки, позиция строки реестра, статус, score).
+
+        dosage_cache - словарь (МНН, дозировка) -> лучшая дозировка реестра без порога;
+        переиспользуется между запусками с разными порогами (движок 'vectorized').
+        """
+        # Сопоставление выполняется один раз для каждой уникальной позиции
+        if self.engine == ENGINE_LEGACY:
+            key_codes, unique_matches = match_unique_items(purchase_df, self.match_item)
+            unique_results = collect_item_matches(unique_matches)
+        else:
+            key_codes, unique_rows = unique_match_keys(purchase_df)
+            unique_results = self.vectorized_engine.match_unique(unique_rows, self.dosage_threshold,
+                                                                  workers=self.cdist_workers, dosage_cache=dosage_cache,
+                                                                  partial_limit=self.partial_limit or None)
+
+        return expand_unique_results(key_codes, unique_results)
+
+    def match_prepared(self, purchase_df, dosage_cache=None):
+        """
+        Сопоставляет подготовленную закупку и размножает строки для всех совпадений.
+        Возвращает итоговую таблицу без промежуточных колонок.
+        """
+        # Результат собирается из массивов позиций (take по закупке и по колонкам реестра)
+        results = self.match_results(purchase_df, dosage_cache)
+        return build_result_table(purchase_df, self.register_df, results, self.match_name_column)
+
+    def match_scored(self, scored):
+        """
+        Применяет текущие пороги к результату score_purchase и сопоставляет закупку.
+        Нечеткое сравнение МНН не повторяется, score дозировок берутся из кэша scored.
+        """
+        return self.match_prepared(self.apply_mnn_threshold(scored), scored.dosage_cache)
+
+    def match(self, purchase_df):
+        """Полный цикл: подготовка закупки и сопоставление с реестром."""
+        return self.match_prepared(self.prepare_purchase_data(purchase_df))
 
-        # --- ЭКСПОРТ В EXCEL (С СТИЛИЗАЦИЕЙ) ---
-        EXPORT_FOLDER = 'export_results'
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        EXPORT_FILENAME = f'matching_results_{timestamp}.xlsx'
-        EXPORT_PATH = os.path.join(EXPORT_FOLDER, EXPORT_FILENAME)
 
-        if not os.path.exists(EXPORT_FOLDER):
-            os.makedirs(EXPORT_FOLDER)
+# ---
+# ====================================================================
+# 4. ГЛАВНЫЙ ИСПОЛНЯЕМЫЙ БЛОК
+# ====================================================================
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Сопоставление списка закупок с реестром ЛС.")
+    parser.add_argument('--register', default=REGISTER_FILENAME, help="CSV реестра ЛС (по умолчанию: %(default)s)")
+    parser.add_argument('--purchase', default=PURCHASE_FILENAME, help="CSV списка закупок (по умолчанию: %(default)s)")
+    parser.add_argument('--input', help="Сырая заявка (.xlsx/.csv) вместо --purchase: колонки определяются "
+                                        "автоматически и очищаются в памяти, без промежуточного purchase_input.csv")
+    parser.add_argument('--stream', action='store_true',
+                        help="Потоковый режим: закупка читается частями, результат дописывается в --output")
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE,
+                        help="Строк закупки в одной части для --stream (по умолчанию: %(default)s)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Процессов для параллельного сопоставления (по умолчанию: %(default)s - без пула); "
+                             "в режиме --batch - одновременно обрабатываемых заявок")
+    parser.add_argument('--batch', nargs='?', const=DEFAULT_BATCH_SOURCE, metavar='ПАПКА_ИЛИ_ШАБЛОН',
+                        help="Пакетный режим: все заявки (.xlsx/.csv) папки или шаблона glob "
+                             f"(по умолчанию: {DEFAULT_BATCH_SOURCE}) - по файлу результата в export_results/")
+    parser.add_argument('--batch-format', default='.xlsx', choices=BATCH_OUTPUT_FORMATS,
+                        help="Формат результатов --batch (по умолчанию: %(default)s)")
+    parser.add_argument('--force', action='store_true',
+                        help="--batch: обработать заново и заявки, для которых результат уже есть")
+    parser.add_argument('--partial-limit', type=int, default=DEFAULT_PARTIAL_LIMIT,
+                        help="Не больше строк 'Частичное соответствие МНН' на позицию закупки "
+                             "(по умолчанию: %(default)s; 0 - все строки МНН)")
+    parser.add_argument('--name-cache', default=DEFAULT_NAME_CACHE,
+                        help="SQLite-кэш разбора наименований между запусками (по умолчанию: %(default)s)")
+    parser.add_argument('--no-name-cache', action='store_true', help="Не использовать кэш наименований")
+    parser.add_argument('--output', help=f"Файл результата для --stream ({', '.join(OUTPUT_FORMATS)}); "
+                                         "по умолчанию export_results/matching_results_<время>.csv")
+    args = parser.parse_args(argv)
+    if args.output and not args.stream:
+        parser.error("--output используется только вместе с --stream")
+    if args.batch and (args.stream or args.input):
+        parser.error("--batch не используется вместе с --stream и --input")
+    return args
+
+
+def print_run_stats(attrs):
+    """
+    Статистика подготовки закупки из attrs результата (prepare_purchase_data или ParallelMatcher.match):
+    дедупликация, этапы поиска МНН и, если используется, кэш наименований.
+    """
+    stats = attrs['dedup_stats']
+    print(f"♻️ Дедупликация: {stats['total_rows']} строк -> {stats['unique_rows']} уникальных наименований "
+          f"(повторы: {stats['dedup_ratio']:.0%})")
+    stages = attrs['mnn_stage_stats']
+    print(f"🎯 Поиск МНН: точное вхождение {stages['exact']} строк, нечеткий поиск {stages['fuzzy']}, "
+          f"не найдено {stages['not_found']}")
+    if 'name_cache_stats' in attrs:
+        cache = attrs['name_cache_stats']
+        print(f"🗃️ Кэш наименований: найдено {cache['hits']} из {cache['lookups']} (попадания: {cache['hit_rate']:.0%})")
+
+
+def run_stream(matcher, purchase_filename, output_path, chunksize, raw_input=False):
+    """
+    Потоковый режим: части закупки сопоставляются и сразу дописываются в CSV/Parquet.
+    raw_input - сырая заявка (.xlsx/.csv), части читаются через purchase_ingest.
+    """
+    print(f"🌊 Потоковый режим: '{purchase_filename}' частями по {chunksize} строк -> {output_path}")
+
+    def report(chunk_number, purchase_rows, result_rows):
+        print(f"   Часть {chunk_number}: {purchase_rows} строк закупки -> {result_rows} строк результата")
+
+    read_chunks = read_raw_purchase_chunks if raw_input else read_purchase_chunks
+    summary = match_stream(matcher, read_chunks(purchase_filename, chunksize), output_path, on_chunk=report)
+
+    print(f"\n✅ Обработано строк закупки: {summary['purchase_rows']}, строк результата: {summary['result_rows']}")
+    for status, count in summary['statuses'].items():
+        print(f"   {status}: {count}")
+    if 'name_cache' in summary:
+        cache = summary['name_cache']
+        print(f"🗃️ Кэш наименований: найдено {cache['hits']} из {cache['lookups']} (попадания: {cache['hit_rate']:.0%})")
+    print(f"✅ Результаты сохранены в файл: {output_path}")
+
+
+def run_batch(matcher, register_filename, source, output_dir, workers, output_format, force):
+    """Пакетный режим: заявки папки/шаблона сопоставляются пулом процессов с одним загруженным реестром."""
+    paths = find_purchase_files(source)
+    if not paths:
+        print(f"⚠️ Внимание: В '{source}' нет файлов заявок ({', '.join(RAW_EXTENSIONS)}).")
+        return
+    print(f"📦 Пакетный режим: {len(paths)} заявок из '{source}' ({min(workers, len(paths))} процессов) -> {output_dir}")
+
+    def report(summary):
+        name = os.path.basename(summary['input'])
+        if summary['status'] == FILE_MATCHED:
+            print(f"   ✅ {name}: {summary['purchase_rows']} строк закупки -> {summary['result_rows']} строк результата "
+                  f"({summary['output']})")
+        elif 'duplicate_of' in summary:
+            print(f"   ⏭️ {name}: то же содержимое, что и {os.path.basename(summary['duplicate_of'])} ({summary['output']})")
+        elif summary['status'] == FILE_SKIPPED:
+            print(f"   ⏭️ {name}: результат уже есть ({summary['output']})")
+        else:
+            print(f"   ❌ {name}: {summary['error']}")
+
+    summaries = match_files(matcher, paths, output_dir, file_hash(register_filename), workers=workers,
+                            output_format=output_format, force=force, on_file=report)
+    counts = {status: sum(summary['status'] == status for summary in summaries)
+              for status in (FILE_MATCHED, FILE_SKIPPED, FILE_FAILED)}
+    print(f"\n✅ Обработано заявок: {counts[FILE_MATCHED]}, пропущено (результат уже есть): {counts[FILE_SKIPPED]}, "
+          f"с ошибками: {counts[FILE_FAILED]}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    register_filename = args.register
+    purchase_filename = args.input or args.purchase
+    EXPORT_FOLDER = 'export_results'
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    try:
+        # --- ЗАГРУЗКА РЕЕСТРА ---
+        print(f"🔍 Попытка загрузки реестра: {register_filename}...")
+        name_cache = None if args.no_name_cache else NameCache(args.name_cache)
+        matcher = Matcher(register_filename, name_cache=name_cache, partial_limit=args.partial_limit)
+        started = time.perf_counter()
         try:
-            styled_df = final_df.style.apply(highlight_matches_row, axis=1)
-            styled_df.to_excel(EXPORT_PATH, index=False, engine='openpyxl')
+            matcher.load()
+        except FileNotFoundError:
+            print(f"❌ Критическая ошибка: Файл реестра '{register_filename}' не найден. Проверьте имя!")
+            return
+        source = "из кэша" if matcher.from_cache else "и сохранен в кэш"
+        print(f"✅ Реестр загружен {source} за {time.perf_counter() - started:.2f} с. "
+              f"Уникальных МНН: {len(matcher.mnn_list)}\n")
+
+        # --- ПАКЕТНЫЙ РЕЖИМ (все заявки папки, по процессу на заявку) ---
+        if args.batch:
+            run_batch(matcher, register_filename, args.batch, EXPORT_FOLDER, args.workers, args.batch_format, args.force)
+            return
+
+        # --- ПАРАЛЛЕЛЬНЫЙ РЕЖИМ (пул процессов, реестр наследуется через fork) ---
+        parallel = ParallelMatcher(matcher, args.workers) if args.workers > 1 else None
+        try:
+            # --- ПОТОКОВЫЙ РЕЖИМ (большие файлы закупки) ---
+            if args.stream:
+                output_path = args.output or os.path.join(EXPORT_FOLDER, f'matching_results_{timestamp}.csv')
+                if os.path.dirname(output_path):
+                    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                try:
+                    run_stream(parallel or matcher, purchase_filename, output_path, args.chunksize,
+                               raw_input=bool(args.input))
+                except FileNotFoundError:
+                    print(f"❌ Ошибка: Файл '{purchase_filename}' не найден.")
+                except ValueError as e:
+                    print(f"❌ Ошибка чтения заявки: {e}")
+                return
+
+            # --- ЗАГРУЗКА ФАЙЛА ЗАЯВКИ ---
+            # --input: сырая заявка (.xlsx/.csv) читается, маппится и очищается сразу в памяти
+            try:
+                if args.input:
+                    purchase_df = read_raw_purchase(purchase_filename)
+                else:
+                    purchase_df = pd.read_csv(purchase_filename, sep=';', encoding='utf-8')
+            except FileNotFoundError:
+                print(f"❌ Ошибка: Файл '{purchase_filename}' не найден.")
+                return
+            except ValueError as e:
+                print(f"❌ Ошибка чтения заявки: {e}")
+                return
+
+            if purchase_df.empty:
+                print(f"⚠️ Внимание: Файл '{purchase_filename}' пуст. Прекращение работы.")
+                return
+            
+            if parallel is not None:
+                # --- ПОДГОТОВКА И СОПОСТАВЛЕНИЕ В ПУЛЕ ПРОЦЕССОВ ---
+                print(f"⚙️ Запуск сопоставления ({parallel.workers} процессов)...")
+                final_df = parallel.match(purchase_df)
+                print_run_stats(final_df.attrs)
+            else:
+                # --- ПРЕДОБРАБОТКА ДАННЫХ ---
+                purchase_df = matcher.prepare_purchase_data(purchase_df)
+                print_run_stats(purchase_df.attrs)
+
+                # --- ДИАГНОСТИКА: ПАРСИНГ МНН (ВРЕМЕННЫЙ ВЫВОД) ---
+                print("\n=== ДИАГНОСТИКА: ПАРСИНГ МНН и ДОЗИРОВКИ ===")
+                print(purchase_df[['item_name_raw', 'mnn_standardized', 'dosage_standardized', 'mnn_match_score']])
+                print("========================================\n")
             
-            print(f"✅ Результаты успешно сохранены в файл: {EXPORT_PATH} (Включая цветовое выделение)")
-        except ImportError:
-            print("⚠️ Ошибка: Для экспорта в Excel со стилями необходимо установить библиотеку openpyxl.")
-            print("   Выполните команду в Терминале: pip install openpyxl")
+                # --- ЗАПУСК СОПОСТАВЛЕНИЯ И ДЕНОРМАЛИЗАЦИЯ (РАЗМНОЖЕНИЕ СТРОК) ---
+                print("⚙️ Запуск сопоставления...")
+                final_df = matcher.match_prepared(purchase_df)
+        
+            # --- ВЫВОД РЕЗУЛЬТАТА НА ЭКРАН ---
+            print("\n=== РЕЗУЛЬТАТ АНАЛИЗА СПИСКА ЗАКУПОК (Построчный вывод) ===")
+            print(final_df[['item_name_raw', 'quantity', 'Status', 'Reg_Match_Name', 'Reg_Dosage_Original', 'Manufacturer', 
+                            'Purchase_Price_USD', 'Known_Threshold_Price_USD', 'Client_Price_USD', 'Match_Score',
+                            'Omitted_Candidates']])
+            print("========================================\n")
+
+            # --- ЭКСПОРТ В EXCEL (С СТИЛИЗАЦИЕЙ) ---
+            EXPORT_FILENAME = f'matching_results_{timestamp}.xlsx'
+            EXPORT_PATH = os.path.join(EXPORT_FOLDER, EXPORT_FILENAME)
+
+            if not os.path.exists(EXPORT_FOLDER):
+                os.makedirs(EXPORT_FOLDER)
+
+            try:
+                from excel_export import CLI_STATUS_COLORS, write_results_excel
+
+                # Цвет строк по статусу (зеленый/желтый/синий) - условным форматированием, без Styler
+                write_results_excel(final_df, EXPORT_PATH, CLI_STATUS_COLORS)
+                print(f"✅ Результаты успешно сохранены в файл: {EXPORT_PATH} (Включая цветовое выделение)")
+            except ImportError:
+                print("⚠️ Ошибка: Для экспорта в Excel со стилями необходимо установить библиотеку openpyxl.")
+                print("   Выполните команду в Терминале: pip install openpyxl")
+
+        finally:
+            if parallel is not None:
+                parallel.close()
 
     except Exception as e:
         # Ловит все остальные необработанные ошибки 
         print(f"\n❌ Критическая ошибка в главном блоке обработки: {e}")
-        traceback.print_exc()
\ No newline at end of file
+        traceback.print_exc()
+
+
+if __name__ == '__main__':
+    main()
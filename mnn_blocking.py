@@ -0,0 +1,149 @@
+import sys
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+# ====================================================================
+# БЛОКИРОВКА ДЛЯ ПОИСКА МНН (инвертированный индекс символьных n-грамм)
+# ====================================================================
+
+NGRAM_SIZE = 3
+
+# Кандидатов на запрос по каждой мере сходства n-грамм (см. MnnCandidateIndex.candidates)
+CANDIDATES_PER_MEASURE = 128
+
+# n-граммы, встречающиеся более чем в этой доле МНН, не различают МНН и не индексируются
+MAX_NGRAM_FRACTION = 0.05
+
+# Индекс строится, только если МНН в списке не меньше (на малых списках cdist быстрее)
+BLOCKING_MIN_MNN = 2000
+
+
+def _ngrams(text, n=NGRAM_SIZE):
+    """Уникальные символьные n-граммы строки с пробелами по краям."""
+    padded = f' {text} '
+    return {padded[i:i + n] for i in range(max(1, len(padded) - n + 1))}
+
+
+class MnnCandidateIndex:
+    """
+    Инвертированный индекс n-грамм по mnn_list: для запроса за время, зависящее
+    от длины списков вхождений его n-грамм (а не от числа МНН), отбирает небольшое
+    множество кандидатов, которое затем точно оценивается scorer'ом RapidFuzz.
+
+    Кандидаты - объединение лучших по двум мерам:
+      - число общих n-грамм (длинные МНН, похожие на запрос целиком);
+      - доля n-грамм МНН, найденных в запросе (короткий МНН внутри длинного наименования).
+    """
+
+    def __init__(self, mnn_list, ngram_size=NGRAM_SIZE, max_ngram_fraction=MAX_NGRAM_FRACTION,
+                 candidates_per_measure=CANDIDATES_PER_MEASURE):
+        self.mnn_list = list(mnn_list)
+        self.ngram_size = ngram_size
+        self.candidates_per_measure = candidates_per_measure
+
+        postings = {}
+        self.ngram_counts = np.zeros(len(self.mnn_list), dtype=np.int32)
+        for mnn_id, mnn in enumerate(self.mnn_list):
+            grams = _ngrams(mnn, ngram_size)
+            self.ngram_counts[mnn_id] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(mnn_id)
+
+        max_postings = max(1, int(max_ngram_fraction * len(self.mnn_list)))
+        self.postings = {
+            gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items() if len(ids) <= max_postings
+        }
+
+    def candidates(self, query):
+        """Отсортированные номера МНН-кандидатов для запроса (может быть пустым)."""
+        lists = [self.postings[gram] for gram in _ngrams(query, self.ngram_size) if gram in self.postings]
+        if not lists:
+            return np.empty(0, dtype=np.int32)
+
+        ids, shared = np.unique(np.concatenate(lists), return_counts=True)
+        k = self.candidates_per_measure
+        if len(ids) <= 2 * k:
+            return ids
+
+        by_shared = np.argpartition(-shared, k)[:k]
+        by_containment = np.argpartition(-(shared / self.ngram_counts[ids]), k)[:k]
+        return np.unique(ids[np.concatenate([by_shared, by_containment])])
+
+    def best(self, queries, scorer, score_cutoff=0):
+        """
+        Лучший МНН среди кандидатов для каждого запроса.
+
+        Возвращает (номера МНН, score); -1, если кандидатов нет или все ниже score_cutoff.
+        При равных score выбирается МНН с меньшим номером (как extractOne по всему списку).
+        """
+        best_idx = np.full(len(queries), -1, dtype=np.intp)
+        best_score = np.zeros(len(queries), dtype=np.float64)
+
+        for i, query in enumerate(queries):
+            ids = self.candidates(query)
+            if not len(ids):
+                continue
+            match = process.extractOne(query, [self.mnn_list[j] for j in ids], scorer=scorer,
+                                       processor=None, score_cutoff=score_cutoff)
+            if match is not None:
+                best_idx[i] = ids[match[2]]
+                best_score[i] = match[1]
+        return best_idx, best_score
+
+
+def verify_recall(mnn_list, queries, scorer=fuzz.WRatio, index=None, min_score=0):
+    """
+    Самопроверка блокировки: сравнивает лучший МНН среди кандидатов с полным перебором.
+
+    Учитываются запросы, у которых score полного перебора не меньше min_score
+    (например, порог МНН: ниже порога МНН все равно не будет найден).
+    Возвращает словарь: число запросов, доля запросов, где лучший score кандидатов равен
+    лучшему score полного перебора (recall), и примеры расхождений.
+    """
+    index = index or MnnCandidateIndex(mnn_list)
+    queries = list(queries)
+
+    blocked_idx, blocked_score = index.best(queries, scorer)
+    scores = process.cdist(queries, mnn_list, scorer=scorer, dtype=np.float64)
+    brute_idx = scores.argmax(axis=1)
+    brute_score = scores[np.arange(len(queries)), brute_idx]
+
+    counted = brute_score >= min_score
+    same = blocked_score[counted] >= brute_score[counted]
+    misses = [(queries[i], mnn_list[brute_idx[i]], brute_score[i], blocked_score[i])
+              for i in np.flatnonzero(counted)[~same][:10]]
+    return {'queries': int(counted.sum()), 'recall': float(same.mean()) if len(same) else 1.0, 'misses': misses}
+
+
+def _noisy_queries(mnn_list, n, seed=0):
+    """Запросы для самопроверки: МНН с опечаткой, лишними словами и перестановкой слов."""
+    rng = np.random.default_rng(seed)
+    noise = ['таблетки', 'р-р', 'для', 'инъекций', 'капсулы', 'упаковка', 'форте']
+    queries = []
+    for mnn in rng.choice(mnn_list, size=n):
+        words = mnn.split()
+        if len(words) > 1 and rng.random() < 0.3:
+            words = words[::-1]
+        text = ' '.join(words)
+        if len(text) > 4 and rng.random() < 0.5:
+            pos = int(rng.integers(len(text)))
+            text = text[:pos] + text[pos + 1:]
+        queries.append(' '.join([text] + list(rng.choice(noise, size=int(rng.integers(0, 3))))))
+    return queries
+
+
+if __name__ == '__main__':
+    # python mnn_blocking.py [register_ls.csv] - проверка recall на зашумленных МНН реестра
+    from matching_script import build_register
+
+    register_path = sys.argv[1] if len(sys.argv) > 1 else 'register_ls.csv'
+    mnn_list = build_register(register_path)['mnn'].unique().tolist()
+    queries = _noisy_queries(mnn_list, 500)
+    for scorer in (fuzz.WRatio, fuzz.token_sort_ratio):
+        for min_score in (0, 80):
+            report = verify_recall(mnn_list, queries, scorer=scorer, min_score=min_score)
+            print(f"{scorer.__name__} (score >= {min_score}): запросов {report['queries']}, "
+                  f"recall {report['recall']:.3f}")
+            for miss in report['misses']:
+                print("   ", miss)
@@ -0,0 +1,166 @@
+import numpy as np
+import pandas as pd
+from rapidfuzz import process
+
+# ====================================================================
+# ПАКЕТНЫЙ ПОИСК МНН (точное вхождение по словам, затем RapidFuzz cdist)
+# ====================================================================
+
+UNKNOWN_MNN = 'неизвестно'
+
+# Этап, на котором найден МНН наименования (статистика mnn_stage_stats)
+MNN_STAGE_EXACT = 'exact'         # МНН целиком входит в наименование (score 100)
+MNN_STAGE_FUZZY = 'fuzzy'         # нечеткий поиск RapidFuzz
+MNN_STAGE_NOT_FOUND = 'not_found' # score ниже порога МНН
+MNN_STAGES = (MNN_STAGE_EXACT, MNN_STAGE_FUZZY, MNN_STAGE_NOT_FOUND)
+
+# Ключ словаря узла MnnTokenTrie, под которым хранится номер МНН, заканчивающегося в узле
+_TRIE_END = None
+
+# Максимальное число ячеек матрицы score в одном блоке cdist (float64 -> ~16 МБ)
+CDIST_CHUNK_CELLS = 2_000_000
+
+
+class MnnTokenTrie:
+    """
+    Префиксное дерево МНН по словам: находит МНН, входящие в наименование
+    целиком как последовательность слов (в т.ч. многословные: 'ацетилсалициловая кислота').
+
+    МНН реестра и наименования закупки очищены одинаково (нижний регистр, знаки
+    препинания заменены пробелами), поэтому слова сравниваются как есть.
+    """
+
+    def __init__(self, mnn_list):
+        self.mnn_list = list(mnn_list)
+        self.root = {}
+        # Длина МНН для выбора самого длинного вхождения: (слов, символов)
+        self.lengths = [(len(mnn.split()), len(mnn)) for mnn in self.mnn_list]
+        for mnn_id, mnn in enumerate(self.mnn_list):
+            tokens = mnn.split()
+            if not tokens:
+                continue
+            node = self.root
+            for token in tokens:
+                node = node.setdefault(token, {})
+            # При дубликатах остается первый МНН списка
+            node.setdefault(_TRIE_END, mnn_id)
+
+    def find(self, name):
+        """
+        Номер МНН, входящего в наименование как последовательность слов, или -1.
+        Из нескольких вхождений выбирается самое длинное (по словам, затем по символам),
+        при равной длине - первое в наименовании.
+        """
+        tokens = name.split()
+        best_id, best_length = -1, (0, 0)
+        for start in range(len(tokens)):
+            node = self.root
+            for token in tokens[start:]:
+                node = node.get(token)
+                if node is None:
+                    break
+                mnn_id = node.get(_TRIE_END)
+                if mnn_id is not None and self.lengths[mnn_id] > best_length:
+                    best_id, best_length = mnn_id, self.lengths[mnn_id]
+        return best_id
+
+
+def mnn_stage_stats(stages):
+    """Число строк по этапам поиска МНН (MNN_STAGES) для массива этапов по строкам."""
+    values, counts = np.unique(np.asarray(stages, dtype=object), return_counts=True)
+    found = dict(zip(values, counts))
+    return {stage: int(found.get(stage, 0)) for stage in MNN_STAGES}
+
+
+def _brute_force_best(queries, mnn_list, scorer, score_cutoff, workers):
+    """Полный перебор: (номер лучшего МНН или -1, score) для каждого запроса через cdist блоками."""
+    best_idx = np.full(len(queries), -1, dtype=np.intp)
+    best_score = np.zeros(len(queries), dtype=np.float64)
+    chunk_size = max(1, CDIST_CHUNK_CELLS // len(mnn_list))
+
+    for start in range(0, len(queries), chunk_size):
+        scores = process.cdist(
+            queries[start:start + chunk_size],
+            mnn_list,
+            scorer=scorer,
+            score_cutoff=score_cutoff,
+            dtype=np.float64,
+            workers=workers,
+        )
+        # argmax возвращает первый максимум -> тот же МНН, что и extractOne
+        chunk_idx = scores.argmax(axis=1)
+        chunk_scores = scores[np.arange(len(chunk_idx)), chunk_idx]
+        found = chunk_scores >= score_cutoff
+
+        best_idx[start:start + chunk_size] = np.where(found, chunk_idx, -1)
+        best_score[start:start + chunk_size] = np.where(found, chunk_scores, 0.0)
+    return best_idx, best_score
+
+
+def resolve_mnn_batch(names, mnn_list, scorer, score_cutoff, workers=-1, candidate_index=None, token_trie=None,
+                      fallback_score=100):
+    """
+    Находит лучшее совпадение МНН сразу для всех наименований.
+
+    token_trie (MnnTokenTrie) - быстрый этап: если МНН входит в наименование целиком
+    (последовательностью слов), он выбирается сразу со score 100, без нечеткого сравнения.
+
+    Остальные уникальные наименования сравниваются со всем mnn_list одним вызовом
+    process.cdist (блоками, на всех ядрах при workers=-1). Результат совпадает
+    с построчным process.extractOne: при равных score выбирается первый МНН списка.
+
+    candidate_index (mnn_blocking.MnnCandidateIndex) - блокировка для больших mnn_list:
+    каждое наименование оценивается только по своим кандидатам, а если лучший кандидат
+    ниже fallback_score (или кандидатов нет), - полным перебором. При fallback_score, равном
+    порогу МНН, МНН найден по порогу тогда и только тогда, когда он найден полным перебором:
+    кандидат ниже порога перепроверяется, а score полного перебора не меньше score кандидата.
+
+    Возвращает DataFrame с колонками 'mnn_standardized', 'mnn_match_score' и 'mnn_stage'
+    (MNN_STAGE_EXACT или MNN_STAGE_FUZZY) с тем же индексом, что и names.
+    """
+    names = pd.Series(names)
+    codes, unique_names = pd.factorize(names.astype(str))
+
+    best_mnn = np.full(len(unique_names), UNKNOWN_MNN, dtype=object)
+    best_score = np.zeros(len(unique_names), dtype=np.float64)
+    stage = np.full(len(unique_names), MNN_STAGE_FUZZY, dtype=object)
+
+    # Пустые наименования не ищем (как и find_best_mnn)
+    query_positions = np.flatnonzero(unique_names.str.len() > 0) if len(unique_names) else np.empty(0, dtype=np.intp)
+
+    if len(query_positions) and mnn_list:
+        choices = np.asarray(mnn_list, dtype=object)
+
+        # 1. Точное вхождение МНН по словам: score 100, нечеткий поиск не нужен
+        if token_trie is not None:
+            exact_idx = np.array([token_trie.find(name) for name in unique_names[query_positions]], dtype=np.intp)
+            exact = exact_idx >= 0
+            best_mnn[query_positions[exact]] = choices[exact_idx[exact]]
+            best_score[query_positions[exact]] = 100.0
+            stage[query_positions[exact]] = MNN_STAGE_EXACT
+            query_positions = query_positions[~exact]
+
+        # 2. Нечеткий поиск для остальных
+        queries = unique_names[query_positions].tolist()
+
+        if not queries:
+            idx, score = np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float64)
+        elif candidate_index is not None:
+            idx, score = candidate_index.best(queries, scorer, score_cutoff)
+            fallback = np.flatnonzero((idx < 0) | (score < fallback_score))
+            if len(fallback):
+                idx[fallback], score[fallback] = _brute_force_best(
+                    [queries[i] for i in fallback], mnn_list, scorer, score_cutoff, workers
+                )
+        else:
+            idx, score = _brute_force_best(queries, mnn_list, scorer, score_cutoff, workers)
+
+        found = idx >= 0
+        best_mnn[query_positions[found]] = choices[idx[found]]
+        best_score[query_positions[found]] = score[found]
+
+    return pd.DataFrame({
+        'mnn_standardized': best_mnn[codes],
+        'mnn_match_score': best_score[codes],
+        'mnn_stage': stage[codes],
+    }, index=names.index)
@@ -0,0 +1,153 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from register_cache import REGISTER_PIPELINE_VERSION
+
+# ====================================================================
+# ПОСТОЯННЫЙ КЭШ РАЗБОРА НАИМЕНОВАНИЙ ЗАКУПКИ (SQLite, между запусками)
+# ====================================================================
+
+# Версия сохраненных результатов поиска МНН. Увеличивайте при изменении mnn_resolver
+# (этапы поиска, выбор лучшего МНН) - записи старой версии перестанут использоваться.
+NAME_CACHE_VERSION = 1
+
+DEFAULT_NAME_CACHE = 'name_cache.sqlite'
+DEFAULT_MAX_ENTRIES = 1_000_000
+
+# Колонки результата разбора наименования (как в ScoredPurchase.names_df)
+NAME_COLUMNS = ['dosage_standardized', 'best_mnn', 'best_mnn_score', 'mnn_stage']
+
+# Наименований в одном SQL-запросе (ограничение SQLite на число параметров)
+_QUERY_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS names (
+    context TEXT NOT NULL,
+    name TEXT NOT NULL,
+    dosage_standardized TEXT NOT NULL,
+    best_mnn TEXT NOT NULL,
+    best_mnn_score REAL NOT NULL,
+    mnn_stage TEXT NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (context, name)
+);
+CREATE INDEX IF NOT EXISTS names_last_used ON names (last_used);
+"""
+
+
+def cache_context(mnn_list, scorer, **settings):
+    """
+    Ключ набора записей кэша: результат разбора наименования зависит только от списка МНН
+    реестра (не от цен и дозировок), scorer'а, версии конвейера очистки и настроек поиска МНН.
+    """
+    digest = hashlib.sha256()
+    digest.update('\n'.join(mnn_list).encode('utf-8'))
+    scorer_name = f"{getattr(scorer, '__module__', '')}.{getattr(scorer, '__name__', repr(scorer))}"
+    parts = [scorer_name, f'pipeline={REGISTER_PIPELINE_VERSION}', f'names={NAME_CACHE_VERSION}']
+    parts += [f'{name}={value}' for name, value in sorted(settings.items())]
+    digest.update('\n'.join(parts).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def name_cache_stats(lookups, hits):
+    """Статистика кэша наименований: сколько искали, сколько нашли и доля попаданий."""
+    return {
+        'lookups': lookups,
+        'hits': hits,
+        'hit_rate': hits / lookups if lookups else 0.0,
+    }
+
+
+class NameCache:
+    """
+    Кэш разбора очищенных наименований закупки в SQLite: наименование -> (дозировка,
+    лучший МНН и его score без порога, этап поиска МНН).
+
+    Записи хранятся по ключу (context, наименование), где context - cache_context.
+    Размер ограничен max_entries: при переполнении удаляются давно не использованные
+    записи (LRU по времени последнего обращения).
+
+    Соединение открывается отдельно для каждого потока и процесса (Streamlit, пул процессов).
+    """
+
+    def __init__(self, path=DEFAULT_NAME_CACHE, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.lookups = 0
+        self.hits = 0
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # Соединения не передаются в другие процессы
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _connection(self):
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(_SCHEMA)
+            self._local.connection, self._local.pid = connection, pid
+        return self._local.connection
+
+    def lookup(self, context, names):
+        """
+        Ищет наименования в кэше и отмечает найденные как использованные.
+        Возвращает DataFrame найденных записей (индекс - наименование, колонки NAME_COLUMNS).
+        """
+        names = list(dict.fromkeys(names))
+        connection = self._connection()
+        rows = []
+        with connection:
+            for start in range(0, len(names), _QUERY_BATCH):
+                batch = names[start:start + _QUERY_BATCH]
+                placeholders = ','.join('?' * len(batch))
+                rows += connection.execute(
+                    f"SELECT name, {', '.join(NAME_COLUMNS)} FROM names "
+                    f"WHERE context = ? AND name IN ({placeholders})", [context, *batch]
+                ).fetchall()
+                connection.execute(
+                    f"UPDATE names SET last_used = ? WHERE context = ? AND name IN ({placeholders})",
+                    [time.time(), context, *batch]
+                )
+
+        self.lookups += len(names)
+        self.hits += len(rows)
+        return pd.DataFrame(rows, columns=['name'] + NAME_COLUMNS).set_index('name')
+
+    def store(self, context, names_df):
+        """Сохраняет разбор наименований (индекс - наименование, колонки NAME_COLUMNS) и применяет LRU."""
+        if names_df.empty:
+            return
+        now = time.time()
+        rows = [(context, name, *values, now)
+                for name, values in zip(names_df.index, names_df[NAME_COLUMNS].itertuples(index=False, name=None))]
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                f"INSERT OR REPLACE INTO names (context, name, {', '.join(NAME_COLUMNS)}, last_used) "
+                f"VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            excess = connection.execute("SELECT COUNT(*) FROM names").fetchone()[0] - self.max_entries
+            if excess > 0:
+                connection.execute(
+                    "DELETE FROM names WHERE rowid IN (SELECT rowid FROM names ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+
+    def stats(self):
+        """Статистика попаданий за время жизни объекта (все вызовы lookup)."""
+        return name_cache_stats(self.lookups, self.hits)
@@ -1,6 +1,11 @@
 import pandas as pd
 import re
 import os
+import sys
+
+# Общие модули сопоставления лежат в папке проекта (на уровень выше)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from purchase_ingest import PURCHASE_COLUMNS, clean_purchase, purchase_column_mapping
 
 # --- КОНФИГУРАЦИЯ ---
 # Папка, в которой лежат сырые заявки.
@@ -15,45 +20,25 @@ INPUT_RAW_PATH = os.path.join(INPUT_FOLDER, INPUT_FILENAME)
 # Имя файла, который ждет скрипт мэтчинга (ВЫХОДНОЙ файл, сохраняется рядом со скриптами)
 OUTPUT_CLEAN_FILE = 'purchase_input.csv'
 
-# СПРАВОЧНИК СИНОНИМОВ ДЛЯ АВТОМАТИЧЕСКОГО МАППИНГА КОЛОНОК
-COLUMN_SYNONYMS = {
-    'item_name_raw': ['наименование', 'предмет', 'описание', 'название', 'item', 'subject', 'name', 'product'],
-    'quantity': ['количество', 'кол-во', 'объем', 'qty', 'count']
-}
+# Справочники синонимов для автоматического маппинга колонок - purchase_ingest.RENAME_MAP / COLUMN_SYNONYMS
 # ---------------------
 
 def map_columns(df):
     """
     Автоматически находит и переименовывает колонки в DataFrame 
-    согласно справочнику синонимов.
+    согласно справочнику синонимов (purchase_ingest.purchase_column_mapping).
     """
-    
-    # Приводим все названия колонок к нижнему регистру для устойчивости
-    lower_cols_map = {col.lower().replace('.', '').strip(): col for col in df.columns}
-    
-    column_mapping = {}
-    found_cols = set()
-    
-    for target_col, synonyms in COLUMN_SYNONYMS.items():
-        if target_col in column_mapping:
-            continue
-            
-        for synonym in synonyms:
-            for lower_name, original_name in lower_cols_map.items():
-                if synonym in lower_name and original_name not in found_cols:
-                    column_mapping[original_name] = target_col
-                    found_cols.add(original_name)
-                    print(f"   ✅ Найдено: '{original_name}' -> '{target_col}'")
-                    break 
-            if target_col in column_mapping.values():
-                break
-
-    if 'item_name_raw' not in column_mapping.values() or 'quantity' not in column_mapping.values():
+    try:
+        column_mapping = purchase_column_mapping(df.columns)
+    except ValueError:
         print("❌ Ошибка маппинга: Не удалось автоматически найти одну или обе обязательные колонки.")
         raise ValueError("Отсутствуют необходимые колонки после автоматической идентификации.")
-        
+
+    for original_name, target_col in column_mapping.items():
+        print(f"   ✅ Найдено: '{original_name}' -> '{target_col}'")
+
     df_mapped = df.rename(columns=column_mapping)
-    return df_mapped[['item_name_raw', 'quantity']].copy()
+    return df_mapped[PURCHASE_COLUMNS].copy()
 
 def load_raw_data(file_path):
     """
@@ -96,34 +81,11 @@ def load_raw_data(file_path):
 
 def preprocess_data(df):
     """
-    Очищает и стандартизирует колонки item_name_raw и quantity.
+    Очищает и стандартизирует колонки item_name_raw и quantity (purchase_ingest.clean_purchase).
     """
-    
-    # 1. Очистка item_name_raw
     print("\n-> Очистка наименований от мусорных символов и префиксов...")
-    
-    df['item_name_raw'] = df['item_name_raw'].astype(str)
-    
-    df['item_name_raw'] = df['item_name_raw'].str.replace(r'[\ufeff\u200b\uFEFF]', '', regex=True)
-    
-    df['item_name_raw'] = df['item_name_raw'].str.replace(r'^[‹ЏЉ]екарственный препарат\s*', '', regex=True)
-    df['item_name_raw'] = df['item_name_raw'].str.replace(r'екарственный препарат', '', regex=True)
-    df['item_name_raw'] = df['item_name_raw'].str.replace(r'[‹ЏЉ]', '', regex=True) 
-    
-    df['item_name_raw'] = df['item_name_raw'].str.replace(r'оваЯ', 'овая', regex=True)
-    df['item_name_raw'] = df['item_name_raw'].str.replace(r'аЯ', 'а', regex=True)
-    
-    df['item_name_raw'] = df['item_name_raw'].str.strip()
-    
-    # 2. Стандартизация quantity
     print("-> Стандартизация колонки 'quantity' (извлечение только чисел)...")
-    
-    df['quantity'] = df['quantity'].astype(str)
-    df['quantity'] = df['quantity'].str.replace(r'[^0-9]+', '', regex=True)
-    
-    df['quantity'] = pd.to_numeric(df['quantity'], errors='coerce').fillna(0).astype(int)
-    
-    return df
+    return clean_purchase(df)
 
 def main():
     # Проверка на необходимую библиотеку для Excel
@@ -158,6 +120,8 @@ def main():
     print(f"Очищенный файл '{OUTPUT_CLEAN_FILE}' готов для мэтчинга.")
     print("Теперь вы можете запустить ваш скрипт мэтчинга:")
     print("    python matching_script.py")
+    print("Или сразу, без промежуточного CSV:")
+    print(f"    python matching_script.py --input {INPUT_RAW_PATH}")
     print("======================================")
     
 if __name__ == "__main__":
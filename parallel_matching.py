@@ -0,0 +1,127 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from dedup import dedup_stats
+from match_results import MatchResults, build_result_table, empty_match_results, expand_unique_results
+from mnn_resolver import mnn_stage_stats
+from name_cache import name_cache_stats
+
+# ====================================================================
+# ПАРАЛЛЕЛЬНОЕ СОПОСТАВЛЕНИЕ (ProcessPoolExecutor, реестр наследуется через fork)
+# ====================================================================
+
+# Частей на один процесс: небольшие части выравнивают нагрузку между процессами
+PARTS_PER_WORKER = 4
+
+# Matcher процесса пула: при fork наследуется от родителя (реестр не сериализуется),
+# иначе передается один раз в initializer
+_worker_matcher = None
+
+
+def _init_worker(matcher):
+    global _worker_matcher
+    if matcher is not None:
+        _worker_matcher = matcher
+    # cdist внутри процесса однопоточный: параллельность дают сами процессы
+    _worker_matcher = _worker_matcher.with_settings(cdist_workers=1)
+
+
+def worker_matcher():
+    """Matcher текущего процесса пула matcher_pool."""
+    return _worker_matcher
+
+
+def matcher_pool(matcher, workers):
+    """
+    ProcessPoolExecutor из workers процессов, в каждом из которых worker_matcher() - копия
+    загруженного matcher с однопоточным cdist. При fork процессы наследуют реестр без
+    сериализации, иначе matcher передается каждому процессу один раз через initializer.
+    """
+    global _worker_matcher
+    if 'fork' in multiprocessing.get_all_start_methods():
+        _worker_matcher = matcher
+        context, initargs = multiprocessing.get_context('fork'), (None,)
+    else:
+        context, initargs = multiprocessing.get_context(), (matcher,)
+    return ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=initargs)
+
+
+def _match_names(names):
+    """
+    Подготавливает и сопоставляет часть уникальных наименований (по одной строке на наименование).
+    Возвращает (MatchResults в нумерации части, число уникальных очищенных наименований,
+    этап поиска МНН для каждого наименования, статистика кэша наименований или None).
+    """
+    scored = _worker_matcher.score_purchase(pd.DataFrame({'item_name_raw': names}))
+    purchase_df = _worker_matcher.apply_mnn_threshold(scored)
+    return (_worker_matcher.match_results(purchase_df), purchase_df.attrs['dedup_stats']['unique_rows'],
+            _worker_matcher.mnn_stages(scored), purchase_df.attrs.get('name_cache_stats'))
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+class ParallelMatcher:
+    """
+    Параллельный режим Matcher: уникальные наименования закупки делятся на части,
+    которые подготавливаются и сопоставляются в пуле процессов.
+
+    Пул создается один раз (можно сопоставлять несколько таблиц, например в потоковом
+    режиме). Реестр загружается в родителе до создания пула; при fork процессы получают
+    его без сериализации. Результаты возвращаются компактными массивами и собираются
+    в итоговую таблицу в исходном порядке строк, как Matcher.match.
+    """
+
+    def __init__(self, matcher, workers=None):
+        self.matcher = matcher.load()
+        self.workers = workers or default_workers()
+        self._pool = matcher_pool(self.matcher, self.workers)
+
+    def match(self, purchase_df):
+        """Полный цикл (подготовка и сопоставление) в пуле процессов; результат как у Matcher.match."""
+        raw_codes, raw_names = pd.factorize(purchase_df['item_name_raw'].astype(str))
+        names = raw_names.tolist()
+
+        parts = np.array_split(np.arange(len(names)), min(len(names), self.workers * PARTS_PER_WORKER) or 1)
+        bounds = [(int(part[0]), int(part[-1]) + 1) for part in parts if len(part)]
+        outputs = self._pool.map(_match_names, [names[start:stop] for start, stop in bounds])
+
+        # Номера строк частей переводятся в номера уникальных наименований всей закупки
+        results, unique_rows, stages, cache_stats = [], 0, [], []
+        for (start, _), (part_results, part_unique, part_stages, part_cache) in zip(bounds, outputs):
+            results.append(part_results._replace(purchase_row_id=part_results.purchase_row_id + start))
+            unique_rows += part_unique
+            stages.append(part_stages)
+            if part_cache is not None:
+                cache_stats.append(part_cache)
+
+        if results:
+            unique_results = MatchResults(*(np.concatenate(arrays) for arrays in zip(*results)))
+        else:
+            unique_results = empty_match_results()
+
+        final_df = build_result_table(purchase_df, self.matcher.register_df,
+                                      expand_unique_results(raw_codes, unique_results),
+                                      self.matcher.match_name_column)
+        # Одинаковые очищенные наименования из разных частей считаются в каждой части
+        final_df.attrs['dedup_stats'] = dedup_stats(len(purchase_df), unique_rows)
+        name_stages = np.concatenate(stages) if stages else np.empty(0, dtype=object)
+        final_df.attrs['mnn_stage_stats'] = mnn_stage_stats(name_stages[raw_codes])
+        if cache_stats:
+            final_df.attrs['name_cache_stats'] = name_cache_stats(sum(part['lookups'] for part in cache_stats),
+                                                                  sum(part['hits'] for part in cache_stats))
+        return final_df
+
+    def close(self):
+        self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
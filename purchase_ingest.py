@@ -0,0 +1,157 @@
+import codecs
+import os
+
+import pandas as pd
+
+from stream_matching import DEFAULT_CHUNKSIZE
+from text_normalization import clean_raw_name
+
+# ====================================================================
+# ЧТЕНИЕ СЫРОЙ ЗАЯВКИ (.xlsx / .csv) СРАЗУ В ПАМЯТЬ, БЕЗ ПРОМЕЖУТОЧНОГО CSV
+# ====================================================================
+
+# Колонки подготовленной закупки
+PURCHASE_COLUMNS = ['item_name_raw', 'quantity']
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm')
+RAW_EXTENSIONS = ('.csv', '.xls') + EXCEL_EXTENSIONS
+
+# Точные названия колонок (без учета регистра и пробелов по краям) - как в convert_csv.py
+RENAME_MAP = {
+    'item_name_raw': ['Названия', 'Наименование', 'Название', 'Товар'],
+    'quantity': ['Количество', 'Кол-во', 'Колво', 'Объем'],
+}
+
+# Части названий колонок для автоматического маппинга - как в preprocessing_script.py
+COLUMN_SYNONYMS = {
+    'item_name_raw': ['наименование', 'предмет', 'описание', 'название', 'item', 'subject', 'name', 'product'],
+    'quantity': ['количество', 'кол-во', 'объем', 'qty', 'count'],
+}
+
+# Сколько байт CSV проверять для выбора кодировки (utf-8 или windows-1251)
+_ENCODING_PROBE_BYTES = 1 << 20
+
+
+def purchase_column_mapping(columns):
+    """
+    Находит колонки наименования и количества: сначала точное название (RENAME_MAP),
+    затем вхождение синонима в название колонки (COLUMN_SYNONYMS).
+    Возвращает словарь {исходная колонка: 'item_name_raw' / 'quantity'};
+    ValueError, если одну из колонок найти не удалось.
+    """
+    normalized = {col: str(col).strip().lower() for col in columns}
+    mapping = {}
+
+    for target_col, names in RENAME_MAP.items():
+        for name in names:
+            col = next((col for col, lower in normalized.items()
+                        if lower == name.lower() and col not in mapping), None)
+            if col is not None:
+                mapping[col] = target_col
+                break
+
+    substrings = {col: lower.replace('.', '') for col, lower in normalized.items()}
+    for target_col, synonyms in COLUMN_SYNONYMS.items():
+        if target_col in mapping.values():
+            continue
+        for synonym in synonyms:
+            col = next((col for col, lower in substrings.items()
+                        if synonym in lower and col not in mapping), None)
+            if col is not None:
+                mapping[col] = target_col
+                break
+
+    missing = [col for col in PURCHASE_COLUMNS if col not in mapping.values()]
+    if missing:
+        raise ValueError(f"Не найдены колонки заявки: {', '.join(missing)} (колонки файла: {list(columns)})")
+    return mapping
+
+
+def clean_purchase(df):
+    """
+    Очистка заявки (как preprocess_data): наименования - text_normalization.clean_raw_name,
+    количество - только цифры, целое число (нераспознанное -> 0).
+    """
+    df['item_name_raw'] = [clean_raw_name(name) for name in df['item_name_raw'].astype(str)]
+    quantity = df['quantity'].astype(str).str.replace(r'[^0-9]+', '', regex=True)
+    df['quantity'] = pd.to_numeric(quantity, errors='coerce').fillna(0).astype(int)
+    return df
+
+
+def _csv_encoding(path):
+    """utf-8, если начало файла - корректный UTF-8, иначе windows-1251."""
+    with open(path, 'rb') as f:
+        head = f.read(_ENCODING_PROBE_BYTES)
+    try:
+        # final=False: обрезанный на границе блока многобайтный символ - не ошибка
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'windows-1251'
+
+
+def _excel_chunks(path, chunksize):
+    """Лист 1 файла Excel потоково (openpyxl read-only): DataFrame по chunksize строк, первая строка - заголовок."""
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [f'Unnamed: {i}' if name is None else name for i, name in enumerate(header)]
+
+        batch = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue # пустые строки (форматирование ниже таблицы)
+            batch.append(row)
+            if len(batch) == chunksize:
+                yield pd.DataFrame(batch, columns=columns)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=columns)
+    finally:
+        workbook.close()
+
+
+def _raw_chunks(path, chunksize):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        yield from pd.read_csv(path, sep=';', encoding=_csv_encoding(path), chunksize=chunksize)
+    elif extension in EXCEL_EXTENSIONS:
+        yield from _excel_chunks(path, chunksize)
+    elif extension == '.xls':
+        # Старый формат Excel потоково не читается (pandas + xlrd)
+        df = pd.read_excel(path)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+    else:
+        raise ValueError(f"Неподдерживаемый формат файла заявки: {extension} (поддерживаются: {', '.join(RAW_EXTENSIONS)})")
+
+
+def read_raw_purchase_chunks(path, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Читает сырую заявку (.xlsx/.xlsm/.xls/.csv) частями по chunksize строк: колонки
+    определяются по первой части (purchase_column_mapping), каждая часть очищается
+    (clean_purchase). Части можно сразу передавать в Matcher.match / match_stream.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+
+    mapping = None
+    for chunk in _raw_chunks(path, chunksize):
+        if mapping is None:
+            mapping = purchase_column_mapping(chunk.columns)
+        chunk = chunk.rename(columns=mapping)[PURCHASE_COLUMNS].copy()
+        yield clean_purchase(chunk.reset_index(drop=True))
+
+
+def read_raw_purchase(path):
+    """Сырая заявка целиком (read_raw_purchase_chunks, собранный в один DataFrame)."""
+    chunks = list(read_raw_purchase_chunks(path))
+    if not chunks:
+        return pd.DataFrame({col: pd.Series(dtype=object if col == 'item_name_raw' else int)
+                             for col in PURCHASE_COLUMNS})
+    return pd.concat(chunks, ignore_index=True)
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+import pandas as pd
+
+from register_index import RegisterIndex
+
+# ====================================================================
+# СКОМПИЛИРОВАННЫЙ РЕЕСТР (Parquet + индекс МНН рядом с CSV)
+# ====================================================================
+
+# Версия конвейера подготовки реестра. Увеличивайте при любом изменении очистки МНН,
+# extract_dosage, dosage_model или RegisterIndex - старый кэш будет пересобран.
+REGISTER_PIPELINE_VERSION = 5
+
+COMPILED_SUFFIX = '.compiled'
+_DATA_FILENAME = 'register.parquet'
+_INDEX_FILENAME = 'index.pkl'
+_META_FILENAME = 'meta.json'
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """SHA-256 содержимого файла (читается блоками)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compiled_register_dir(csv_path):
+    """Папка скомпилированного реестра рядом с CSV: register_ls.csv -> register_ls.compiled/"""
+    root, _ = os.path.splitext(csv_path)
+    return root + COMPILED_SUFFIX
+
+
+def _read_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, _META_FILENAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_atomic(path, write):
+    """Пишет файл через временный файл в той же папке и os.replace (без полузаписанного кэша)."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def save_compiled_register(cache_dir, register_df, register_index, content_hash):
+    """
+    Сохраняет подготовленный реестр (Parquet) и индекс (pickle); meta.json пишется последним.
+
+    Старый meta.json удаляется до перезаписи файлов данных: пока новый кэш записывается
+    (или если запись прервалась), кэш недействителен и не загрузится вперемешку со старым.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+
+    meta_path = os.path.join(cache_dir, _META_FILENAME)
+    try:
+        os.remove(meta_path)
+    except FileNotFoundError:
+        pass
+
+    _write_atomic(os.path.join(cache_dir, _DATA_FILENAME),
+                  lambda tmp: register_df.to_parquet(tmp, engine='pyarrow', index=False))
+
+    def write_index(tmp):
+        with open(tmp, 'wb') as f:
+            pickle.dump(register_index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    _write_atomic(os.path.join(cache_dir, _INDEX_FILENAME), write_index)
+
+    def write_meta(tmp):
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'content_hash': content_hash,
+                       'pipeline_version': REGISTER_PIPELINE_VERSION,
+                       'rows': len(register_df)}, f)
+    _write_atomic(meta_path, write_meta)
+
+
+def load_compiled_register(csv_path, build_register):
+    """
+    Загружает подготовленный реестр и его индекс из кэша рядом с CSV.
+
+    Кэш действителен, если совпадают хэш содержимого CSV и REGISTER_PIPELINE_VERSION.
+    Иначе реестр собирается функцией build_register(csv_path), индекс строится заново,
+    и оба сохраняются в кэш.
+
+    Возвращает (register_df, register_index, from_cache).
+    """
+    content_hash = file_hash(csv_path)
+    cache_dir = compiled_register_dir(csv_path)
+
+    meta = _read_meta(cache_dir)
+    if meta and meta.get('content_hash') == content_hash and meta.get('pipeline_version') == REGISTER_PIPELINE_VERSION:
+        try:
+            register_df = pd.read_parquet(os.path.join(cache_dir, _DATA_FILENAME), engine='pyarrow')
+            with open(os.path.join(cache_dir, _INDEX_FILENAME), 'rb') as f:
+                register_index = pickle.load(f)
+            return register_df, register_index, True
+        except Exception as e:
+            print(f"⚠️ Кэш реестра поврежден, выполняется пересборка: {e}")
+
+    register_df = build_register(csv_path)
+    register_index = RegisterIndex(register_df)
+
+    try:
+        save_compiled_register(cache_dir, register_df, register_index, content_hash)
+    except ImportError:
+        print("⚠️ Для кэша реестра необходима библиотека pyarrow: pip install pyarrow")
+    except Exception as e:
+        print(f"⚠️ Не удалось сохранить кэш реестра: {e}")
+
+    return register_df, register_index, False
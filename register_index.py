@@ -0,0 +1,229 @@
+import numpy as np
+from rapidfuzz import fuzz
+
+from dosage_model import NO_DOSAGE, dosage_ratio_score, parse_dosage
+
+# ====================================================================
+# ИНДЕКС РЕЕСТРА ЛС (МНН / МНН + Дозировка -> позиции строк)
+# ====================================================================
+
+_EMPTY_POSITIONS = np.empty(0, dtype=np.int32)
+
+# Цена для ранжирования строк Уровня 3 (при равной близости дозировки - сначала дешевле)
+PARTIAL_PRICE_COLUMN = 'purchase_price_USD'
+
+
+def dosage_similarity(dosage_std, reg_dosage_std):
+    """
+    Близость дозировки реестра к дозировке закупки (0-100) для ранжирования Уровня 3, по
+    каноническим ключам dosage_model: одинаковый ключ ("20 ме" и "20 ед") - 100, однокомпонентные
+    дозировки одной единицы - численно (dosage_ratio_score). Другая единица, составные
+    с другим ключом, нераспознанные и без дозировки - 0 (после всех дозировок той же единицы).
+    """
+    if dosage_std == NO_DOSAGE or reg_dosage_std == NO_DOSAGE:
+        return 0.0
+    parsed, reg_parsed = parse_dosage(dosage_std), parse_dosage(reg_dosage_std)
+    if parsed.key == reg_parsed.key:
+        return 100.0
+    single, reg_single = parsed.single, reg_parsed.single
+    if (single is not None and reg_single is not None
+            and (single.unit, single.per_unit) == (reg_single.unit, reg_single.per_unit)):
+        return dosage_ratio_score(single.value, reg_single.value)
+    return 0.0
+
+
+class GroupPositions:
+    """
+    Ключ группы -> позиции строк реестра (по возрастанию), как groupby(...).indices, но компактно:
+    значения колонок ключа заменены целочисленными кодами категорий, код группы - одно число int64.
+    Хранятся три массива: отсортированные коды групп, границы групп и позиции строк (int32)
+    всех групп подряд - без словаря со строковыми ключами и массива numpy на каждую группу.
+    """
+
+    def __init__(self, register_df, keys):
+        columns = [register_df[key].astype('category') for key in ([keys] if isinstance(keys, str) else keys)]
+        self.single = isinstance(keys, str)
+        self.categories = [column.cat.categories for column in columns]
+
+        # Код группы: коды колонок в смешанной системе счисления (0 - NaN, как dropna=False в groupby)
+        codes = np.zeros(len(register_df), dtype=np.int64)
+        for column in columns:
+            codes = codes * (len(column.cat.categories) + 1) + column.cat.codes.to_numpy() + 1
+
+        order = np.argsort(codes, kind='stable') # внутри группы позиции остаются по возрастанию
+        self.group_codes, starts = np.unique(codes[order], return_index=True)
+        self.offsets = np.append(starts, len(codes))
+        self.positions = order.astype(np.int32)
+
+    def _group(self, key):
+        """Номер группы ключа или None."""
+        code = 0
+        for value, categories in zip((key,) if self.single else key, self.categories):
+            if value is None or value != value: # None / NaN
+                value_code = 0
+            else:
+                try:
+                    value_code = categories.get_loc(value) + 1
+                except (KeyError, TypeError):
+                    return None
+            code = code * (len(categories) + 1) + value_code
+        group = int(np.searchsorted(self.group_codes, code))
+        if group < len(self.group_codes) and self.group_codes[group] == code:
+            return group
+        return None
+
+    def get(self, key, default=None):
+        group = self._group(key)
+        if group is None:
+            return default
+        return self.positions[self.offsets[group]:self.offsets[group + 1]]
+
+    def __getitem__(self, key):
+        positions = self.get(key)
+        if positions is None:
+            raise KeyError(key)
+        return positions
+
+    def __contains__(self, key):
+        return self._group(key) is not None
+
+    def __iter__(self):
+        """Ключи групп (в порядке кодов)."""
+        for code in self.group_codes.tolist():
+            values = []
+            for categories in reversed(self.categories):
+                code, value_code = divmod(code, len(categories) + 1)
+                values.append(categories[value_code - 1] if value_code else np.nan)
+            yield values[0] if self.single else tuple(reversed(values))
+
+    def __len__(self):
+        return len(self.group_codes)
+
+
+class RegisterIndex:
+    """
+    Индекс реестра, который строится один раз при загрузке реестра.
+
+    Хранит позиции строк (для .iloc) для каждого МНН и для каждой пары
+    (МНН, стандартизированная дозировка), поэтому сопоставление позиции
+    закупки зависит от числа записей с данным МНН, а не от размера реестра.
+
+    Для числового сравнения дозировок (колонки из dosage_model.dosage_columns)
+    хранит пары (МНН, канонический ключ дозировки) и отсортированные значения
+    однокомпонентных дозировок по каждому МНН и единице измерения.
+    """
+
+    def __init__(self, register_df):
+        # Позиции внутри группы идут по возрастанию, то есть в том же порядке,
+        # в котором строки шли бы при фильтрации реестра маской
+        self.mnn_positions = GroupPositions(register_df, 'mnn')
+        self.mnn_dosage_positions = GroupPositions(register_df, ['mnn', 'dosage_standardized'])
+        self.mnn_key_positions = GroupPositions(register_df, ['mnn', 'dosage_key'])
+
+        # Уникальные дозировки каждого МНН в порядке первого появления в реестре
+        # (порядок ключей groupby по двум колонкам не гарантирован, сортируем по первой позиции)
+        self.mnn_dosages = {}
+        for mnn, dosage in sorted(self.mnn_dosage_positions, key=lambda key: self.mnn_dosage_positions[key][0]):
+            self.mnn_dosages.setdefault(mnn, []).append(dosage)
+
+        # Однокомпонентные дозировки (по одной на пару МНН и ключ), отсортированные по значению:
+        # (МНН, единица, знаменатель) -> позиции в dosage_values / dosage_value_keys
+        # (по возрастанию позиции, то есть значения). Компактно, без массива на каждую группу
+        single = register_df.loc[register_df['dosage_value'].notna(),
+                                 ['mnn', 'dosage_unit', 'dosage_per_unit', 'dosage_value', 'dosage_key']]
+        single = single.drop_duplicates(['mnn', 'dosage_key']).sort_values('dosage_value', kind='stable')
+        self.dosage_values = single['dosage_value'].to_numpy(dtype=np.float64)
+        self.dosage_value_keys = single['dosage_key'].to_numpy(dtype=object)
+        self.mnn_dosage_values = GroupPositions(single, ['mnn', 'dosage_unit', 'dosage_per_unit'])
+
+        # Цены строк для ранжирования Уровня 3 (partial_candidates)
+        if PARTIAL_PRICE_COLUMN in register_df.columns:
+            self.row_prices = register_df[PARTIAL_PRICE_COLUMN].to_numpy(dtype=np.float32)
+        else:
+            self.row_prices = np.zeros(len(register_df), dtype=np.float32)
+
+    def positions_for_mnn(self, mnn):
+        """Позиции всех строк реестра с данным МНН."""
+        return self.mnn_positions.get(mnn, _EMPTY_POSITIONS)
+
+    def positions_for_dosage(self, mnn, dosage_std):
+        """Позиции строк реестра с данным МНН и стандартизированной дозировкой."""
+        return self.mnn_dosage_positions.get((mnn, dosage_std), _EMPTY_POSITIONS)
+
+    def positions_for_key(self, mnn, dosage_key):
+        """Позиции строк реестра с данным МНН и каноническим ключом дозировки ("0,5 г" == "500 мг")."""
+        return self.mnn_key_positions.get((mnn, dosage_key), _EMPTY_POSITIONS)
+
+    def dosages_for_mnn(self, mnn):
+        """Уникальные стандартизированные дозировки реестра для данного МНН."""
+        return self.mnn_dosages.get(mnn, [])
+
+    def partial_candidates(self, mnn, dosage_std, limit=None):
+        """
+        Строки реестра МНН для Уровня 3 (Частичное соответствие МНН).
+
+        limit=None - все строки МНН в порядке реестра. Иначе не больше limit строк:
+        сначала ближайшие по дозировке (dosage_similarity), затем дешевле
+        (PARTIAL_PRICE_COLUMN, без цены - в конце), затем в порядке реестра.
+        Возвращает (позиции строк, число строк МНН, не вошедших в результат).
+        """
+        positions = self.positions_for_mnn(mnn)
+        if limit is None or len(positions) == 0:
+            return positions, 0
+
+        # Близость считается один раз на уникальную дозировку МНН
+        dosages = self.dosages_for_mnn(mnn)
+        groups = [self.positions_for_dosage(mnn, dosage) for dosage in dosages]
+        candidates = np.concatenate(groups)
+        similarity = np.repeat([dosage_similarity(dosage_std, dosage) for dosage in dosages],
+                               [len(group) for group in groups])
+
+        order = np.lexsort((candidates, self.row_prices[candidates], -similarity))[:limit]
+        return candidates[order], len(candidates) - len(order)
+
+    def nearest_dosage(self, mnn, dosage_std):
+        """
+        Ближайшая по значению однокомпонентная дозировка МНН с той же единицей измерения
+        (поиск по отсортированному массиву).
+
+        Возвращает (ключ дозировки, числовой score) или None, если дозировка закупки
+        не однокомпонентная или у МНН нет дозировок в той же единице.
+        """
+        single = parse_dosage(dosage_std).single
+        if single is None:
+            return None
+        group = self.mnn_dosage_values.get((mnn, single.unit, single.per_unit))
+        if group is None:
+            return None
+
+        values, keys = self.dosage_values[group], self.dosage_value_keys[group]
+        position = int(np.searchsorted(values, single.value))
+        # Ближайшее значение - один из двух соседей точки вставки
+        candidates = [i for i in (position - 1, position) if 0 <= i < len(values)]
+        best = max(candidates, key=lambda i: dosage_ratio_score(single.value, values[i]))
+        return keys[best], dosage_ratio_score(single.value, values[best])
+
+    def best_dosage(self, mnn, dosage_std):
+        """
+        Лучшая дозировка реестра для данного МНН (Уровень 2, без применения порога).
+
+        Однокомпонентные дозировки сравниваются численно (nearest_dosage); нечеткое
+        сравнение строк (token_set_ratio) остается только для составных/нераспознанных
+        дозировок и для МНН без дозировок в той же единице.
+        Возвращает (ключ дозировки или None, score).
+        """
+        if dosage_std == NO_DOSAGE:
+            return None, 0.0
+
+        nearest = self.nearest_dosage(mnn, dosage_std)
+        if nearest is not None:
+            return nearest
+
+        best_key, best_score = None, 0.0
+        for reg_dosage_std in self.dosages_for_mnn(mnn):
+            if reg_dosage_std == NO_DOSAGE:
+                continue
+            score = fuzz.token_set_ratio(dosage_std, reg_dosage_std)
+            if score > best_score:
+                best_key, best_score = parse_dosage(reg_dosage_std).key, score
+        return best_key, best_score
@@ -0,0 +1,163 @@
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+# ====================================================================
+# КОМПАКТНОЕ ХРАНЕНИЕ РЕЕСТРА В ПАМЯТИ (category, коды, float32)
+# ====================================================================
+
+# Строковые колонки реестра с большим числом повторов: хранятся как category
+# (уникальные строки один раз + целочисленные коды строк)
+CATEGORY_COLUMNS = ['mnn', 'trade_name', 'dosage', 'form', 'manufacturer',
+                    'dosage_standardized', 'dosage_key', 'dosage_unit', 'dosage_per_unit']
+
+# Цены: float32 (7 значащих цифр - цены до 99 999,99 выводятся без изменений)
+PRICE_COLUMNS = ['purchase_price_USD', 'known_threshold_price_USD', 'client_price_USD']
+
+# Код значения закупки, которого нет среди категорий реестра (код NaN в Categorical равен -1)
+UNKNOWN_CODE = -2
+
+
+def compact_register(register_df):
+    """
+    Переводит подготовленный реестр в компактное представление: строковые колонки
+    CATEGORY_COLUMNS -> category, цены PRICE_COLUMNS -> float32. Значения не меняются;
+    колонки, которых нет или которые уже другого типа, остаются как есть.
+    """
+    columns = {}
+    for col in CATEGORY_COLUMNS:
+        if col in register_df.columns and register_df[col].dtype == object:
+            columns[col] = register_df[col].astype('category')
+    for col in PRICE_COLUMNS:
+        if col in register_df.columns and register_df[col].dtype.kind in 'fiu':
+            columns[col] = register_df[col].astype(np.float32)
+    return register_df.assign(**columns)
+
+
+def category_codes(values, categories):
+    """
+    Целочисленные коды значений по категориям колонки реестра (для merge по int вместо строк):
+    NaN -> -1 (как в Categorical), значение, которого нет в реестре -> UNKNOWN_CODE.
+    """
+    values = pd.Series(values, dtype=object)
+    codes = pd.Index(categories).get_indexer(values).astype(np.int32)
+    codes[(codes == -1) & values.notna().to_numpy()] = UNKNOWN_CODE
+    return codes
+
+
+def take_values(column, positions):
+    """
+    Значения колонки реестра по позициям строк (numpy, object для category): для category
+    берутся коды, строки собираются только для выбранных позиций.
+    """
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        codes = column.cat.codes.to_numpy()[positions]
+        values = np.append(column.cat.categories.to_numpy(dtype=object), np.nan)
+        return values[codes] # код -1 (NaN) -> последний элемент
+    return column.to_numpy()[positions]
+
+
+def float32_as_decimal(df):
+    """
+    Колонки float32 (цены реестра) -> float64 с той же кратчайшей десятичной записью
+    (48.97, а не 48.970001220703125) - для вывода в Excel и JSON. Остальные колонки не меняются.
+    """
+    columns = {col: df[col].to_numpy().astype(str).astype(np.float64)
+               for col in df.columns if df[col].dtype == np.float32}
+    return df.assign(**columns) if columns else df
+
+
+# --------------------------------------------------------------------
+# Отчет о памяти реестра и индексов
+# --------------------------------------------------------------------
+
+def _nbytes(value, seen):
+    """Оценка памяти объекта индекса (массивы, словари, списки, кортежи, строки); общие объекты - один раз."""
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, np.ndarray):
+        size = value.nbytes + sys.getsizeof(np.empty(0))
+        if value.dtype == object:
+            size += sum(_nbytes(item, seen) for item in value)
+        return size
+    if isinstance(value, (pd.DataFrame, pd.Index)):
+        frame = value.to_frame() if isinstance(value, pd.Index) else value
+        return int(frame.memory_usage(deep=False).sum()) + sum(
+            _nbytes(item, seen) for col in frame.columns if frame[col].dtype == object for item in frame[col]
+        )
+    size = sys.getsizeof(value)
+    if hasattr(value, '__dict__') and not isinstance(value, type):
+        size += _nbytes(vars(value), seen)
+    if isinstance(value, dict):
+        size += sum(_nbytes(key, seen) + _nbytes(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_nbytes(item, seen) for item in value)
+    return size
+
+
+def memory_report(register_df, register_index=None, vectorized_engine=None):
+    """
+    Память реестра (байт): 'columns' - по колонкам с учетом строк (memory_usage(deep=True)),
+    'register' - всего; 'index' и 'engine' - оценка для RegisterIndex и таблиц VectorizedEngine.
+    Строки, которые индекс делит с колонками реестра, учитываются один раз (в колонках).
+    """
+    usage = register_df.memory_usage(deep=True)
+    report = {'columns': usage.drop('Index').to_dict(), 'register': int(usage.sum())}
+
+    # Строки колонок реестра уже посчитаны: индекс хранит ссылки на те же объекты
+    seen = set()
+    for col in register_df.columns:
+        column = register_df[col]
+        values = column.cat.categories if isinstance(column.dtype, pd.CategoricalDtype) else column
+        if values.dtype == object:
+            seen.update(id(value) for value in values)
+    if register_index is not None:
+        report['index'] = _nbytes(vars(register_index), seen)
+    if vectorized_engine is not None:
+        report['engine'] = sum(_nbytes(value, seen) for value in vars(vectorized_engine).values()
+                               if value is not register_index)
+    return report
+
+
+def format_memory_report(before, after):
+    """Таблица 'до / после' для двух отчетов memory_report (МБ)."""
+    def mb(size):
+        return f'{size / 2**20:9.2f}'
+
+    lines = [f"{'':28}{'до, МБ':>9}  {'после, МБ':>9}"]
+    for col, size in before['columns'].items():
+        lines.append(f'  {col:26}{mb(size)}  {mb(after["columns"].get(col, 0))}')
+    for key, title in (('register', 'Реестр'), ('index', 'Индекс RegisterIndex'), ('engine', 'Таблицы VectorizedEngine')):
+        if key in before:
+            lines.append(f'{title:28}{mb(before[key])}  {mb(after.get(key, 0))}')
+    total_before = sum(before.get(key, 0) for key in ('register', 'index', 'engine'))
+    total_after = sum(after.get(key, 0) for key in ('register', 'index', 'engine'))
+    lines.append(f"{'ИТОГО':28}{mb(total_before)}  {mb(total_after)}")
+    return '\n'.join(lines)
+
+
+def main():
+    """Отчет: память подготовленного реестра и индексов без компактного хранения и с ним."""
+    from matching_script import REGISTER_FILENAME, prepare_register
+    from register_index import RegisterIndex
+    from vectorized_engine import VectorizedEngine
+
+    parser = argparse.ArgumentParser(description='Память реестра до и после компактного хранения')
+    parser.add_argument('register', nargs='?', default=REGISTER_FILENAME, help='CSV реестра (по умолчанию %(default)s)')
+    args = parser.parse_args()
+
+    raw_df = pd.read_csv(args.register, sep=';', encoding='utf-8')
+    reports = []
+    for compact in (False, True):
+        register_df = prepare_register(raw_df.copy(), compact=compact)
+        register_index = RegisterIndex(register_df)
+        reports.append(memory_report(register_df, register_index, VectorizedEngine(register_df, register_index)))
+    print(f'🧮 Память реестра {args.register} ({len(raw_df)} строк):')
+    print(format_memory_report(*reports))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+from match_results import STATUSES
+from register_layout import float32_as_decimal
+
+# ====================================================================
+# ПРОСМОТР РЕЗУЛЬТАТА ПО СТРАНИЦАМ (фильтры и сводки - по кодам, без обхода строк)
+# ====================================================================
+
+PAGE_SIZES = (50, 100, 500, 1000)
+DEFAULT_PAGE_SIZE = 100
+
+# Колонка результата для фильтра по МНН (в веб-интерфейсе Reg_Match_Name - МНН реестра)
+FILTER_NAME_COLUMN = 'Reg_Match_Name'
+
+
+class ResultsView:
+    """
+    Итоговая таблица сопоставления, подготовленная для просмотра по страницам.
+
+    Статус и наименование реестра кодируются один раз (factorize); фильтр - маска по кодам,
+    сводки - подсчет по кодам выбранных строк (np.bincount), страница - iloc только
+    нужных строк. Браузеру передается и стилизуется только текущая страница, поэтому
+    время отрисовки не зависит от размера результата.
+    """
+
+    def __init__(self, final_df, name_column=FILTER_NAME_COLUMN):
+        self.final_df = final_df
+        # Статусы - в порядке уровней сопоставления (match_results.STATUSES)
+        status = pd.Categorical(final_df['Status'], categories=STATUSES)
+        self.status_codes, self.statuses = status.codes, pd.Index(STATUSES)
+        self.name_codes, self.names = pd.factorize(final_df[name_column], sort=True, use_na_sentinel=False)
+        self.name_column = name_column
+
+    def __len__(self):
+        return len(self.final_df)
+
+    def positions(self, statuses=(), names=()):
+        """Номера строк результата (по порядку), прошедших фильтр; пустой фильтр - все строки."""
+        mask = np.ones(len(self.final_df), dtype=bool)
+        if statuses:
+            mask &= np.isin(self.status_codes, self.statuses.get_indexer(list(statuses)))
+        if names:
+            mask &= np.isin(self.name_codes, self.names.get_indexer(list(names)))
+        return np.flatnonzero(mask)
+
+    def page_count(self, positions, page_size):
+        return max(1, -(-len(positions) // page_size))
+
+    def page(self, positions, page, page_size, columns=None):
+        """
+        Строки страницы page (с 1) среди positions; индекс - номер строки результата (с 1).
+        Цены float32 переводятся в десятичные значения только для этих строк.
+        """
+        rows = positions[(page - 1) * page_size:page * page_size]
+        page_df = self.final_df.iloc[rows]
+        if columns is not None:
+            page_df = page_df[columns]
+        return float32_as_decimal(page_df).set_axis(rows + 1)
+
+    def status_summary(self, positions):
+        """Строк результата по статусам среди positions."""
+        counts = np.bincount(self.status_codes[positions], minlength=len(self.statuses))
+        return pd.DataFrame({'Status': self.statuses, 'Строк': counts}).set_index('Status')
+
+    def name_summary(self, positions):
+        """
+        Строк результата по наименованию реестра и статусу среди positions (одна строка на МНН,
+        колонка на статус и 'Всего'), по убыванию числа строк.
+        """
+        n_statuses = len(self.statuses)
+        pairs = self.name_codes[positions].astype(np.int64) * n_statuses + self.status_codes[positions]
+        counts = np.bincount(pairs, minlength=len(self.names) * n_statuses).reshape(len(self.names), n_statuses)
+        summary = pd.DataFrame(counts, index=pd.Index(self.names, name=self.name_column), columns=self.statuses)
+        summary['Всего'] = counts.sum(axis=1)
+        return summary[summary['Всего'] > 0].sort_values('Всего', ascending=False, kind='stable')
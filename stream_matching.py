@@ -0,0 +1,145 @@
+import os
+
+import pandas as pd
+
+from match_results import RESULT_COLUMNS
+from name_cache import name_cache_stats
+from register_layout import PRICE_COLUMNS
+
+# ====================================================================
+# ПОТОКОВОЕ СОПОСТАВЛЕНИЕ БОЛЬШИХ ФАЙЛОВ ЗАКУПКИ (по частям)
+# ====================================================================
+
+DEFAULT_CHUNKSIZE = 50_000
+
+OUTPUT_FORMATS = ('.csv', '.parquet')
+
+# Типы колонок закупки в Parquet (pyarrow); количество - float64: в части может быть пустым или дробным.
+# Остальные колонки закупки пишутся строками
+PARQUET_PURCHASE_TYPES = {'item_name_raw': 'string', 'quantity': 'float64'}
+
+
+def _result_column_type(column):
+    """Тип колонки результата в Parquet (имя типа pyarrow) по RESULT_COLUMNS и PARQUET_PURCHASE_TYPES."""
+    if column not in RESULT_COLUMNS:
+        return PARQUET_PURCHASE_TYPES.get(column, 'string')
+    register_col, default = RESULT_COLUMNS[column]
+    if register_col in PRICE_COLUMNS:
+        return 'float32' # цены реестра хранятся в float32 (register_layout)
+    if isinstance(default, str):
+        return 'string'
+    return 'int32' if isinstance(default, int) else 'float64'
+
+
+def parquet_result_schema(columns):
+    """Схема Parquet для колонок результата: одна для всех частей, не зависит от значений первой части."""
+    import pyarrow as pa
+
+    return pa.schema([(column, pa.type_for_alias(_result_column_type(column))) for column in columns])
+
+
+class CsvResultWriter:
+    """Дописывает части результата в CSV (заголовок - только у первой части)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        # Файл создается заново, чтобы не дописать к результату прошлого запуска
+        open(path, 'w').close()
+
+    def write(self, result_df):
+        result_df.to_csv(self.path, mode='a', sep=';', index=False, header=self.rows == 0, encoding='utf-8')
+        self.rows += len(result_df)
+
+    def close(self):
+        pass
+
+
+class ParquetResultWriter:
+    """
+    Дописывает части результата в один Parquet-файл (row group на каждую часть).
+    Схема задается явно (parquet_result_schema), поэтому части с пустыми колонками
+    или другими выведенными типами приводятся к одной схеме.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self._writer = None
+        self._schema = None
+
+    def write(self, result_df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._writer is None:
+            self._schema = parquet_result_schema(result_df.columns)
+            self._writer = pq.ParquetWriter(self.path, self._schema)
+
+        # Строковые колонки закупки (в части могут быть числами или целиком пустыми) -> строки, пропуски -> null
+        columns = {}
+        for field in self._schema:
+            values = result_df[field.name]
+            if pa.types.is_string(field.type) and field.name not in RESULT_COLUMNS:
+                columns[field.name] = values.astype(str).where(values.notna(), None).astype(object)
+        table = pa.Table.from_pandas(result_df.assign(**columns), schema=self._schema, preserve_index=False)
+        self._writer.write_table(table)
+        self.rows += len(result_df)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def result_writer(output_path):
+    """Writer результата по расширению файла (.csv или .parquet)."""
+    extension = os.path.splitext(output_path)[1].lower()
+    if extension == '.csv':
+        return CsvResultWriter(output_path)
+    if extension == '.parquet':
+        return ParquetResultWriter(output_path)
+    raise ValueError(f"Неподдерживаемый формат результата: '{extension}' (доступны: {', '.join(OUTPUT_FORMATS)})")
+
+
+def read_purchase_chunks(purchase_path, chunksize=DEFAULT_CHUNKSIZE):
+    """Читает CSV закупки частями по chunksize строк."""
+    return pd.read_csv(purchase_path, sep=';', encoding='utf-8', chunksize=chunksize)
+
+
+def match_stream(matcher, chunks, output_path, on_chunk=None):
+    """
+    Сопоставляет закупку по частям и сразу дописывает результат в output_path.
+
+    В памяти одновременно находится только одна часть закупки и ее результат,
+    поэтому потребление памяти не зависит от размера входного файла
+    (реестр загружается один раз и переиспользуется для всех частей).
+
+    on_chunk(номер части, строк закупки, строк результата) вызывается после каждой части.
+    Возвращает сводку: строк закупки, строк результата и число строк по статусам
+    (и 'name_cache' - статистику кэша наименований, если он используется).
+    """
+    writer = result_writer(output_path)
+    summary = {'purchase_rows': 0, 'result_rows': 0, 'statuses': {}}
+    cache_lookups = cache_hits = None
+    try:
+        for chunk_number, chunk in enumerate(chunks, start=1):
+            if chunk.empty:
+                continue
+            result_df = matcher.match(chunk)
+            writer.write(result_df)
+
+            summary['purchase_rows'] += len(chunk)
+            summary['result_rows'] += len(result_df)
+            for status, count in result_df['Status'].value_counts().items():
+                summary['statuses'][status] = summary['statuses'].get(status, 0) + int(count)
+            if 'name_cache_stats' in result_df.attrs:
+                cache = result_df.attrs['name_cache_stats']
+                cache_lookups = (cache_lookups or 0) + cache['lookups']
+                cache_hits = (cache_hits or 0) + cache['hits']
+            if on_chunk is not None:
+                on_chunk(chunk_number, len(chunk), len(result_df))
+    finally:
+        writer.close()
+    if cache_lookups is not None:
+        summary['name_cache'] = name_cache_stats(cache_lookups, cache_hits)
+    return summary
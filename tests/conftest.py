@@ -0,0 +1,53 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Реальный реестр для проверок на его написаниях (если есть): MATCHSENSE_REGISTER или register_ls.csv
+# в корне проекта. Без него такие тесты пропускаются
+REGISTER_CSV = os.environ.get('MATCHSENSE_REGISTER',
+                              os.path.join(os.path.dirname(os.path.dirname(__file__)), 'register_ls.csv'))
+
+# Синтетический реестр: МНН с несколькими дозировками (в т.ч. в разной записи единиц,
+# составными и нераспознанными) - закупка проходит все уровни сопоставления
+SAMPLE_MNNS = ['ибупрофен', 'парацетамол', 'амоксициллин', 'гепарин натрия', 'метформин', 'аторвастатин',
+               'ацетилсалициловая кислота', 'цефтриаксон', 'инсулин', 'эналаприл', 'омепразол', 'лозартан']
+SAMPLE_DOSAGES = ['200 мг', '400 мг', '0,5 г', '500 мг', '250 мг', '1 г', '20 мг', '40 мг', '5000 МЕ/мл',
+                  '100 ед/мл', '10 мг', '2,5 мг', '120 мг + 60 мг', '500 мг + 125 мг', '5 мг/мл', '0,9%', 'н/д']
+SAMPLE_FORMS = ['таблетки', 'капсулы', 'р-р д/ин.', 'порошок']
+
+
+@pytest.fixture(scope='session')
+def register_csv():
+    if not os.path.exists(REGISTER_CSV):
+        pytest.skip(f'нет реестра {REGISTER_CSV}')
+    return REGISTER_CSV
+
+
+@pytest.fixture(scope='session')
+def sample_register():
+    rng = np.random.default_rng(0)
+    rows = 300
+    return pd.DataFrame({
+        'mnn': rng.choice(SAMPLE_MNNS, rows),
+        'trade_name': [f'ТН-{i}' for i in range(rows)],
+        'dosage': rng.choice(SAMPLE_DOSAGES, rows),
+        'form': rng.choice(SAMPLE_FORMS, rows),
+        'manufacturer': rng.choice(['Фарм1', 'Фарм2', 'Pfizer'], rows),
+        'purchase_price_USD': rng.uniform(1, 100, rows).round(2),
+        'known_threshold_price_USD': rng.uniform(1, 100, rows).round(2),
+        'client_price_USD': rng.uniform(1, 100, rows).round(2),
+    })
+
+
+@pytest.fixture(scope='session')
+def sample_purchase():
+    """Закупка: МНН реестра и неизвестные вещества, опечатки, дозировки вне реестра и повторы."""
+    rng = np.random.default_rng(1)
+    names = SAMPLE_MNNS + ['ибупрафен', 'парацитамол', 'неизвестное вещество', 'витамин']
+    dosages = SAMPLE_DOSAGES + ['300 мг', '0,25 г', '5 мг', '1000 МЕ/мл', '3 таб', '']
+    rows = 200
+    items = [f'{name} {dosage} {form}' for name, dosage, form in
+             zip(rng.choice(names, rows), rng.choice(dosages, rows), rng.choice(SAMPLE_FORMS, rows))]
+    return pd.DataFrame({'item_name_raw': items, 'quantity': rng.integers(1, 100, rows)})
@@ -0,0 +1,86 @@
+import random
+import re
+import time
+
+import pytest
+
+from dosage_model import NO_DOSAGE
+from dosage_scanner import scan_dosage
+
+# Прежние шаблоны (эталон для сравнения). Вложенные квантификаторы по цифрам дают
+# перебор, кубический по длине серии цифр: не использовать на реальных данных
+_REFERENCE_CONCENTRATION = r'(\d+[,\.]?\d*)\s*(мг|ед|г|мкг|МО|МЕ|%|mg|g|mcg|IU)\s*\/\s*(мл|доза|ml|l|mcl)'
+_REFERENCE_COMPOUND = r'(\d+[,\.]?\d*)\s*(мг|ед|мл|г|мкг|МО|МЕ|%|mg|ml|g|mcg|IU)\s*[\+\/—]\s*(\d+[,\.]?\d*)\s*(мг|ед|мл|г|мкг|МО|МЕ|%|mg|ml|g|mcg|IU)'
+_REFERENCE_SIMPLE = r'(\d+[,\.]?\d*)\s*(мкг/доза|мг|ед|мл|г|мкг|МО|МЕ|%|mg|ml|g|mcg|IU)'
+_REFERENCE_STRIP = r'(\d+[,\.]?\d*)\s*(мкг/доза|мг|ед|мл|г|мкг|МО|МЕ|%|mg|ml|g|mcg|IU)\s*[\+\/—]?\s*(\d+[,\.]?\d*)*\s*(мг|ед|мл|г|мкг|МО|МЕ|%|mg|ml|g|mcg|IU)*'
+
+# Строки для случайной проверки: цифры, разделители, пробелы и части единиц в разных регистрах
+FUZZ_ALPHABET = list('0123456789,.  /+—-%') + ['мг', 'МГ', 'мкг', 'мл', 'МЛ', 'г', 'ед', 'МЕ', 'мо', 'доза',
+                                                'mg', 'MG', 'ml', 'l', 'mcg', 'mcl', 'iu', 'IU', 'таб', 'x', '\xa0']
+FUZZ_COUNT = 20_000
+
+GOLDEN_NAMES = [
+    'парацетамол таблетки 500 мг №20',
+    'амоксициллин + клавулановая кислота 500 мг + 125 мг',
+    'гепарин натрия р-р 5000 МЕ/мл 5 мл',
+    'цефтриаксон пор. д/приг. р-ра 1 г',
+    'инсулин 100 ед/мл 3 мл',
+    'сальбутамол аэрозоль 100 мкг/доза',
+    'метронидазол р-р 500 мг/100 мл',
+    'эналаприл 2.5 мг, 5 мг, 10 мг',
+    'раствор 0,9% 250 мл',
+    'витамин д3 10000 МЕ 2 мл',
+    'лот 4607000000000 12345678901234567890',
+    'амлодипин 5мг10мл',
+    '1,5,5 мг', '5. мг', '10 мг гепарин', '1 г/2 г', 'н/д',
+]
+
+# Худшие для прежних регулярных выражений строки и допустимое время разбора одной строки
+ADVERSARIAL_LENGTH = 100_000
+LATENCY_LIMIT_SECONDS = 1.0
+ADVERSARIAL_NAMES = {
+    'цифры': '1' * ADVERSARIAL_LENGTH + ' x',
+    'цифры,': '1,' * (ADVERSARIAL_LENGTH // 2),
+    'пробелы': '1' + ' ' * ADVERSARIAL_LENGTH + 'x',
+    'дозировки': '5 мг/мл ' * (ADVERSARIAL_LENGTH // 8),
+}
+
+
+def reference_scan_dosage(name):
+    """Прежний разбор (три findall и re.sub) - эталон для сравнения с scan_dosage."""
+    all_matches = []
+    for val1, unit1, unit2 in re.findall(_REFERENCE_CONCENTRATION, name, re.IGNORECASE):
+        all_matches.append(f"{val1.replace('.', ',')} {unit1.lower()}/{unit2.lower()}")
+    for val1, unit1, val2, unit2 in re.findall(_REFERENCE_COMPOUND, name, re.IGNORECASE):
+        all_matches.append(f"{val1.replace('.', ',')} {unit1.lower()} + {val2.replace('.', ',')} {unit2.lower()}")
+    if not all_matches:
+        for val, unit in re.findall(_REFERENCE_SIMPLE, name, re.IGNORECASE):
+            all_matches.append(f"{val.replace('.', ',')} {unit.lower()}")
+    unique_matches = sorted(set(all_matches))
+    dosage = ", ".join(unique_matches) if unique_matches else NO_DOSAGE
+
+    stripped = re.sub(_REFERENCE_STRIP, ' ', name, flags=re.IGNORECASE)
+    return dosage, re.sub(r'\s+', ' ', stripped).strip()
+
+
+def _fuzz_names(count, seed=0):
+    rng = random.Random(seed)
+    return [''.join(rng.choice(FUZZ_ALPHABET) for _ in range(rng.randint(0, 16))) for _ in range(count)]
+
+
+@pytest.mark.parametrize('name', GOLDEN_NAMES)
+def test_golden_names_match_reference(name):
+    assert scan_dosage(name) == reference_scan_dosage(name)
+
+
+def test_random_names_match_reference():
+    mismatches = [(name, reference_scan_dosage(name), scan_dosage(name)) for name in _fuzz_names(FUZZ_COUNT)]
+    mismatches = [mismatch for mismatch in mismatches if mismatch[1] != mismatch[2]]
+    assert not mismatches, mismatches[:10]
+
+
+@pytest.mark.parametrize('kind', list(ADVERSARIAL_NAMES))
+def test_adversarial_names_parse_in_linear_time(kind):
+    started = time.perf_counter()
+    scan_dosage(ADVERSARIAL_NAMES[kind])
+    assert time.perf_counter() - started < LATENCY_LIMIT_SECONDS
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+from rapidfuzz import fuzz
+
+from matching_script import Matcher, prepare_register
+from mnn_blocking import BLOCKING_MIN_MNN, MnnCandidateIndex, _noisy_queries
+from mnn_resolver import UNKNOWN_MNN, resolve_mnn_batch
+from text_normalization import normalize_names
+
+# Фиксированный корпус: синтетические МНН из слогов (seed задан), запросы - МНН с опечатками,
+# лишними словами и перестановкой слов (mnn_blocking._noisy_queries)
+SYLLABLES = ['ме', 'тфор', 'мин', 'ам', 'лод', 'ип', 'ин', 'пара', 'цет', 'ол', 'ибу', 'про', 'фен', 'ат', 'ор',
+             'ва', 'ста', 'тин', 'роз', 'ув', 'лев', 'о', 'флокс', 'ацин', 'цеф', 'три', 'акс', 'он', 'ком',
+             'би', 'нат', 'окс', 'ит', 'ра', 'зол', 'пан', 'ти', 'дек', 'са', 'мет', 'аз', 'ил', 'ал']
+SALTS = ['натрия', 'калия', 'гидрохлорид', 'малеат', 'кальция', 'сульфат']
+CORPUS_SIZE = 3000
+QUERY_COUNT = 300
+THRESHOLDS = (70, 80, 90)
+
+
+def _mnn_corpus(size, seed=0):
+    rng = np.random.default_rng(seed)
+    mnns = set()
+    while len(mnns) < size:
+        words = [''.join(rng.choice(SYLLABLES, size=int(rng.integers(2, 5)))) for _ in range(int(rng.integers(1, 3)))]
+        if rng.random() < 0.3:
+            words.append(str(rng.choice(SALTS)))
+        mnns.add(' '.join(words))
+    return sorted(mnns)
+
+
+@pytest.fixture(scope='module')
+def corpus():
+    mnn_list = _mnn_corpus(CORPUS_SIZE)
+    return mnn_list, _noisy_queries(mnn_list, QUERY_COUNT, seed=1), MnnCandidateIndex(mnn_list)
+
+
+def _assert_threshold_parity(queries, mnn_list, scorer, index):
+    """С fallback_score, равным порогу, МНН найден по порогу так же, как полным перебором."""
+    brute = resolve_mnn_batch(queries, mnn_list, scorer, 0)
+
+    for threshold in THRESHOLDS:
+        blocked = resolve_mnn_batch(queries, mnn_list, scorer, 0, candidate_index=index, fallback_score=threshold)
+        brute_found = brute['mnn_match_score'] >= threshold
+        blocked_found = blocked['mnn_match_score'] >= threshold
+        assert (brute_found == blocked_found).all(), threshold
+        # Ниже порога результат - полный перебор
+        assert brute[~blocked_found].equals(blocked[~blocked_found])
+        # Кандидат не может набрать больше полного перебора
+        assert (blocked['mnn_match_score'] <= brute['mnn_match_score']).all()
+
+
+@pytest.mark.parametrize('scorer', [fuzz.WRatio, fuzz.token_sort_ratio])
+def test_blocking_matches_brute_force_at_threshold(corpus, scorer):
+    mnn_list, queries, index = corpus
+    _assert_threshold_parity(queries, mnn_list, scorer, index)
+
+
+@pytest.mark.parametrize('scorer', [fuzz.WRatio, fuzz.token_sort_ratio])
+def test_blocking_matches_brute_force_on_register_spellings(register_csv, scorer):
+    """
+    Написания реального реестра (МНН меньше BLOCKING_MIN_MNN, индекс строится принудительно):
+    МНН и торговые наименования в исходной записи, очищенные как наименования закупки,
+    и МНН с опечатками и лишними словами.
+    """
+    raw_df = pd.read_csv(register_csv, sep=';', encoding='utf-8')
+    mnn_list = prepare_register(raw_df.copy())['mnn'].unique().tolist()
+    spellings = pd.concat([raw_df['mnn'], raw_df.get('trade_name', pd.Series(dtype=object))]).dropna()
+    queries = normalize_names(spellings.astype(str).drop_duplicates()).tolist()
+    queries += _noisy_queries(mnn_list, QUERY_COUNT, seed=2)
+
+    _assert_threshold_parity(queries, mnn_list, scorer, MnnCandidateIndex(mnn_list))
+
+
+def test_matcher_rechecks_blocked_scores_for_higher_threshold(corpus):
+    """score_purchase при низком пороге, порог повышен в apply_mnn_threshold - как полный перебор."""
+    mnn_list, queries, _ = corpus
+    assert len(mnn_list) >= BLOCKING_MIN_MNN
+    register = pd.DataFrame({'mnn': mnn_list, 'dosage': '10 мг'})
+    purchase = pd.DataFrame({'item_name_raw': queries})
+
+    matcher = Matcher(register, mnn_threshold=min(THRESHOLDS), use_cache=False)
+    assert matcher.mnn_candidate_index is not None
+    scored = matcher.score_purchase(purchase)
+    brute_matcher = matcher.with_settings(mnn_blocking=False)
+    brute_scored = brute_matcher.score_purchase(purchase)
+
+    for threshold in THRESHOLDS:
+        blocked = matcher.with_settings(mnn_threshold=threshold).apply_mnn_threshold(scored)
+        brute = brute_matcher.with_settings(mnn_threshold=threshold).apply_mnn_threshold(brute_scored)
+        assert ((blocked['mnn_standardized'] != UNKNOWN_MNN) == (brute['mnn_standardized'] != UNKNOWN_MNN)).all()
+        assert blocked.attrs['mnn_stage_stats'] == brute.attrs['mnn_stage_stats']
@@ -0,0 +1,51 @@
+import json
+
+from batch_matching import FILE_MATCHED, FILE_SKIPPED, MANIFEST_FILENAME, match_files
+from matching_script import Matcher
+from parallel_matching import ParallelMatcher
+from purchase_ingest import read_raw_purchase
+
+
+def test_parallel_matcher_matches_matcher(sample_register, sample_purchase):
+    matcher = Matcher(sample_register)
+    with ParallelMatcher(matcher, workers=2) as parallel:
+        result = parallel.match(sample_purchase)
+
+    expected = matcher.match(sample_purchase)
+    assert result.equals(expected)
+    assert result.attrs['mnn_stage_stats'] == expected.attrs['mnn_stage_stats']
+
+
+def _write_raw_purchase(path, purchase_df):
+    """Сырая заявка с заголовками как в выгрузке заказчика."""
+    purchase_df.rename(columns={'item_name_raw': 'Наименование', 'quantity': 'Количество'}).to_csv(
+        path, sep=';', index=False, encoding='utf-8')
+
+
+def test_match_files_writes_results_and_manifest(tmp_path, sample_register, sample_purchase):
+    source_dir = tmp_path / 'in'
+    source_dir.mkdir()
+    paths = [str(source_dir / 'a.csv'), str(source_dir / 'b.csv')]
+    _write_raw_purchase(paths[0], sample_purchase.iloc[:120])
+    _write_raw_purchase(paths[1], sample_purchase.iloc[120:])
+    output_dir = tmp_path / 'out'
+    matcher = Matcher(sample_register)
+
+    summaries = match_files(matcher, paths, str(output_dir), register_hash='test', workers=2, output_format='.csv')
+
+    assert sorted(summary['input'] for summary in summaries) == paths
+    assert all(summary['status'] == FILE_MATCHED for summary in summaries)
+    with open(output_dir / MANIFEST_FILENAME, encoding='utf-8') as f:
+        manifest = json.load(f)
+    assert sorted(entry['input'] for entry in manifest.values()) == paths
+    for summary in summaries:
+        entry = next(entry for entry in manifest.values() if entry['input'] == summary['input'])
+        assert entry['output'] == summary['output']
+        expected = matcher.match(read_raw_purchase(summary['input']))
+        assert entry['result_rows'] == len(expected)
+        assert entry['statuses'] == {status: int(count) for status, count in expected['Status'].value_counts().items()}
+
+    # Повторный запуск с теми же заявками и настройками - результаты из журнала
+    rerun = match_files(matcher, paths, str(output_dir), register_hash='test', workers=2, output_format='.csv')
+    assert all(summary['status'] == FILE_SKIPPED for summary in rerun)
+    assert {summary['output'] for summary in rerun} == {summary['output'] for summary in summaries}
@@ -0,0 +1,38 @@
+import pandas as pd
+
+from match_results import STATUS_EXACT, STATUS_NOT_FOUND
+from matching_script import DEFAULT_PARTIAL_LIMIT, Matcher, prepare_register
+from register_index import RegisterIndex, dosage_similarity
+from vectorized_engine import ENGINE_LEGACY
+
+
+def test_equivalent_dosages_score_the_same():
+    """Одинаковый канонический ключ - одинаковая близость, независимо от записи единицы."""
+    assert dosage_similarity('20 ме', '20 ед') == dosage_similarity('20 ме', '20 ме') == 100.0
+    assert dosage_similarity('500 мг', '0,5 г') == 100.0
+    assert dosage_similarity('200 мг', '20 ме') == dosage_similarity('200 мг', '20 ед') == 0.0
+
+
+def test_same_unit_dosages_rank_before_other_units():
+    register = prepare_register(pd.DataFrame({
+        'mnn': ['ибупрофен'] * 5,
+        'dosage': ['20 ме', '125 mg', '20 ед', '400 мг', '200 мг'],
+        'purchase_price_USD': [1.0, 5.0, 1.0, 3.0, 9.0],
+    }))
+    index = RegisterIndex(register)
+
+    positions, omitted = index.partial_candidates('ибупрофен', '200 мг', limit=3)
+    # 200 мг (100), 125 mg (62.5), 400 мг (50); "20 ме" и "20 ед" - другая единица, после них
+    assert positions.tolist() == [4, 1, 3]
+    assert omitted == 2
+
+
+def test_batch_without_partial_items_matches_legacy():
+    """Партия только из точных и неизвестных позиций: Уровень 3 пуст, результат - как у legacy."""
+    matcher = Matcher(pd.DataFrame({'mnn': ['ибупрофен', 'ибупрофен'], 'dosage': ['200 мг', '400 мг']}),
+                      partial_limit=DEFAULT_PARTIAL_LIMIT)
+    purchase = pd.DataFrame({'item_name_raw': ['ибупрофен 200 мг', 'неизвестное вещество'], 'quantity': [1, 2]})
+
+    result = matcher.match(purchase)
+    assert result['Status'].tolist() == [STATUS_EXACT, STATUS_NOT_FOUND]
+    assert result.equals(matcher.with_settings(engine=ENGINE_LEGACY).match(purchase))
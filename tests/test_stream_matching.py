@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from matching_script import Matcher
+from stream_matching import ParquetResultWriter, match_stream, parquet_result_schema
+
+pq = pytest.importorskip('pyarrow.parquet')
+
+
+def _purchase_chunks(sample_purchase):
+    """Части закупки с разными пропусками: пустые количество и примечание, числа в примечании."""
+    bounds = np.linspace(0, len(sample_purchase), 4).astype(int)
+    first, second, third = (sample_purchase.iloc[start:stop].reset_index(drop=True)
+                            for start, stop in zip(bounds[:-1], bounds[1:]))
+    first = first.assign(quantity=np.nan, note=np.nan)
+    second = second.assign(note='срочно')
+    third = third.assign(quantity=third['quantity'] / 2, note=np.arange(len(third)))
+    return [first, second, third]
+
+
+def test_parquet_chunks_with_different_null_patterns(tmp_path, sample_register, sample_purchase):
+    matcher = Matcher(sample_register)
+    chunks = _purchase_chunks(sample_purchase)
+    output_path = tmp_path / 'result.parquet'
+
+    summary = match_stream(matcher, chunks, str(output_path))
+
+    written = pq.read_table(output_path)
+    expected = pd.concat([matcher.match(chunk) for chunk in chunks], ignore_index=True)
+    assert summary['result_rows'] == written.num_rows == len(expected)
+    assert written.schema.equals(parquet_result_schema(expected.columns))
+
+    written_df = written.to_pandas()
+    assert written_df['quantity'].isna().sum() == expected['quantity'].isna().sum()
+    assert written_df['note'].tolist() == [None if pd.isna(note) else str(note) for note in expected['note']]
+    assert written_df['Purchase_Price_USD'].equals(expected['Purchase_Price_USD'])
+
+
+def test_parquet_writer_keeps_schema_of_result_columns(tmp_path):
+    """Целиком пустая первая часть не задает тип колонки для следующих частей."""
+    writer = ParquetResultWriter(str(tmp_path / 'result.parquet'))
+    writer.write(pd.DataFrame({'item_name_raw': [None], 'Match_Score': [np.nan], 'Omitted_Candidates': [0]}))
+    writer.write(pd.DataFrame({'item_name_raw': ['ибупрофен'], 'Match_Score': [95.0], 'Omitted_Candidates': [3]}))
+    writer.close()
+
+    written = pq.read_table(tmp_path / 'result.parquet').to_pandas()
+    assert written['item_name_raw'].tolist() == [None, 'ибупрофен']
+    assert written['Omitted_Candidates'].tolist() == [0, 3]
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from text_normalization import clean_raw_name
+
+# Случаи, где одна замена склеивает текст для следующей, и артефакты в разных местах строки
+CASES = ['аекарственный препаратЯ', 'оваекарственный препаратЯ', 'ек‹арственный препарат', '‹екарственный препарат  Парацетамол',
+         'ЏЉекарственный препарат', '\ufeffЛекарственный препарат ибупрофен', 'а\u200bЯ', 'а‹Я', 'ова‹Я',
+         'кислота ацетилсалициловаЯ', 'таблетки покрытые оболочкой аЯ ', '  ']
+FRAGMENTS = ['екарственный препарат', 'ова', 'а', 'Я', 'я', '‹', 'Џ', 'Љ', '\ufeff', '\u200b', ' ', 'л', 'ибупрофен']
+
+
+def _clean_raw_names_legacy(series):
+    """Прежняя цепочка замен new_purchases/preprocessing_script.py."""
+    return (series
+            .str.replace(r'[\ufeff\u200b\uFEFF]', '', regex=True)
+            .str.replace(r'^[‹ЏЉ]екарственный препарат\s*', '', regex=True)
+            .str.replace(r'екарственный препарат', '', regex=True)
+            .str.replace(r'[‹ЏЉ]', '', regex=True)
+            .str.replace(r'оваЯ', 'овая', regex=True)
+            .str.replace(r'аЯ', 'а', regex=True)
+            .str.strip())
+
+
+def _assert_legacy_parity(names):
+    names = pd.Series(names, dtype=object)
+    assert names.map(clean_raw_name).tolist() == _clean_raw_names_legacy(names).tolist()
+
+
+def test_clean_raw_name_keeps_replacement_order():
+    assert clean_raw_name('аекарственный препаратЯ') == 'а'
+    _assert_legacy_parity(CASES)
+
+
+def test_clean_raw_name_matches_legacy_on_random_fragments():
+    rng = np.random.default_rng(0)
+    _assert_legacy_parity([''.join(rng.choice(FRAGMENTS, size=int(rng.integers(1, 8)))) for _ in range(5000)])
+
+
+@pytest.mark.parametrize('column', ['mnn', 'trade_name'])
+def test_clean_raw_name_matches_legacy_on_register_names(register_csv, column):
+    raw_df = pd.read_csv(register_csv, sep=';', encoding='utf-8')
+    if column not in raw_df:
+        pytest.skip(f'в реестре нет колонки {column}')
+    _assert_legacy_parity(raw_df[column].dropna().astype(str).drop_duplicates())
@@ -0,0 +1,23 @@
+import pytest
+
+from match_results import STATUSES
+from matching_script import Matcher
+from vectorized_engine import ENGINE_LEGACY, ENGINE_VECTORIZED
+
+
+@pytest.fixture(scope='module')
+def matcher(sample_register):
+    return Matcher(sample_register, engine=ENGINE_VECTORIZED).load()
+
+
+@pytest.mark.parametrize('partial_limit', [None, 10, 3])
+@pytest.mark.parametrize('dosage_threshold', [50, 75, 90])
+def test_vectorized_matches_legacy(matcher, sample_purchase, partial_limit, dosage_threshold):
+    """Векторизованный движок дает ту же таблицу, что и построчный match_item."""
+    vectorized = matcher.with_settings(partial_limit=partial_limit, dosage_threshold=dosage_threshold)
+    legacy = vectorized.with_settings(engine=ENGINE_LEGACY)
+
+    result = vectorized.match(sample_purchase)
+    assert result.equals(legacy.match(sample_purchase))
+    # Закупка проходит все уровни сопоставления
+    assert set(result['Status']) == set(STATUSES)
@@ -0,0 +1,67 @@
+import re
+
+import pandas as pd
+
+# ====================================================================
+# НОРМАЛИЗАЦИЯ ТЕКСТА (общая для реестра, закупки и предобработки заявок)
+# ====================================================================
+
+# Управляющие и неразрывные пробелы -> обычный пробел. Нужно только перед удалением шумящих
+# фраз ("для\xa0инъекций" должно совпасть с фразой "для инъекций"): дальше эти символы
+# все равно заменяются пробелом вместе с остальными пробельными
+_SPACE_CHARS = re.compile(r'[\r\n\t\ufeff\xa0]')
+
+# Знаки препинания (все, кроме букв/цифр/_ и пробелов) -> пробел
+_PUNCTUATION = re.compile(r'[^\w\s]')
+
+
+def normalize_text(text, noise_pattern=None):
+    """
+    Нормализует строку: нижний регистр, удаление шумящих слов
+    (noise_pattern - скомпилированное выражение, см. matching_script.noise_words_pattern),
+    знаки препинания и пробелы -> один пробел, без пробелов по краям.
+
+    Результат совпадает с прежней цепочкой str.replace:
+    [\\r\\n\\t\\ufeff\\xa0] -> ' ', lower, шумящие слова -> ' ', [^\\w\\s] -> ' ', \\s+ -> ' ', strip.
+    """
+    text = text.lower()
+    if noise_pattern is not None:
+        text = noise_pattern.sub(' ', _SPACE_CHARS.sub(' ', text))
+    # split() без аргументов делит по тем же пробельным символам, что и \s
+    return ' '.join(_PUNCTUATION.sub(' ', text).split())
+
+
+def normalize_names(values, noise_pattern=None):
+    """
+    Нормализует колонку наименований (normalize_text) за один обход колонки. Каждое
+    уникальное значение обрабатывается один раз; значения приводятся к str (NaN -> 'nan', как astype(str)).
+    Возвращает Series с тем же индексом.
+    """
+    values = pd.Series(values, dtype=object).astype(str)
+    codes, uniques = pd.factorize(values)
+    normalized = pd.Series([normalize_text(value, noise_pattern) for value in uniques], dtype=object)
+    return pd.Series(normalized.to_numpy()[codes], index=values.index, dtype=object)
+
+
+# --------------------------------------------------------------------
+# Очистка сырых наименований заявки (new_purchases/preprocessing_script.py)
+# --------------------------------------------------------------------
+
+# Невидимые символы и артефакты неверной кодировки ("Лекарственный" -> "‹екарственный")
+_INVISIBLE_DELETE_TABLE = str.maketrans('', '', '\ufeff\u200b')
+_BROKEN_LETTERS = '‹ЏЉ'
+_BROKEN_DELETE_TABLE = str.maketrans('', '', _BROKEN_LETTERS)
+_BROKEN_PREFIX_PATTERN = re.compile(rf'^[{_BROKEN_LETTERS}]екарственный препарат\s*')
+
+
+def clean_raw_name(text):
+    """
+    Очищает сырое наименование заявки (регистр сохраняется): невидимые символы, остатки
+    префикса "Лекарственный препарат", "аЯ"/"оваЯ" и пробелы по краям.
+
+    Замены выполняются в том же порядке, что и прежняя цепочка str.replace: удаление
+    одной замены может склеить текст для следующей ("аекарственный препаратЯ" -> "аЯ" -> "а").
+    """
+    text = _BROKEN_PREFIX_PATTERN.sub('', text.translate(_INVISIBLE_DELETE_TABLE))
+    text = text.replace('екарственный препарат', '').translate(_BROKEN_DELETE_TABLE)
+    return text.replace('оваЯ', 'овая').replace('аЯ', 'а').strip()
@@ -0,0 +1,250 @@
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+
+from dosage_model import NO_DOSAGE, dosage_columns, parse_dosage
+from match_results import (NO_MATCH_ROW, STATUS_CODES, STATUS_EXACT, STATUS_NOT_FOUND, STATUS_PARTIAL,
+                           STATUS_POTENTIAL, MatchResults)
+from mnn_resolver import UNKNOWN_MNN
+from register_layout import category_codes
+
+# ====================================================================
+# ВЕКТОРИЗОВАННОЕ МНОГОУРОВНЕВОЕ СОПОСТАВЛЕНИЕ (merge вместо построчного цикла)
+# ====================================================================
+
+ENGINE_LEGACY = 'legacy'
+ENGINE_VECTORIZED = 'vectorized'
+ENGINES = (ENGINE_LEGACY, ENGINE_VECTORIZED)
+
+
+class VectorizedEngine:
+    """
+    Векторная (на множествах строк) реализация уровней сопоставления Matcher.match_item.
+
+    Уровень 1 - merge по (МНН, ключ дозировки), Уровень 2 - групповой подбор дозировки
+    только для нерешенных позиций (merge_asof по числовым значениям, cdist token_set_ratio
+    для составных/нераспознанных), Уровень 3 - merge по МНН для остальных.
+    Результат совпадает с построчным match_item (тот же порядок строк и tie-break).
+
+    Таблицы реестра для merge строятся один раз при создании. МНН и ключ дозировки
+    в них - целочисленные коды категорий (register_layout), merge идет по int32, а не по строкам.
+    """
+
+    def __init__(self, register_df, register_index):
+        self.register_index = register_index
+
+        mnn = register_df['mnn'].astype('category')
+        dosage_key = register_df['dosage_key'].astype('category')
+        self.mnn_categories = mnn.cat.categories
+        self.key_categories = dosage_key.cat.categories
+
+        # Все строки реестра (позиция = номер строки для .iloc) для Уровней 2 и 3
+        self.register_rows = pd.DataFrame({
+            'mnn_code': mnn.cat.codes.to_numpy(dtype=np.int32),
+            'key_code': dosage_key.cat.codes.to_numpy(dtype=np.int32),
+            'register_row_id': np.arange(len(register_df), dtype=np.int32),
+        })
+        # Уровень 1 берет только первую запись каждой пары (МНН, ключ дозировки)
+        self.first_rows = self.register_rows.drop_duplicates(['mnn_code', 'key_code'])
+
+        # Однокомпонентные дозировки реестра (по одной на пару МНН и ключ, как
+        # RegisterIndex.dosage_values), отсортированные по значению - одной таблицей
+        single = register_df.loc[register_df['dosage_value'].notna(),
+                                 ['mnn', 'dosage_unit', 'dosage_per_unit', 'dosage_value', 'dosage_key']]
+        single = single.drop_duplicates(['mnn', 'dosage_key']).sort_values('dosage_value', kind='stable')
+        # Колонки by для merge_asof - строки (object), как в позициях закупки
+        self.dosage_values = pd.DataFrame({
+            'mnn': single['mnn'].to_numpy(dtype=object),
+            'dosage_unit': single['dosage_unit'].to_numpy(dtype=object),
+            'dosage_per_unit': single['dosage_per_unit'].to_numpy(dtype=object),
+            'dosage_value': single['dosage_value'].to_numpy(dtype=np.float64),
+            'best_key': single['dosage_key'].to_numpy(dtype=object),
+        })
+
+    def match_unique(self, unique_rows, dosage_threshold, workers=-1, dosage_cache=None, partial_limit=None):
+        """
+        Сопоставляет уникальные позиции закупки (колонки dedup.MATCH_KEYS).
+
+        dosage_cache - словарь (МНН, дозировка) -> (лучший ключ или None, score) без порога;
+        найденные в нем пары не пересчитываются, новые добавляются.
+        partial_limit - не больше строк Уровня 3 на позицию (RegisterIndex.partial_candidates);
+        None - все строки МНН.
+
+        Возвращает MatchResults по уникальным позициям (purchase_row_id - номер позиции),
+        упорядоченный по номеру позиции и позиции строки реестра.
+        """
+        items = pd.DataFrame({
+            'item_id': np.arange(len(unique_rows), dtype=np.intp),
+            'mnn': unique_rows['mnn_standardized'].to_numpy(),
+            'dosage_standardized': unique_rows['dosage_standardized'].to_numpy(),
+            'mnn_match_score': unique_rows['mnn_match_score'].to_numpy(dtype=np.float64),
+        })
+        items = pd.concat([items, dosage_columns(items['dosage_standardized'])], axis=1)
+        items['mnn_code'] = category_codes(items['mnn'], self.mnn_categories)
+        items['key_code'] = category_codes(items['dosage_key'], self.key_categories)
+
+        parts = []
+
+        # 1. Уровень 1: Точное Совпадение (МНН + канонический ключ дозировки), только первая запись
+        exact = items.merge(self.first_rows, on=['mnn_code', 'key_code'], how='inner')
+        parts.append(self._part(exact, STATUS_EXACT, 100.0))
+
+        # Если МНН не найден, Уровни 2 и 3 пропускаются
+        rest = items[~items['item_id'].isin(exact['item_id']) & (items['mnn'] != UNKNOWN_MNN)]
+
+        # 2. Уровень 2: лучшая дозировка МНН (без порога), затем порог и все строки лучшего ключа
+        best = self._cached_best_dosages(rest, workers, dosage_cache)
+        passed = best.loc[best['best_key'].notna() & (best['best_score'] >= dosage_threshold),
+                          ['item_id', 'mnn_code', 'best_key', 'best_score']]
+        passed = passed.assign(key_code=category_codes(passed['best_key'], self.key_categories))
+        potential = passed.merge(self.register_rows, on=['mnn_code', 'key_code'], how='inner')
+        parts.append(self._part(potential, STATUS_POTENTIAL, potential['best_score'].to_numpy()))
+
+        # 3. Уровень 3: строки МНН для остальных позиций (все или не больше partial_limit)
+        rest = rest[~rest['item_id'].isin(passed['item_id'])]
+        if partial_limit is None:
+            partial = rest[['item_id', 'mnn_code', 'mnn_match_score']].merge(
+                self.register_rows[['mnn_code', 'register_row_id']], on='mnn_code', how='inner'
+            )
+            parts.append(self._part(partial, STATUS_PARTIAL, partial['mnn_match_score'].to_numpy()))
+        else:
+            partial = rest[['item_id', 'mnn', 'dosage_standardized', 'mnn_match_score']].merge(
+                self._partial_candidates(rest, partial_limit), on=['mnn', 'dosage_standardized'], how='inner'
+            )
+            parts.append(self._part(partial, STATUS_PARTIAL, partial['mnn_match_score'].to_numpy(),
+                                    omitted=partial['omitted'].to_numpy(), order=partial['rank'].to_numpy()))
+
+        # 4. Уровень 4: Не найдено (неизвестный МНН или МНН без строк реестра)
+        matched = np.concatenate([part['item_id'] for part in parts])
+        missing = np.setdiff1d(items['item_id'].to_numpy(), matched)
+        parts.append(self._part(
+            pd.DataFrame({'item_id': missing, 'register_row_id': np.full(len(missing), NO_MATCH_ROW, dtype=np.intp)}),
+            STATUS_NOT_FOUND, 0.0,
+        ))
+
+        # Внутри позиции - в порядке реестра, строки Уровня 3 с ограничением - в порядке ранжирования
+        result = pd.concat(parts, ignore_index=True).sort_values(['item_id', 'order'], kind='stable')
+        return MatchResults(
+            result['item_id'].to_numpy(dtype=np.intp),
+            result['register_row_id'].to_numpy(dtype=np.intp),
+            result['status'].to_numpy(dtype=np.int8),
+            result['score'].to_numpy(dtype=np.float64),
+            result['omitted'].to_numpy(dtype=np.int32),
+        )
+
+    @staticmethod
+    def _part(matches, status, score, omitted=0, order=None):
+        register_row_id = matches['register_row_id'].to_numpy(dtype=np.intp)
+        return pd.DataFrame({
+            'item_id': matches['item_id'].to_numpy(dtype=np.intp),
+            'register_row_id': register_row_id,
+            'status': np.int8(STATUS_CODES[status]),
+            'score': score,
+            'omitted': np.int32(omitted) if np.isscalar(omitted) else omitted.astype(np.int32),
+            'order': register_row_id if order is None else order,
+        })
+
+    def _partial_candidates(self, items, limit):
+        """
+        Строки Уровня 3 для каждой уникальной пары (МНН, дозировка) позиций items
+        (RegisterIndex.partial_candidates): колонки 'mnn', 'dosage_standardized',
+        'register_row_id', 'rank' (порядок внутри пары) и 'omitted'.
+        """
+        pairs = items[['mnn', 'dosage_standardized']].drop_duplicates()
+        frames = []
+        for mnn, dosage_std in zip(pairs['mnn'], pairs['dosage_standardized']):
+            positions, omitted = self.register_index.partial_candidates(mnn, dosage_std, limit)
+            frames.append(pd.DataFrame({'mnn': mnn, 'dosage_standardized': dosage_std,
+                                        'register_row_id': positions.astype(np.intp),
+                                        'rank': np.arange(len(positions), dtype=np.intp), 'omitted': omitted}))
+        if not frames:
+            # Пустые колонки ключа - object, как в items (иначе merge по 'mnn' падает на float64)
+            return pd.DataFrame({'mnn': pd.Series(dtype=object), 'dosage_standardized': pd.Series(dtype=object),
+                                 'register_row_id': np.empty(0, dtype=np.intp),
+                                 'rank': np.empty(0, dtype=np.intp), 'omitted': np.empty(0, dtype=np.int32)})
+        return pd.concat(frames, ignore_index=True)
+
+    def _cached_best_dosages(self, items, workers, dosage_cache):
+        """_best_dosages с кэшем по паре (МНН, дозировка)."""
+        if dosage_cache is None:
+            return self._best_dosages(items, workers)
+
+        pairs = list(zip(items['mnn'], items['dosage_standardized']))
+        cached = np.array([pair in dosage_cache for pair in pairs], dtype=bool)
+        if not cached.all():
+            computed = self._best_dosages(items[~cached], workers)
+            for mnn, dosage, key, score in zip(computed['mnn'], computed['dosage_standardized'],
+                                               computed['best_key'], computed['best_score']):
+                dosage_cache[(mnn, dosage)] = (key, score)
+
+        best = [dosage_cache[pair] for pair in pairs]
+        return items.assign(best_key=pd.Series([key for key, _ in best], index=items.index, dtype=object),
+                            best_score=np.array([score for _, score in best], dtype=np.float64))
+
+    def _best_dosages(self, items, workers=-1):
+        """
+        Лучшая дозировка реестра для каждой позиции (как RegisterIndex.best_dosage):
+        колонки 'best_key' (None, если не найдена) и 'best_score'.
+        """
+        items = items.assign(best_key=None, best_score=0.0)
+        has_dosage = (items['dosage_standardized'] != NO_DOSAGE).to_numpy()
+
+        # А. Числовой поиск: соседи слева (< значения) и справа (>= значения) по отсортированным значениям
+        numeric = items[has_dosage & items['dosage_value'].notna().to_numpy()]
+        numeric = numeric[['item_id', 'mnn', 'dosage_unit', 'dosage_per_unit', 'dosage_value']]
+        numeric = numeric.sort_values('dosage_value', kind='stable')
+        by = ['mnn', 'dosage_unit', 'dosage_per_unit']
+        lower = pd.merge_asof(numeric, self.dosage_values.rename(columns={'dosage_value': 'lower_value'}),
+                              left_on='dosage_value', right_on='lower_value', by=by,
+                              direction='backward', allow_exact_matches=False)
+        upper = pd.merge_asof(numeric, self.dosage_values.rename(columns={'dosage_value': 'upper_value'}),
+                              left_on='dosage_value', right_on='upper_value', by=by, direction='forward')
+
+        value = numeric['dosage_value'].to_numpy()
+        lower_score = _ratio_scores(value, lower['lower_value'].to_numpy())
+        upper_score = _ratio_scores(value, upper['upper_value'].to_numpy())
+        # При равном score выбирается меньшее значение (как max по [слева, справа])
+        take_lower = lower['best_key'].notna().to_numpy() & (
+            upper['best_key'].isna().to_numpy() | (lower_score >= upper_score)
+        )
+        take_upper = ~take_lower & upper['best_key'].notna().to_numpy()
+        numeric_key = np.where(take_lower, lower['best_key'].to_numpy(), upper['best_key'].to_numpy())
+        numeric_score = np.where(take_lower, lower_score, upper_score)
+
+        found = take_lower | take_upper
+        numeric_best = pd.DataFrame({
+            'best_key': numeric_key[found], 'best_score': numeric_score[found],
+        }, index=numeric['item_id'].to_numpy()[found])
+
+        positions = pd.Index(items['item_id'])
+        rows = positions.get_indexer(numeric_best.index)
+        items.iloc[rows, items.columns.get_loc('best_key')] = numeric_best['best_key'].to_numpy()
+        items.iloc[rows, items.columns.get_loc('best_score')] = numeric_best['best_score'].to_numpy()
+
+        # Б. Нечеткое сравнение (token_set_ratio) для остальных позиций с дозировкой, по группам МНН
+        fuzzy_mask = has_dosage.copy()
+        fuzzy_mask[rows] = False
+        fuzzy = items[fuzzy_mask]
+        for mnn, group in fuzzy.groupby('mnn', sort=False):
+            choices = [dosage for dosage in self.register_index.dosages_for_mnn(mnn) if dosage != NO_DOSAGE]
+            if not choices:
+                continue
+            scores = process.cdist(group['dosage_standardized'].tolist(), choices,
+                                   scorer=fuzz.token_set_ratio, dtype=np.float64, workers=workers)
+            best = scores.argmax(axis=1)
+            best_score = scores[np.arange(len(best)), best]
+            # Дозировка выбирается только при score > 0 (как в построчном цикле)
+            keys = np.array([parse_dosage(choices[i]).key for i in best], dtype=object)
+            group_rows = positions.get_indexer(group['item_id'])
+            keep = best_score > 0
+            items.iloc[group_rows[keep], items.columns.get_loc('best_key')] = keys[keep]
+            items.iloc[group_rows[keep], items.columns.get_loc('best_score')] = best_score[keep]
+
+        return items
+
+
+def _ratio_scores(values, candidates):
+    """Векторный dosage_model.dosage_ratio_score (NaN-кандидат дает NaN)."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = 100.0 * np.minimum(values, candidates) / np.maximum(values, candidates)
+    return np.where(values == candidates, 100.0, np.where((values <= 0) | (candidates <= 0), 0.0, ratio))